@@ -0,0 +1,370 @@
+"""
+Benchmark the text-processing hot paths against recorded baselines.
+
+Runs chunking, index building, retrieval, quiz parsing and vector similarity on
+synthetic corpora from 10 KB to 100 MB. Everything runs offline: the Gemini SDK
+is replaced by the offline provider with zero latency, so the timings only cover
+this project's own code. Each result is the median of several samples and is
+compared with benchmarks/baselines.json, scaled by a calibration workload that
+is re-timed around every benchmark so it tracks the machine's load during the
+run. A benchmark regresses when it is slower than its baseline by more than the
+tolerance and by more than its own noise (a multiple of the spread of its
+samples); a regressed benchmark is re-timed and the run fails only if it
+regresses every time.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--max-size 100MB] [--filter chunk]
+                                        [--tolerance 0.5] [--update-baselines]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, "..", "src")
+BASELINES_PATH = os.path.join(BENCH_DIR, "baselines.json")
+sys.path.insert(0, SRC_DIR)
+# Model calls are stubbed, so the gateway's rate limit would only add sleeps
+os.environ["LYRA_LLM_RATE_PER_MINUTE"] = "0"
+
+CORPUS_SIZES = {"10KB": 10_000, "100KB": 100_000, "1MB": 1_000_000, "10MB": 10_000_000, "100MB": 100_000_000}
+RETRIEVAL_BACKENDS = ("tfidf", "bm25", "lsa")
+RETRIEVAL_TOP_K = (1, 3, 10)
+RETRIEVAL_QUERIES = 50
+QUIZ_SIZES = (100, 1_000, 10_000)
+SIMILARITY_DIMENSIONS = (384, 4096)
+SIMILARITY_CALLS = 10_000
+SEED = 1234
+
+# Shortest sample worth timing; faster calls are repeated within one sample
+MIN_SAMPLE_SECONDS = 0.05
+
+# Samples of the calibration workload taken after each benchmark; their median is
+# the machine's speed at that point of the run
+CALIBRATION_SAMPLES = 7
+
+# A slowdown must exceed this many spreads (median absolute deviations of the
+# samples) of the baseline or of the new result, and at least NOISE_FLOOR_SECONDS
+NOISE_SPREADS = 3
+NOISE_FLOOR_SECONDS = 0.0001
+
+# Times a regressed benchmark is re-timed before the run fails
+RETIMES = 2
+
+# Samples per benchmark shrink as inputs grow so a full run stays within minutes
+def repeats_for(num_bytes):
+    if num_bytes <= 1_000_000:
+        return 7
+    if num_bytes <= 10_000_000:
+        return 3
+    return 1
+
+# ===============================
+# Offline Gemini stub
+# ===============================
+def stub_gemini():
+    """Serve every model call from the offline provider, with no simulated latency."""
+    from llm_providers import OfflineProvider, set_provider
+    set_provider(OfflineProvider(latency="fixed:0", token_latency="fixed:0", seed=SEED))
+
+# ===============================
+# Synthetic inputs
+# ===============================
+def make_vocabulary(rng, size=20_000):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(3, 11))))
+    return sorted(words)
+
+def make_corpus(num_bytes, seed=SEED):
+    """
+    Deterministic course-like text of about `num_bytes` characters: Zipf-distributed
+    words in sentences of 8-25 words, in paragraphs of 3-8 sentences.
+    """
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng)
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    paragraphs = []
+    size = 0
+    while size < num_bytes:
+        sentences = []
+        for _ in range(rng.randint(3, 8)):
+            words = rng.choices(vocabulary, weights, k=rng.randint(8, 25))
+            sentences.append(" ".join(words).capitalize() + ".")
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)[:num_bytes]
+
+def make_queries(count, seed=SEED):
+    rng = random.Random(seed + 1)
+    vocabulary = make_vocabulary(random.Random(seed))[:2_000]
+    return ["what is " + " ".join(rng.sample(vocabulary, rng.randint(2, 6))) for _ in range(count)]
+
+def make_quiz_text(num_questions, seed=SEED):
+    """Model-style quiz output in the format parse_quiz_questions expects."""
+    rng = random.Random(seed + num_questions)
+    blocks = []
+    for i in range(num_questions):
+        blocks.append("\n".join([
+            f"QUESTION: Which statement about concept {i} is correct?",
+            *(f"{letter}) Option {letter.lower()} for concept {i}" for letter in "ABCD"),
+            f"CORRECT: {rng.choice('ABCD')}",
+            f"EXPLANATION: Concept {i} is explained in section {rng.randint(1, 40)} of the material.",
+            "---"
+        ]))
+    return "\n".join(blocks)
+
+# ===============================
+# Benchmarks
+# ===============================
+def timed(fn, repeats, per=1):
+    """
+    Return (median, spread) of the wall time of fn, in seconds, over `repeats` samples,
+    divided by `per` for benchmarks reported per call. The spread is the median
+    absolute deviation of the samples.
+    The first call is a warm-up (and the only sample, with no spread, when repeats is 1);
+    calls faster than MIN_SAMPLE_SECONDS are looped within each sample so timer
+    resolution and noise don't dominate. The median, unlike the best sample, is as
+    likely to be reproduced by the next run as the baseline was.
+    """
+    start = time.perf_counter()
+    fn()
+    first = time.perf_counter() - start
+    if repeats == 1:
+        return first / per, 0.0
+    
+    loops = max(1, int(MIN_SAMPLE_SECONDS / max(first, 1e-9)))
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - start) / loops / per)
+    median = statistics.median(samples)
+    return median, statistics.median(abs(sample - median) for sample in samples)
+
+# Suites yield (name, measure) pairs; measure() times the benchmark and may be called
+# again to re-time it before the suite moves on
+def corpus_benchmarks(max_bytes, wanted):
+    from utils import chunk_text, chunk_by_sentences
+    from vector_store import create_vector_store, retrieve_relevant_chunks
+    
+    queries = make_queries(RETRIEVAL_QUERIES)
+    for label, num_bytes in CORPUS_SIZES.items():
+        names = [f"chunk_text[{label}]", f"chunk_by_sentences[{label}]"]
+        for backend in RETRIEVAL_BACKENDS:
+            names.append(f"create_vector_store[{backend},{label}]")
+            names += [f"retrieve_relevant_chunks[{backend},{label},top_k={top_k}]" for top_k in RETRIEVAL_TOP_K]
+        if num_bytes > max_bytes or not wanted(*names):
+            continue
+        text = make_corpus(num_bytes)
+        repeats = repeats_for(num_bytes)
+        
+        if wanted(f"chunk_text[{label}]"):
+            yield f"chunk_text[{label}]", lambda: timed(lambda: chunk_text(text), repeats)
+        if wanted(f"chunk_by_sentences[{label}]"):
+            yield f"chunk_by_sentences[{label}]", lambda: timed(lambda: chunk_by_sentences(text), repeats)
+        
+        chunks = chunk_text(text)
+        for backend in RETRIEVAL_BACKENDS:
+            name = f"create_vector_store[{backend},{label}]"
+            if wanted(name):
+                yield name, lambda: timed(lambda: create_vector_store(chunks, backend), repeats)
+            
+            names = {top_k: f"retrieve_relevant_chunks[{backend},{label},top_k={top_k}]" for top_k in RETRIEVAL_TOP_K}
+            if not wanted(*names.values()):
+                continue
+            store = create_vector_store(chunks, backend)
+            for top_k, name in names.items():
+                if not wanted(name):
+                    continue
+                def run_queries():
+                    for query in queries:
+                        retrieve_relevant_chunks(query, *store, top_k=top_k)
+                # Reported per query
+                yield name, lambda: timed(run_queries, repeats, per=len(queries))
+            del store
+
+def quiz_benchmarks(wanted):
+    from quiz import OPTION_LETTERS, QuizStreamParser, generate_practice_questions, grade_answers, parse_quiz_questions
+    
+    def parse_streamed(text):
+        # Deltas about the size the model streams
+        parser = QuizStreamParser()
+        for start in range(0, len(text), 64):
+            parser.feed(text[start:start + 64])
+        parser.close()
+    
+    for num_questions in QUIZ_SIZES:
+        name = f"parse_quiz_questions[{num_questions}]"
+        if wanted(name):
+            text = make_quiz_text(num_questions)
+            yield name, lambda: timed(lambda: parse_quiz_questions(text), 7)
+        name = f"QuizStreamParser[{num_questions}]"
+        if wanted(name):
+            text = make_quiz_text(num_questions)
+            yield name, lambda: timed(lambda: parse_streamed(text), 7)
+        name = f"grade_answers[{num_questions}]"
+        if wanted(name):
+            questions = parse_quiz_questions(make_quiz_text(num_questions))
+            selected = [OPTION_LETTERS[i % 4] for i in range(len(questions))]
+            yield name, lambda: timed(lambda: grade_answers(questions, selected), 7)
+    
+    if wanted("generate_practice_questions[stubbed]"):
+        context = make_corpus(1_500)
+        yield "generate_practice_questions[stubbed]", lambda: timed(
+            lambda: generate_practice_questions(context, "Benchmark", use_cache=False), 7
+        )
+
+def similarity_benchmarks(wanted):
+    import numpy as np
+    from utils import calculate_similarity
+    
+    rng = np.random.default_rng(SEED)
+    for dimension in SIMILARITY_DIMENSIONS:
+        name = f"calculate_similarity[{dimension}]"
+        if not wanted(name):
+            continue
+        a = rng.standard_normal(dimension)
+        b = rng.standard_normal(dimension)
+        def run_calls():
+            for _ in range(SIMILARITY_CALLS):
+                calculate_similarity(a, b)
+        # Reported per call
+        yield name, lambda: timed(run_calls, 5, per=SIMILARITY_CALLS)
+
+# ===============================
+# Baselines
+# ===============================
+def calibration_workload():
+    """
+    Return a fixed mixed workload (sorting, regex, JSON, numpy) whose time measures
+    machine speed. Comparisons are scaled by it, so a uniformly slower machine or a
+    busy host is not reported as a regression.
+    """
+    import re
+    import numpy as np
+    
+    rng = random.Random(SEED)
+    values = [rng.random() for _ in range(50_000)]
+    text = make_corpus(200_000)
+    matrix = np.random.default_rng(SEED).standard_normal((300, 300))
+    
+    def workload():
+        sorted(values)
+        len(re.findall(r"[.!?]\s", text))
+        json.loads(json.dumps(values[:10_000]))
+        matrix @ matrix
+    return workload
+
+def load_baselines():
+    """Return (results, spreads, calibration seconds); empty results when none are recorded."""
+    if not os.path.exists(BASELINES_PATH):
+        return {}, {}, None
+    with open(BASELINES_PATH, 'r', encoding='utf-8') as f:
+        record = json.load(f)
+    return record["results"], record.get("spreads", {}), record.get("calibration")
+
+def save_baselines(results):
+    """
+    Record `results`, a mapping of name to (seconds, spread, calibration seconds
+    around that benchmark), on the baselines' calibration.
+    """
+    previous, previous_spreads, calibration = load_baselines()
+    if not previous or not calibration:
+        calibration = statistics.median(local for _, _, local in results.values())
+    # Express every result on one calibration so older entries stay valid
+    for name, (seconds, spread, local) in results.items():
+        previous[name] = seconds * calibration / local
+        previous_spreads[name] = spread * calibration / local
+    record = {
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "recorded": time.strftime("%Y-%m-%d"),
+        "calibration": calibration,
+        "results": dict(sorted(previous.items())),
+        "spreads": dict(sorted(previous_spreads.items()))
+    }
+    with open(BASELINES_PATH, 'w', encoding='utf-8') as f:
+        json.dump(record, f, indent=2)
+        f.write("\n")
+
+def parse_size(label):
+    if label.upper() not in CORPUS_SIZES:
+        raise argparse.ArgumentTypeError(f"size must be one of {', '.join(CORPUS_SIZES)}")
+    return CORPUS_SIZES[label.upper()]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-size", type=parse_size, default=CORPUS_SIZES["100MB"],
+                        help="Largest synthetic corpus to benchmark (10KB .. 100MB)")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="Allowed slowdown over the baseline, as a fraction (0.5 = 50%%)")
+    parser.add_argument("--update-baselines", action="store_true", help="Record these results as the new baselines")
+    args = parser.parse_args()
+    
+    stub_gemini()
+    baselines, spreads, baseline_calibration = load_baselines()
+    workload = calibration_workload()
+    calibration, _ = timed(workload, CALIBRATION_SAMPLES)
+    speed = calibration / baseline_calibration if baseline_calibration else 1.0
+    print(f"Calibration: {calibration * 1000:.2f} ms ({speed:.2f}x the baseline machine)")
+    results = {}
+    regressions = []
+    
+    def compare(name, seconds, spread, local):
+        """Return (verdict, regressed) for one result timed at calibration `local`."""
+        baseline = baselines.get(name)
+        if baseline is None:
+            return "no baseline", False
+        scale = local / baseline_calibration if baseline_calibration else 1.0
+        expected = baseline * scale
+        ratio = seconds / expected
+        noise = max(NOISE_FLOOR_SECONDS, NOISE_SPREADS * max(spreads.get(name, 0.0) * scale, spread))
+        return f"{ratio:.2f}x baseline", ratio > 1 + args.tolerance and seconds - expected > noise
+    
+    # Suites only build the inputs the filter asks for
+    def wanted(*names):
+        return any(args.filter in name for name in names)
+    
+    suites = [corpus_benchmarks(args.max_size, wanted), quiz_benchmarks(wanted), similarity_benchmarks(wanted)]
+    for suite in suites:
+        for name, measure in suite:
+            retimes = 0
+            while True:
+                seconds, spread = measure()
+                # Machine speed while this benchmark ran: calibrations before and after it
+                after, _ = timed(workload, CALIBRATION_SAMPLES)
+                local = (calibration + after) / 2
+                calibration = after
+                verdict, regressed = compare(name, seconds, spread, local)
+                if not regressed or args.update_baselines or retimes == RETIMES:
+                    break
+                retimes += 1
+            results[name] = (seconds, spread, local)
+            if retimes:
+                verdict += f" (timed {retimes + 1}x)"
+            if regressed:
+                verdict += "  REGRESSION"
+                regressions.append(name)
+            print(f"{name:<55} {seconds * 1000:12.3f} ms   {verdict}", flush=True)
+    
+    if args.update_baselines:
+        save_baselines(results)
+        print(f"Baselines updated: {BASELINES_PATH}")
+        return 0
+    if regressions:
+        print(f"FAIL: {len(regressions)} benchmark(s) slower than baseline by more than {args.tolerance:.0%}")
+        return 1
+    print("OK")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+Check the import cost of the landing page against a time budget.
+
+Imports every module app.py imports at the top level in a fresh interpreter,
+after Streamlit itself, and fails if that takes longer than the budget or pulls
+in a dependency that should only load on first use.
+
+Usage:
+    python scripts/check_import_budget.py [--budget-ms 150] [--runs 5]
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+# Heavy dependencies that must be deferred to first use
+DEFERRED_MODULES = ["numpy", "scipy", "sklearn", "google.generativeai"]
+
+PROBE = """
+import json, sys, time
+import streamlit  # Framework cost is not counted against the budget
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({{
+    "ms": elapsed_ms,
+    "loaded": [name for name in {deferred!r} if name in sys.modules],
+}}))
+"""
+
+def landing_page_imports():
+    """Return the modules app.py imports at module level, in order."""
+    with open(os.path.join(SRC_DIR, "app.py"), 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+    return [name for name in dict.fromkeys(modules) if name.split('.')[0] != "streamlit"]
+
+def measure(modules):
+    probe = PROBE.format(modules=modules, deferred=DEFERRED_MODULES)
+    output = subprocess.run(
+        [sys.executable, "-c", probe],
+        cwd=SRC_DIR, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=150.0)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    
+    modules = landing_page_imports()
+    results = [measure(modules) for _ in range(args.runs)]
+    best_ms = min(result["ms"] for result in results)
+    loaded = sorted({name for result in results for name in result["loaded"]})
+    
+    print(f"Landing page imports: {', '.join(modules)}")
+    print(f"Import time (best of {args.runs}): {best_ms:.1f} ms, budget {args.budget_ms:.0f} ms")
+    failed = False
+    if loaded:
+        print(f"FAIL: deferred dependencies imported at startup: {', '.join(loaded)}")
+        failed = True
+    if best_ms > args.budget_ms:
+        print("FAIL: import time over budget")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Compare the LSA retrieval backend against exact TF-IDF in recall, latency and memory.
+
+Builds a TF-IDF index and an LSA index per requested dimension over the same chunks,
+either from course material files or from a synthetic corpus with topical structure,
+then runs known-item queries: a few words sampled from one chunk, which should come
+back in the top k. Reports for each index:
+  recall@k      share of queries whose source chunk is in the top k
+  overlap@k     share of the exact TF-IDF top k that the index also returns
+  p50/p90 ms    single-query latency through retrieve_relevant_chunks
+  batch us/q    per-query time when all queries are scored with one retrieve_batch call
+  index MB      estimated resident size (see index_cache.estimate_index_bytes)
+
+Usage:
+    python scripts/compare_retrieval.py [--dimensions 64,128,256] [--top-k 5]
+                                        [--corpus-kb 2000 | --files notes1.txt notes2.txt]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+def make_corpus(num_bytes, rng, num_topics=40, topic_words=60):
+    """Text where each paragraph mostly draws from one topic's vocabulary."""
+    def word():
+        return "".join(rng.choice("bcdfghjklmnprstvz") + rng.choice("aeiou") for _ in range(rng.randint(2, 4)))
+    common = [word() for _ in range(300)]
+    topics = [[word() for _ in range(topic_words)] for _ in range(num_topics)]
+    paragraphs = []
+    size = 0
+    while size < num_bytes:
+        topic = rng.choice(topics)
+        sentences = []
+        for _ in range(rng.randint(3, 6)):
+            words = rng.choices(topic, k=rng.randint(4, 9)) + rng.choices(common, k=rng.randint(2, 6))
+            rng.shuffle(words)
+            sentences.append(" ".join(words).capitalize() + ".")
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+def make_queries(chunks, count, rng, words_per_query=(3, 6)):
+    """Known-item queries: (source chunk index, a few words of that chunk)."""
+    queries = []
+    while len(queries) < count:
+        i = rng.randrange(len(chunks))
+        words = [w.strip(".,;:!?\"'()").lower() for w in chunks[i].split()]
+        words = [w for w in words if len(w) > 3]
+        if len(words) >= words_per_query[0]:
+            queries.append((i, " ".join(rng.sample(words, min(len(words), rng.randint(*words_per_query))))))
+    return queries
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def evaluate(name, store, queries, top_k, exact_top):
+    from index_cache import CorpusIndex, estimate_index_bytes
+    from vector_store import retrieve_batch, retrieve_relevant_chunks
+    
+    embeddings, vectorizer, chunks = store
+    texts = [query for _, query in queries]
+    
+    latencies = []
+    for query in texts:
+        start = time.perf_counter()
+        retrieve_relevant_chunks(query, embeddings, vectorizer, chunks, top_k=top_k)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    
+    start = time.perf_counter()
+    idxs, _ = retrieve_batch(texts, embeddings, vectorizer, top_k)
+    batch_seconds = time.perf_counter() - start
+    
+    hits = sum(source in row for (source, _), row in zip(queries, idxs.tolist()))
+    overlap = sum(len(set(row) & exact) for row, exact in zip(idxs.tolist(), exact_top))
+    return {
+        'index': name,
+        f'recall@{top_k}': hits / len(queries),
+        f'overlap@{top_k}': overlap / max(sum(len(exact) for exact in exact_top), 1),
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p90_ms': percentile(latencies, 0.90) * 1000,
+        'batch_us_per_query': batch_seconds / len(queries) * 1e6,
+        'index_mb': estimate_index_bytes(CorpusIndex(*store)) / 1e6
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dimensions", default="64,128,256", help="Comma-separated LSA dimensions to compare")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--corpus-kb", type=int, default=2000, help="Size of the synthetic corpus")
+    parser.add_argument("--files", nargs="*", help="Course material files to use instead of a synthetic corpus")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+    
+    from ingest import chunk_files
+    from lsa_index import build_lsa_index
+    from vector_store import create_vector_store, retrieve_batch
+    
+    rng = random.Random(args.seed)
+    if args.files:
+        data = []
+        for path in args.files:
+            with open(path, 'rb') as f:
+                data.append(f.read())
+    else:
+        data = [make_corpus(args.corpus_kb * 1024, rng).encode("utf-8")]
+    chunks = [chunk for file_chunks in chunk_files(data) for chunk in file_chunks]
+    queries = make_queries(chunks, args.queries, rng)
+    
+    build_times = {}
+    start = time.perf_counter()
+    exact = create_vector_store(chunks, "tfidf")
+    build_times['tfidf'] = time.perf_counter() - start
+    exact_idxs, _ = retrieve_batch([query for _, query in queries], exact[0], exact[1], args.top_k)
+    exact_top = [set(row) for row in exact_idxs.tolist()]
+    
+    stores = [('tfidf', exact)]
+    for dimensions in (int(d) for d in args.dimensions.split(",")):
+        name = f"lsa-{dimensions}"
+        start = time.perf_counter()
+        embeddings, vectorizer = build_lsa_index(chunks, dimensions)
+        build_times[name] = time.perf_counter() - start
+        stores.append((name, (embeddings, vectorizer, chunks)))
+    
+    rows = []
+    for name, store in stores:
+        row = evaluate(name, store, queries, args.top_k, exact_top)
+        row['build_s'] = build_times[name]
+        rows.append(row)
+    
+    if args.json:
+        print(json.dumps({'chunks': len(chunks), 'queries': len(queries), 'results': rows}, indent=2))
+        return 0
+    
+    k = args.top_k
+    print(f"{len(chunks)} chunks, {len(queries)} known-item queries, top_k={k}")
+    print(f"{'index':<10}{'recall@' + str(k):>10}{'overlap@' + str(k):>11}{'p50 ms':>9}{'p90 ms':>9}"
+          f"{'batch us/q':>12}{'index MB':>10}{'build s':>9}")
+    for row in rows:
+        print(
+            f"{row['index']:<10}{row[f'recall@{k}']:>10.3f}{row[f'overlap@{k}']:>11.3f}{row['p50_ms']:>9.3f}"
+            f"{row['p90_ms']:>9.3f}{row['batch_us_per_query']:>12.1f}{row['index_mb']:>10.2f}{row['build_s']:>9.2f}"
+        )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
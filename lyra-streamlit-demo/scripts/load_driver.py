@@ -0,0 +1,216 @@
+"""
+Simulate concurrent student sessions against the app's backend, offline.
+
+Each simulated session repeatedly runs the Q&A flow (retrieval, profile update,
+streamed answer, batched background gap analysis), the practice quiz flow and the
+Pre-Assessment flow through the same functions app.py calls, with model calls
+served by the offline provider and its simulated latency. Reports throughput and
+latency percentiles per flow.
+
+Usage:
+    python scripts/load_driver.py [--sessions 20] [--rounds 3] [--corpus-kb 500]
+                                  [--latency lognormal:800:0.5] [--token-latency fixed:30]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+TOPICS = ["photosynthesis", "cell division", "enzymes", "genetics", "evolution", "ecosystems", "respiration", "proteins"]
+QUESTION_TEMPLATES = ["What is {}?", "How does {} work?", "Why is {} important?", "Explain the role of {} in the course."]
+
+def make_corpus(num_bytes, rng):
+    """Course-like text mentioning every topic, about `num_bytes` long."""
+    filler = ["process", "energy", "structure", "function", "system", "example", "stage", "molecule", "cycle", "model"]
+    paragraphs = []
+    size = 0
+    while size < num_bytes:
+        sentences = []
+        for _ in range(rng.randint(3, 6)):
+            words = [rng.choice(TOPICS)] + rng.choices(filler, k=rng.randint(6, 14))
+            rng.shuffle(words)
+            sentences.append(" ".join(words).capitalize() + ".")
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs).encode("utf-8")
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+class Recorder:
+    """Thread-safe collection of per-flow latencies and errors."""
+    
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+    
+    def timed(self, flow, fn):
+        start = time.perf_counter()
+        try:
+            return fn()
+        except Exception as e:
+            with self._lock:
+                self.errors.setdefault(flow, []).append(repr(e))
+        finally:
+            with self._lock:
+                self.latencies.setdefault(flow, []).append(time.perf_counter() - start)
+    
+    def record(self, flow, seconds):
+        with self._lock:
+            self.latencies.setdefault(flow, []).append(seconds)
+
+def run_session(session_id, index, args, recorder):
+    from gap_queue import get_gap_queue, queue_gap_analysis, student_key
+    from lyra_ai import analyze_learning_patterns, collect_knowledge_gaps, stream_personalized_answer
+    from config import CONTEXT_TOKEN_BUDGETS
+    from context_packer import build_context, pack_context, retrieve_hits
+    from profile_store import new_profile
+    from quiz import generate_practice_questions, grade_answers, update_progress_tracking
+    
+    rng = random.Random(args.seed + session_id)
+    profile = new_profile()
+    pending_gaps = []
+    
+    def qa_turn():
+        query = rng.choice(QUESTION_TEMPLATES).format(rng.choice(TOPICS))
+        start = time.perf_counter()
+        hits = retrieve_hits(query, index, 3)
+        context = pack_context(index, hits, CONTEXT_TOKEN_BUDGETS['answer'])
+        snapshot = dict(profile, knowledge_gaps=profile['knowledge_gaps'][-3:])
+        analyze_learning_patterns(query, profile=profile)
+        parts = []
+        for delta in stream_personalized_answer(context, query, snapshot):
+            if not parts:
+                recorder.record("qa_first_token", time.perf_counter() - start)
+            parts.append(delta)
+        # Gap analysis is batched across turns; the app merges finished analyses on later reruns
+        pending_gaps.append(queue_gap_analysis(
+            profile, pack_context(index, hits, CONTEXT_TOKEN_BUDGETS['gaps']), query, "".join(parts)
+        ))
+        collect_knowledge_gaps(pending_gaps, profile)
+    
+    def quiz(num_questions, top_k):
+        topic = rng.choice(TOPICS)
+        questions = generate_practice_questions(build_context(topic, index, 'quiz', top_k), topic, num_questions, use_cache=False)
+        if not questions:
+            raise RuntimeError("no questions generated")
+        results = grade_answers(questions, [rng.choice("ABCD") for _ in questions])
+        update_progress_tracking(topic, results['percentage'], profile)
+    
+    for _ in range(args.rounds):
+        for _ in range(args.qa_turns):
+            recorder.timed("qa", qa_turn)
+        recorder.timed("quiz", lambda: quiz(5, 5))
+        recorder.timed("assessment", lambda: quiz(10, 7))
+        time.sleep(rng.uniform(0, args.think_time))
+    
+    def finish_gaps():
+        # Turns still waiting for their batch are analyzed when the student leaves
+        get_gap_queue().flush(student_key(profile))
+        collect_knowledge_gaps(pending_gaps, profile, timeout=30)
+        if pending_gaps:
+            raise RuntimeError(f"{len(pending_gaps)} gap analyses unfinished")
+    
+    recorder.timed("gap_flush", finish_gaps)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20, help="Concurrent simulated students")
+    parser.add_argument("--rounds", type=int, default=3, help="Q&A/quiz/assessment rounds per session")
+    parser.add_argument("--qa-turns", type=int, default=3, help="Q&A turns per round")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Max pause between rounds, in seconds")
+    parser.add_argument("--corpus-kb", type=int, default=500, help="Size of the synthetic course material")
+    parser.add_argument("--latency", default="lognormal:800:0.5", help="Offline model latency (see config.py)")
+    parser.add_argument("--token-latency", default="fixed:30", help="Offline latency per streamed delta")
+    parser.add_argument("--error-percent", type=int, default=0, help="Offline calls failing with a simulated 429")
+    parser.add_argument("--rate-per-minute", type=int, default=0, help="Gateway rate limit (0 = unlimited)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+    
+    # Settings must be in place before the app modules read config.py
+    with tempfile.TemporaryDirectory(prefix="lyra-load-") as workdir:
+        os.environ["LYRA_PROFILE_DB"] = os.path.join(workdir, "profiles.sqlite3")
+        os.environ["LYRA_LLM_PROVIDER"] = "offline"
+        os.environ["LYRA_LLM_OFFLINE_LATENCY"] = args.latency
+        os.environ["LYRA_LLM_OFFLINE_TOKEN_LATENCY"] = args.token_latency
+        os.environ["LYRA_LLM_OFFLINE_ERROR_PERCENT"] = str(args.error_percent)
+        os.environ["LYRA_LLM_RATE_PER_MINUTE"] = str(args.rate_per_minute)
+        sys.path.insert(0, SRC_DIR)
+        return run_load(args)
+
+def run_load(args):
+    """Build the shared index, run the sessions and print the report; returns the exit code"""
+    from config import RETRIEVAL_BACKEND
+    from context_packer import ChunkSources
+    from index_cache import CorpusIndex, content_digest, corpus_key, get_index_cache
+    from ingest import chunk_files
+    from vector_store import create_vector_store
+    
+    def build_index(data):
+        chunks, spans = chunk_files([data], with_spans=True)[0]
+        return CorpusIndex(*create_vector_store(chunks, backend=RETRIEVAL_BACKEND), ChunkSources.from_files([spans]))
+    
+    data = make_corpus(args.corpus_kb * 1024, random.Random(args.seed))
+    build_start = time.perf_counter()
+    lease = get_index_cache().lease(
+        corpus_key([content_digest(data)], RETRIEVAL_BACKEND),
+        lambda: build_index(data)
+    )
+    build_seconds = time.perf_counter() - build_start
+    
+    recorder = Recorder()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+        futures = [pool.submit(run_session, i, lease.value, args, recorder) for i in range(args.sessions)]
+        for future in futures:
+            future.result()
+    wall = time.perf_counter() - start
+    lease.release()
+    
+    report = {
+        'sessions': args.sessions,
+        'wall_seconds': wall,
+        'index_build_seconds': build_seconds,
+        'flows': {}
+    }
+    for flow, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        report['flows'][flow] = {
+            'count': len(values),
+            'errors': len(recorder.errors.get(flow, [])),
+            'throughput_per_s': len(values) / wall,
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p90_ms': percentile(values, 0.90) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+            'max_ms': values[-1] * 1000
+        }
+    
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{args.sessions} sessions, {wall:.1f} s wall time (index built in {build_seconds:.2f} s)")
+        print(f"{'flow':<16}{'count':>7}{'errors':>8}{'per s':>9}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for flow, stats in report['flows'].items():
+            print(
+                f"{flow:<16}{stats['count']:>7}{stats['errors']:>8}{stats['throughput_per_s']:>9.2f}"
+                f"{stats['p50_ms']:>10.0f}{stats['p90_ms']:>10.0f}{stats['p99_ms']:>10.0f}{stats['max_ms']:>10.0f}"
+            )
+        for flow, errors in recorder.errors.items():
+            print(f"{flow} errors, first: {errors[0]}")
+    return 1 if recorder.errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
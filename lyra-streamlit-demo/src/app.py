@@ -1,35 +1,64 @@
 import streamlit as st
-from datetime import datetime
-import time
+import os
+import threading
+from datetime import datetime, timedelta
 from lyra_ai import (
-    generate_personalized_answer, 
+    stream_personalized_answer, 
     analyze_learning_patterns, 
-    identify_knowledge_gaps
+    collect_knowledge_gaps
 )
-from vector_store import create_vector_store, retrieve_relevant_chunks
+from gap_queue import queue_gap_analysis
+from vector_store import create_vector_store, save_index, load_index, load_chunk_sources
+from ingest import IngestError, check_upload_limits, chunk_files, run_with_progress, spooled_uploads
 from quiz import (
-    generate_practice_questions, 
-    provide_exam_feedback, 
-    update_progress_tracking,
-    parse_quiz_questions
+    QuizGeneration, 
+    grade_answers,
+    update_progress_tracking
 )
-from utils import chunk_text
+from index_cache import CorpusIndex, content_digest, corpus_key, get_index_cache
+from config import CONTEXT_TOKEN_BUDGETS, INDEX_DIR, RETRIEVAL_BACKEND
+from warmup import start_background_warmup
+from metrics import export_prometheus, get_metrics, increment, span
+from profile_store import (
+    append_bounded,
+    get_profile_store,
+    load_conversations,
+    load_profile,
+    new_profile,
+    record_event
+)
+from progress_aggregates import recent_gaps, recent_topic_scores
+from context_packer import ChunkSources, build_context, pack_context, retrieve_hits
+from quiz_pool import get_question_pool, prefetch_quiz_topics, question_fingerprint
+from utils import generate_random_id
+
+# Most recent quiz attempts listed per topic in Progress Review
+PROGRESS_ATTEMPTS_SHOWN = 20
+
+# Graded quiz and assessment results kept per session
+RESULTS_KEPT = 10
 
 # ===============================
 # Session State Initialization
 # ===============================
 if 'student_profile' not in st.session_state:
-    st.session_state.student_profile = {
-        'knowledge_gaps': [],
-        'strong_topics': [],
-        'interaction_count': 0,
-        'learning_pace': 'moderate',
-        'study_history': [],
-        'exam_scores': {}
-    }
+    # The profile ID in the URL lets a refreshed page pick up the stored profile
+    profile_id = st.query_params.get("profile")
+    profile = load_profile(profile_id) if profile_id else None
+    if profile is None:
+        profile = new_profile()
+        st.query_params["profile"] = profile['profile_id']
+    st.session_state.student_profile = profile
 
 if 'conversation_history' not in st.session_state:
-    st.session_state.conversation_history = []
+    st.session_state.conversation_history = load_conversations(st.session_state.student_profile['profile_id'])
+
+if 'pending_gap_analyses' not in st.session_state:
+    st.session_state.pending_gap_analyses = []
+    st.session_state.gap_jobs = {}
+
+# Merge background gap analyses that finished since the last run
+collect_knowledge_gaps(st.session_state.pending_gap_analyses, st.session_state.student_profile)
 
 if 'current_mode' not in st.session_state:
     st.session_state.current_mode = 'Q&A'
@@ -37,15 +66,37 @@ if 'current_mode' not in st.session_state:
 if 'quiz_active' not in st.session_state:
     st.session_state.quiz_active = False
     st.session_state.quiz_questions = []
-    st.session_state.quiz_score = 0
     st.session_state.current_question_idx = 0
+    st.session_state.quiz_id = None
+    st.session_state.quiz_feedback = None
+
+# Graded quizzes and assessments by ID; their results views are served from these
+if 'assessment_results' not in st.session_state:
+    st.session_state.assessment_results = {}
+
+# Background generation feeding quiz_questions, while it may still be adding to it
+if 'quiz_generation' not in st.session_state:
+    st.session_state.quiz_generation = None
+
+# Fingerprints of questions this student has been shown, so pooled ones are not repeated
+if 'seen_questions' not in st.session_state:
+    st.session_state.seen_questions = set()
 
 # Pre-assessment timer states
 if 'assessment_mode' not in st.session_state:
     st.session_state.assessment_mode = False
     st.session_state.assessment_start_time = None
     st.session_state.assessment_answers = {}
+    st.session_state.assessment_answer_times = {}
     st.session_state.assessment_submitted = False
+    st.session_state.assessment_id = None
+
+if 'file_digests' not in st.session_state:
+    st.session_state.file_digests = {}
+    st.session_state.index_lease = None
+    st.session_state.incremental_index = None
+    st.session_state.document_spans = {}
+    st.session_state.index_build_lock = threading.Lock()
 
 # ===============================
 # Helper Functions
@@ -60,22 +111,334 @@ def display_progress_dashboard():
     st.sidebar.metric("Study Sessions", profile['interaction_count'])
     st.sidebar.metric("Learning Pace", profile['learning_pace'].title())
     
-    if profile['exam_scores']:
+    aggregates = profile['aggregates']
+    
+    if aggregates['topics']:
         st.sidebar.write("**Recent Quiz Scores:**")
-        for topic, scores in list(profile['exam_scores'].items())[-3:]:
-            if scores:
-                latest_score = scores[-1]['score']
-                st.sidebar.write(f"• {topic}: {latest_score}%")
+        for topic, stats in reversed(recent_topic_scores(aggregates, 3)):
+            st.sidebar.write(f"• {topic}: {stats['latest']}%")
     
-    if profile['knowledge_gaps']:
+    if aggregates['gaps']:
         st.sidebar.write("**Focus Areas:**")
-        for gap in profile['knowledge_gaps'][-3:]:
+        for gap in reversed(recent_gaps(aggregates, 3)):
             st.sidebar.write(f"• {gap}")
 
+def display_metrics_panel():
+    """Show stage timings and counters in the sidebar when metrics are enabled (LYRA_METRICS=1)"""
+    registry = get_metrics()
+    if registry is None:
+        return
+    
+    with st.sidebar.expander("⏱️ Performance"):
+        snapshot = registry.snapshot()
+        if not snapshot['spans'] and not snapshot['counters']:
+            st.caption("Nothing measured yet.")
+            return
+        
+        if snapshot['spans']:
+            st.write("**Stage timings (ms):**")
+            st.dataframe(
+                [
+                    {'stage': name, 'last': round(stats['last_ms'], 1), 'mean': round(stats['mean_ms'], 1),
+                     'max': round(stats['max_ms'], 1), 'count': stats['count']}
+                    for name, stats in snapshot['spans'].items()
+                ],
+                hide_index=True
+            )
+            st.write("**Latest stages:**")
+            for record in snapshot['recent'][:8]:
+                st.caption(f"{record['span']}: {record['ms']:.1f} ms" + (" (failed)" if record['failed'] else ""))
+        
+        if snapshot['counters']:
+            st.write("**Counters:**")
+            for name, value in snapshot['counters'].items():
+                st.write(f"• {name}: {value:,}")
+        
+        st.download_button("Export JSON lines", registry.to_jsonl(), file_name="lyra-metrics.jsonl", mime="application/x-ndjson")
+        st.download_button("Export Prometheus", registry.to_prometheus(), file_name="lyra-metrics.prom", mime="text/plain")
+
+# Longest wait for the next question when the student gets ahead of generation
+QUESTION_WAIT_SECONDS = 60
+
+def start_quiz_generation(index, topic, num_questions, top_k, use_cache=True):
+    """
+    Start a quiz from prefetched questions in the pool, generating any missing ones in
+    the background, and wait only for its first question.
+    Returns the QuizGeneration, or None (after showing any error) if no question arrived.
+    """
+    corpus = st.session_state.index_lease.key
+    pooled = get_question_pool().take(corpus, topic, num_questions, seen=st.session_state.seen_questions)
+    increment("quiz_pool_hits", len(pooled))
+    context = ""
+    if len(pooled) < num_questions:
+        context = build_context(topic, index, 'quiz', top_k)
+    # A cached quiz for a topic the student retakes would repeat what they have seen
+    generation = QuizGeneration(
+        context, topic, num_questions, use_cache=use_cache, prefilled=pooled,
+        seen=frozenset(st.session_state.seen_questions)
+    )
+    # Refill the pool for this topic and the student's likely next ones
+    prefetch_quiz_topics(corpus, index, st.session_state.student_profile, extra_topics=[topic])
+    if generation.wait_for(1, timeout=QUESTION_WAIT_SECONDS):
+        st.session_state.quiz_generation = generation
+        st.session_state.quiz_questions = generation.questions
+        return generation
+    if generation.error is not None:
+        st.error(f"Error generating questions: {generation.error}")
+    return None
+
+def quiz_question_total():
+    """Questions in the current quiz, counting those still being generated"""
+    generation = st.session_state.quiz_generation
+    if generation is not None and generation.questions is st.session_state.quiz_questions:
+        return generation.total
+    return len(st.session_state.quiz_questions)
+
+@st.fragment(run_every=1)
+def render_question_stream(rendered_count):
+    """Placeholder for questions still being generated; reruns the page as they arrive"""
+    generation = st.session_state.quiz_generation
+    if generation is None:
+        return
+    if len(generation.questions) > rendered_count or generation.done:
+        st.rerun()
+    st.info(f"⏳ Generating question {rendered_count + 1} of {generation.total}...")
+
+def render_review_topics(gap_job):
+    """Suggested review topics for a Q&A turn, once its batched gap analysis finishes"""
+    if not gap_job.done():
+        wait_for_review_topics(gap_job)
+        return
+    gaps = gap_job.result() if gap_job.exception() is None else []
+    
+    # Show related topics
+    if gaps:
+        with st.expander("💡 Suggested Review Topics"):
+            for gap in gaps:
+                st.write(f"• {gap}")
+
+@st.fragment(run_every=1)
+def wait_for_review_topics(gap_job):
+    """Placeholder while the turn's gap analysis is queued; reruns the page once when it finishes"""
+    if gap_job.done():
+        # The full run merges the gaps into the profile and shows them without this fragment
+        st.rerun()
+    st.caption("🔎 Suggested review topics will appear here once this question has been analyzed.")
+
+def record_results(results_id, topic, questions, selected):
+    """
+    Grade a finished quiz or assessment and record its score in the profile, once.
+    Later calls with the same ID (reruns, or the timer and the submit button both
+    closing an assessment) return the stored results record.
+    """
+    stored = st.session_state.assessment_results
+    if results_id in stored:
+        return stored[results_id]
+    with span("quiz.grade"):
+        results = grade_answers(questions, selected)
+    results['topic'] = topic
+    update_progress_tracking(topic, results['percentage'])
+    stored[results_id] = results
+    while len(stored) > RESULTS_KEPT:
+        del stored[next(iter(stored))]
+    return results
+
+def show_score_once(results):
+    """Celebrate a result the first time it is shown, not on every rerun"""
+    if not results.get('shown'):
+        results['shown'] = True
+        st.balloons()
+
+# Answers changed this long after the deadline are discarded at submit time
+ASSESSMENT_GRACE_SECONDS = 2
+
+def assessment_time_limit():
+    """Seconds allowed for the active assessment (1 minute per question)"""
+    return quiz_question_total() * 60
+
+def assessment_time_remaining():
+    """Seconds left in the active assessment, never negative"""
+    elapsed = (datetime.now() - st.session_state.assessment_start_time).total_seconds()
+    return max(0, assessment_time_limit() - elapsed)
+
+def submit_assessment():
+    """Close the active assessment, dropping answers changed after the deadline"""
+    deadline = st.session_state.assessment_start_time + timedelta(
+        seconds=assessment_time_limit() + ASSESSMENT_GRACE_SECONDS
+    )
+    answer_times = st.session_state.assessment_answer_times
+    for idx in list(st.session_state.assessment_answers):
+        if answer_times.get(idx, deadline) > deadline:
+            del st.session_state.assessment_answers[idx]
+    st.session_state.assessment_timed_out = assessment_time_remaining() <= 0
+    # Questions still generating are dropped; the results cover what was shown
+    questions = st.session_state.quiz_questions = list(st.session_state.quiz_questions)
+    st.session_state.quiz_generation = None
+    answers = st.session_state.assessment_answers
+    record_results(
+        st.session_state.assessment_id,
+        st.session_state.get('current_assessment_topic', 'Pre-Assessment'),
+        questions,
+        [answers.get(idx, "")[:1] for idx in range(len(questions))]
+    )
+    st.session_state.assessment_submitted = True
+    st.session_state.assessment_mode = False
+
+@st.fragment(run_every=1)
+def render_assessment_timer():
+    """Countdown for the active assessment; reruns on its own every second"""
+    if not st.session_state.assessment_mode:
+        return
+    
+    time_limit_seconds = assessment_time_limit()
+    remaining_time = assessment_time_remaining()
+    
+    # Display timer
+    minutes_left = int(remaining_time // 60)
+    seconds_left = int(remaining_time % 60)
+    
+    # Timer display with color coding
+    col1, col2, col3 = st.columns([2, 1, 2])
+    with col2:
+        if remaining_time > 60:
+            st.markdown(f"### ⏱️ {minutes_left}:{seconds_left:02d}")
+        elif remaining_time > 0:
+            st.markdown(f"### ⚠️ {minutes_left}:{seconds_left:02d}")
+        else:
+            st.markdown(f"### ⏰ Time's Up!")
+    
+    # Progress bar
+    progress = 1 - (remaining_time / time_limit_seconds)
+    st.progress(progress)
+    
+    # Auto-submit if time is up; rerun the whole page to show the results
+    if remaining_time <= 0:
+        submit_assessment()
+        st.rerun()
+
+def load_course_index(uploaded_files):
+    """
+    Return the shared (embeddings, vectorizer, chunks) index for the uploaded files.
+    Raises IngestError for uploads over the size limits or, with
+    LYRA_INGEST_DECODE_ERRORS=strict, files that are not valid UTF-8.
+    """
+    check_upload_limits([(file.name, file.size) for file in uploaded_files])
+    digests = st.session_state.file_digests
+    current_ids = {file.file_id for file in uploaded_files}
+    for file_id in list(digests):
+        if file_id not in current_ids:
+            del digests[file_id]
+    for file in uploaded_files:
+        if file.file_id not in digests:
+            # Hash the upload's buffer in place rather than a copy of its bytes
+            with file.getbuffer() as view:
+                digests[file.file_id] = content_digest(view)
+    
+    key = corpus_key([digests[file.file_id] for file in uploaded_files], RETRIEVAL_BACKEND)
+    lease = st.session_state.index_lease
+    if lease is None or lease.key != key:
+        if lease is not None:
+            lease.release()
+            st.session_state.index_lease = None
+        
+        # Read session objects here; the build runs on a worker thread. Uploads are
+        # passed as files and only spooled or read if they have to be chunked
+        files = [(digests[file.file_id], file.name, file) for file in uploaded_files]
+        if st.session_state.incremental_index is None:
+            from incremental_index import IncrementalVectorStore
+            st.session_state.incremental_index = IncrementalVectorStore()
+        store = st.session_state.incremental_index
+        document_spans = st.session_state.document_spans
+        build_lock = st.session_state.index_build_lock
+        warnings = []
+        
+        def build(report):
+            if RETRIEVAL_BACKEND != "tfidf":
+                with spooled_uploads([(name, file) for _, name, file in files]) as uploads:
+                    chunked = chunk_files(
+                        uploads,
+                        progress=lambda done, total: report(f"Chunking files ({done}/{total})", 0.5 * done / total),
+                        with_spans=True
+                    )
+                report("Building search index", 0.5)
+                chunks = [chunk for file_chunks, _ in chunked for chunk in file_chunks]
+                sources = ChunkSources.from_files([spans for _, spans in chunked])
+                return CorpusIndex(*create_vector_store(chunks, backend=RETRIEVAL_BACKEND), sources)
+            
+            index_path = os.path.join(INDEX_DIR, key) if INDEX_DIR else None
+            if index_path and os.path.isdir(index_path):
+                try:
+                    with span("index.load"):
+                        return CorpusIndex(*load_index(index_path), load_chunk_sources(index_path))
+                except (OSError, ValueError):
+                    pass  # Unreadable or outdated index; rebuild it below
+            
+            # Only files not yet in this session's index are chunked and vectorized
+            with build_lock:
+                current = {doc_id for doc_id, _, _ in files}
+                for doc_id in store.document_ids:
+                    if doc_id not in current:
+                        store.remove_document(doc_id)
+                        document_spans.pop(doc_id, None)
+                new_files = []
+                seen = set()
+                for doc_id, name, file in files:
+                    if doc_id not in store and doc_id not in seen:
+                        seen.add(doc_id)
+                        new_files.append((doc_id, name, file))
+                
+                with spooled_uploads([(name, file) for _, name, file in new_files]) as uploads:
+                    chunked = chunk_files(
+                        uploads,
+                        progress=lambda done, total: report(f"Chunking files ({done}/{total})", 0.5 * done / total),
+                        with_spans=True
+                    )
+                chunk_lists = [chunks for chunks, _ in chunked]
+                for (doc_id, _, _), (_, spans) in zip(new_files, chunked):
+                    document_spans[doc_id] = spans
+                increment("chunks_indexed", sum(len(chunks) for chunks in chunk_lists))
+                with span("index.vectorize"):
+                    if store.num_chunks == 0:
+                        report("Vectorizing course materials", 0.5)
+                        store.add_documents(zip([doc_id for doc_id, _, _ in new_files], chunk_lists))
+                    else:
+                        for i, ((doc_id, name, _), chunks) in enumerate(zip(new_files, chunk_lists)):
+                            report(f"Vectorizing {name}", 0.5 + 0.4 * i / len(new_files))
+                            store.add_document(doc_id, chunks)
+                    report("Finalizing index", 0.9)
+                    sources = ChunkSources.from_files([document_spans[doc_id] for doc_id in store.document_ids])
+                    index = CorpusIndex(*store.as_vector_store(), sources)
+                # The store stays in this session beside the cached index; it counts against the same budget
+                get_index_cache().charge(store, store.nbytes)
+            
+            if index_path and index.embeddings is not None:
+                report("Saving index", 0.95)
+                try:
+                    with span("index.save"):
+                        save_index(index_path, *index)
+                except OSError as e:
+                    warnings.append(f"Could not save course index: {e}")
+            return index
+        
+        progress_bar = st.progress(0.0, text="Processing course materials...")
+        try:
+            lease = run_with_progress(
+                lambda report: get_index_cache().lease(key, lambda: build(report)),
+                lambda stage, fraction: progress_bar.progress(min(fraction, 1.0), text=stage)
+            )
+        finally:
+            progress_bar.empty()
+        for warning in warnings:
+            st.warning(warning)
+        st.session_state.index_lease = lease
+    
+    return lease.value
+
 # ===============================
 # Main Streamlit UI
 # ===============================
 st.set_page_config(page_title="Lyra - AI Study Assistant", page_icon="🎓", layout="wide")
+start_background_warmup()
 
 # Header
 st.title("🎓 Lyra - Your AI Study Assistant")
@@ -90,6 +453,7 @@ mode = st.sidebar.radio(
 
 # Display progress dashboard
 display_progress_dashboard()
+display_metrics_panel()
 
 # File Upload
 uploaded_files = st.file_uploader(
@@ -99,16 +463,14 @@ uploaded_files = st.file_uploader(
 )
 
 if uploaded_files:
-    # Load and process documents
-    text_data = ""
-    for file in uploaded_files:
-        text_data += file.read().decode("utf-8") + "\n"
+    # Load and process documents (shared across reruns and sessions)
+    try:
+        course_index = load_course_index(uploaded_files)
+    except IngestError as e:
+        st.error(f"❌ {e}")
+        st.stop()
     
-    with st.spinner("Processing course materials..."):
-        chunks = chunk_text(text_data)
-        embeddings, vectorizer, chunks = create_vector_store(chunks)
-    
-    st.success(f"✅ Loaded {len(chunks)} sections from your course materials")
+    st.success(f"✅ Loaded {len(course_index.chunks)} sections from your course materials")
     
     # Mode-specific interfaces
     if mode == "💬 Q&A Support":
@@ -118,35 +480,41 @@ if uploaded_files:
         query = st.text_input("Your question:", key="qa_input")
         
         if query:
+            profile = st.session_state.student_profile
             with st.spinner("Thinking..."):
-                # Retrieve context - now returns list of tuples
-                results = retrieve_relevant_chunks(query, embeddings, vectorizer, chunks)
-                context = "\n\n".join([chunk for chunk, score in results])
-                
-                answer = generate_personalized_answer(context, query, st.session_state.student_profile)
-                
-                # Analyze and track learning
-                analyze_learning_patterns(query)
-                gaps = identify_knowledge_gaps(context, query, answer)
-                
-                if gaps:
-                    st.session_state.student_profile['knowledge_gaps'].extend(gaps)
-                
-                st.markdown("### 📖 Answer:")
-                st.write(answer)
+                # Overlapping hits are merged and the context is cut to each prompt's budget
+                hits = retrieve_hits(query, course_index, 3)
+                context = pack_context(course_index, hits, CONTEXT_TOKEN_BUDGETS['answer'])
+                gap_context = pack_context(course_index, hits, CONTEXT_TOKEN_BUDGETS['gaps'])
+            
+            # The answer sees the profile as it was before this question
+            profile_snapshot = dict(profile, knowledge_gaps=profile['knowledge_gaps'][-3:])
+            
+            # Render the answer progressively as the model produces it
+            st.markdown("### 📖 Answer:")
+            answer = st.write_stream(stream_personalized_answer(context, query, profile_snapshot))
+            
+            # Reruns while the question is still in the box re-render the turn (the answer
+            # comes from the response cache) but record it, and analyze its gaps, only once
+            gap_job = st.session_state.gap_jobs.get((query, answer))
+            if gap_job is None:
+                analyze_learning_patterns(query, profile=profile)
+                prefetch_quiz_topics(st.session_state.index_lease.key, course_index, profile)
                 
                 # Store conversation
-                st.session_state.conversation_history.append({
+                conversation = {
                     'query': query,
                     'answer': answer,
                     'timestamp': datetime.now().isoformat()
-                })
+                }
+                append_bounded(st.session_state.conversation_history, conversation)
+                record_event(profile, 'conversation', conversation)
                 
-                # Show related topics
-                if gaps:
-                    with st.expander("💡 Suggested Review Topics"):
-                        for gap in gaps:
-                            st.write(f"• {gap}")
+                # Gap analysis is batched with the student's next turns and finishes in the background
+                gap_job = queue_gap_analysis(profile, gap_context, query, answer)
+                st.session_state.gap_jobs = {(query, answer): gap_job}
+                st.session_state.pending_gap_analyses.append(gap_job)
+            render_review_topics(gap_job)
     
     elif mode == "📝 Exam Preparation":
         st.subheader("Practice for Your Exam")
@@ -154,19 +522,20 @@ if uploaded_files:
         
         topic = st.text_input("Enter topic for practice questions:", key="exam_topic")
         num_questions = st.slider("Number of questions:", 3, 10, 5)
+        fresh_questions = st.checkbox("Generate new questions (don't reuse a previous quiz on this topic)")
         
         if st.button("Generate Practice Quiz"):
             with st.spinner("Creating your personalized quiz..."):
-                results = retrieve_relevant_chunks(topic, embeddings, vectorizer, chunks, top_k=5)
-                context = "\n\n".join([chunk for chunk, score in results])
-                questions = generate_practice_questions(context, topic, num_questions)
+                # The quiz starts at the first question; the rest keep generating meanwhile
+                generation = start_quiz_generation(course_index, topic, num_questions, 5, use_cache=not fresh_questions)
                 
-                if questions:
-                    st.session_state.quiz_questions = questions
+                if generation:
                     st.session_state.quiz_active = True
                     st.session_state.current_question_idx = 0
-                    st.session_state.quiz_score = 0
                     st.session_state.quiz_answers = []
+                    st.session_state.quiz_feedback = None
+                    st.session_state.quiz_id = generate_random_id(12)
+                    st.session_state.quiz_topic = topic
                     st.rerun()
         
         # Display quiz
@@ -174,10 +543,34 @@ if uploaded_files:
             questions = st.session_state.quiz_questions
             idx = st.session_state.current_question_idx
             
-            if idx < len(questions):
+            # Feedback on the previous answer stays up while the student reads the next question
+            feedback = st.session_state.quiz_feedback
+            if feedback is not None:
+                if feedback['is_correct']:
+                    st.success(f"✅ Question {feedback['number']}: Correct!")
+                else:
+                    st.error(f"❌ Question {feedback['number']}: Incorrect. The correct answer is {feedback['correct']}")
+                st.info(f"💡 {feedback['explanation']}")
+            
+            results = st.session_state.assessment_results.get(st.session_state.quiz_id)
+            if results is not None:
+                show_score_once(results)
+                st.markdown("---")
+                st.markdown("### 🎉 Quiz Complete!")
+                st.metric("Your Score", f"{results['score']}/{results['total']} ({results['percentage']:.1f}%)")
+                st.write(results['feedback'])
+                st.write(f"**Proficiency Level:** {results['level']}")
+                
+                if st.button("Take Another Quiz"):
+                    st.session_state.quiz_active = False
+                    st.session_state.quiz_feedback = None
+                    st.rerun()
+            
+            elif idx < len(questions):
                 q = questions[idx]
-                st.markdown(f"### Question {idx + 1} of {len(questions)}")
+                st.markdown(f"### Question {idx + 1} of {quiz_question_total()}")
                 st.write(q['question'])
+                st.session_state.seen_questions.add(question_fingerprint(q))
                 
                 answer = st.radio("Select your answer:", q['options'], key=f"q_{idx}")
                 
@@ -187,49 +580,43 @@ if uploaded_files:
                         correct_letter = q['correct']
                         selected_letter = answer[0] if answer else ""
                         
-                        if selected_letter == correct_letter:
-                            st.success("✅ Correct!")
-                            st.session_state.quiz_score += 1
-                        else:
-                            st.error(f"❌ Incorrect. The correct answer is {correct_letter}")
-                        
-                        st.info(f"💡 {q.get('explanation', 'No explanation available')}")
-                        
                         st.session_state.quiz_answers.append({
                             'question': q['question'],
                             'selected': selected_letter,
                             'correct': correct_letter,
                             'is_correct': selected_letter == correct_letter
                         })
-                        
-                        time.sleep(3)
+                        st.session_state.quiz_feedback = {
+                            'number': idx + 1,
+                            'is_correct': selected_letter == correct_letter,
+                            'correct': correct_letter,
+                            'explanation': q.get('explanation', 'No explanation available')
+                        }
                         st.session_state.current_question_idx += 1
                         
-                        if st.session_state.current_question_idx >= len(questions):
-                            score = st.session_state.quiz_score
-                            total = len(questions)
-                            percentage = (score / total) * 100
-                            
-                            feedback, level = provide_exam_feedback(score, total)
-                            update_progress_tracking(topic, percentage)
-                            
-                            st.balloons()
-                            st.markdown("---")
-                            st.markdown("### 🎉 Quiz Complete!")
-                            st.metric("Your Score", f"{score}/{total} ({percentage:.1f}%)")
-                            st.write(feedback)
-                            st.write(f"**Proficiency Level:** {level}")
-                            
-                            if st.button("Take Another Quiz"):
-                                st.session_state.quiz_active = False
-                                st.rerun()
-                        else:
-                            st.rerun()
+                        generation = st.session_state.quiz_generation
+                        next_idx = st.session_state.current_question_idx
+                        if next_idx >= len(questions) and generation is not None and not generation.done:
+                            with st.spinner("Generating the next question..."):
+                                generation.wait_for(next_idx + 1, timeout=QUESTION_WAIT_SECONDS)
+                        
+                        if next_idx >= len(questions):
+                            answered = st.session_state.quiz_answers
+                            record_results(
+                                st.session_state.quiz_id,
+                                st.session_state.quiz_topic,
+                                questions[:len(answered)],
+                                [a['selected'] for a in answered]
+                            )
+                        st.rerun()
     
     elif mode == "📊 Progress Review":
         st.subheader("Your Learning Journey")
         
         profile = st.session_state.student_profile
+        profile_id = profile['profile_id']
+        aggregates = profile['aggregates']
+        store = get_profile_store()
         
         col1, col2, col3 = st.columns(3)
         with col1:
@@ -237,19 +624,20 @@ if uploaded_files:
         with col2:
             st.metric("Learning Pace", profile['learning_pace'].title())
         with col3:
-            avg_score = 0
-            if profile['exam_scores']:
-                all_scores = [s['score'] for scores in profile['exam_scores'].values() for s in scores]
-                avg_score = sum(all_scores) / len(all_scores) if all_scores else 0
+            avg_score = aggregates['score_mean']
             st.metric("Average Quiz Score", f"{avg_score:.1f}%")
         
         st.markdown("---")
         
-        if profile['exam_scores']:
+        # Full history is paged in from the profile store, not kept in session
+        if aggregates['topics']:
             st.subheader("📈 Quiz Performance by Topic")
-            for topic, scores in profile['exam_scores'].items():
-                with st.expander(f"📚 {topic}"):
-                    for i, score_data in enumerate(scores, 1):
+            for topic, stats in aggregates['topics'].items():
+                with st.expander(f"📚 {topic} (average {stats['mean']:.1f}%)"):
+                    attempts = stats['count']
+                    scores = store.recent(profile_id, 'exam_score', PROGRESS_ATTEMPTS_SHOWN, topic=topic)
+                    first_attempt = attempts - len(scores) + 1
+                    for i, score_data in enumerate(scores, first_attempt):
                         date = datetime.fromisoformat(score_data['date']).strftime("%Y-%m-%d %H:%M")
                         st.write(f"Attempt {i}: {score_data['score']}% - {date}")
         
@@ -260,61 +648,50 @@ if uploaded_files:
                 date = datetime.fromisoformat(session['timestamp']).strftime("%Y-%m-%d %H:%M")
                 st.write(f"• {date}: {session['query'][:50]}...")
         
-        if profile['knowledge_gaps']:
+        if aggregates['gaps']:
             st.subheader("🎯 Recommended Focus Areas")
-            unique_gaps = list(set(profile['knowledge_gaps']))[-5:]
-            for gap in unique_gaps:
-                st.write(f"• {gap}")
+            for gap in recent_gaps(aggregates, 5):
+                seen = aggregates['gaps'][gap]['count']
+                st.write(f"• {gap}" + (f" (seen {seen} times)" if seen > 1 else ""))
     
     elif mode == "🎯 Pre-Assessment":
         st.subheader("Test Your Current Knowledge")
         st.write("Take a timed assessment to identify what you already know and where to focus your studies.")
         st.info("⏱️ **Timer:** You'll have 1 minute per question. No feedback until you submit!")
         
+        # Graded once at submit; reruns only render the stored record. The record of
+        # an older attempt may have been dropped as newer quizzes were graded
+        results = st.session_state.assessment_results.get(st.session_state.assessment_id)
+        if st.session_state.assessment_submitted and results is None:
+            st.session_state.assessment_submitted = False
+        
         # Check if assessment is submitted - show results
         if st.session_state.assessment_submitted:
-            questions = st.session_state.quiz_questions
-            user_answers = st.session_state.assessment_answers
-            
-            # Calculate score
-            score = 0
-            for idx, q in enumerate(questions):
-                user_answer = user_answers.get(idx, "")
-                if user_answer and user_answer[0] == q['correct']:
-                    score += 1
-            
-            total = len(questions)
-            percentage = (score / total) * 100
-            
-            feedback, level = provide_exam_feedback(score, total)
-            assess_topic = st.session_state.get('current_assessment_topic', 'Pre-Assessment')
-            update_progress_tracking(assess_topic, percentage)
-            
-            st.balloons()
+            if st.session_state.get('assessment_timed_out'):
+                st.warning("⏰ Time's up! Your assessment has been automatically submitted.")
+            show_score_once(results)
             st.markdown("---")
             st.markdown("## 🎉 Assessment Complete!")
             
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("Score", f"{score}/{total}")
+                st.metric("Score", f"{results['score']}/{results['total']}")
             with col2:
-                st.metric("Percentage", f"{percentage:.1f}%")
+                st.metric("Percentage", f"{results['percentage']:.1f}%")
             with col3:
-                st.metric("Level", level)
+                st.metric("Level", results['level'])
             
-            st.write(feedback)
+            st.write(results['feedback'])
             st.markdown("---")
             
             # Show detailed results
             st.markdown("### 📋 Detailed Results")
             
-            for idx, q in enumerate(questions):
-                user_answer = user_answers.get(idx, "No answer provided")
+            for idx, q in enumerate(results['questions']):
                 correct_letter = q['correct']
-                user_letter = user_answer[0] if user_answer and user_answer != "No answer provided" else ""
-                is_correct = user_letter == correct_letter
+                user_letter = results['selected'][idx]
                 
-                if is_correct:
+                if results['is_correct'][idx]:
                     st.success(f"**Question {idx + 1}:** ✅ Correct")
                 else:
                     st.error(f"**Question {idx + 1}:** ❌ Incorrect")
@@ -345,43 +722,23 @@ if uploaded_files:
                 st.session_state.assessment_submitted = False
                 st.session_state.assessment_answers = {}
                 st.session_state.quiz_questions = []
+                st.session_state.quiz_generation = None
                 st.rerun()
         
         # Check if assessment is active - show questions with timer
         elif st.session_state.assessment_mode and st.session_state.quiz_questions:
-            questions = st.session_state.quiz_questions
-            total_questions = len(questions)
-            time_limit_seconds = total_questions * 60  # 1 minute per question
-            
-            # Calculate elapsed and remaining time
-            elapsed_time = (datetime.now() - st.session_state.assessment_start_time).total_seconds()
-            remaining_time = max(0, time_limit_seconds - elapsed_time)
-            
-            # Display timer
-            minutes_left = int(remaining_time // 60)
-            seconds_left = int(remaining_time % 60)
+            # Snapshot: generation may append more questions while this run renders
+            questions = list(st.session_state.quiz_questions)
+            total_questions = quiz_question_total()
             
-            # Timer display with color coding
-            col1, col2, col3 = st.columns([2, 1, 2])
-            with col2:
-                if remaining_time > 60:
-                    st.markdown(f"### ⏱️ {minutes_left}:{seconds_left:02d}")
-                elif remaining_time > 0:
-                    st.markdown(f"### ⚠️ {minutes_left}:{seconds_left:02d}")
-                else:
-                    st.markdown(f"### ⏰ Time's Up!")
-            
-            # Progress bar
-            progress = 1 - (remaining_time / time_limit_seconds)
-            st.progress(progress)
-            
-            # Auto-submit if time is up
-            if remaining_time <= 0:
-                st.warning("⏰ Time's up! Your assessment has been automatically submitted.")
-                st.session_state.assessment_submitted = True
-                st.session_state.assessment_mode = False
+            # Enforce the deadline on every full run, not just in the timer
+            if assessment_time_remaining() <= 0:
+                submit_assessment()
                 st.rerun()
             
+            # Only the timer refreshes every second; the rest of the page reruns on interaction
+            render_assessment_timer()
+            
             st.markdown("---")
             st.markdown(f"### Answer all {total_questions} questions")
             st.write("**Note:** You won't see if answers are correct or incorrect until you submit!")
@@ -391,6 +748,7 @@ if uploaded_files:
             for idx, q in enumerate(questions):
                 st.markdown(f"**Question {idx + 1}:**")
                 st.write(q['question'])
+                st.session_state.seen_questions.add(question_fingerprint(q))
                 
                 # Get previously selected answer if exists
                 default_index = 0
@@ -409,22 +767,25 @@ if uploaded_files:
                     index=default_index
                 )
                 
-                # Store the answer
-                st.session_state.assessment_answers[idx] = selected
+                # Store the answer and when it last changed, for deadline enforcement
+                if st.session_state.assessment_answers.get(idx) != selected:
+                    st.session_state.assessment_answers[idx] = selected
+                    st.session_state.assessment_answer_times[idx] = datetime.now()
                 
                 st.markdown("---")
             
+            generation = st.session_state.quiz_generation
+            if generation is not None and generation.questions is st.session_state.quiz_questions and (
+                not generation.done or len(generation.questions) > len(questions)
+            ):
+                render_question_stream(len(questions))
+            
             # Submit button
             col1, col2, col3 = st.columns([2, 1, 2])
             with col2:
                 if st.button("📝 Submit Assessment", type="primary", use_container_width=True):
-                    st.session_state.assessment_submitted = True
-                    st.session_state.assessment_mode = False
+                    submit_assessment()
                     st.rerun()
-            
-            # Auto-refresh to update timer
-            time.sleep(1)
-            st.rerun()
         
         else:
             # Show start screen
@@ -435,22 +796,26 @@ if uploaded_files:
             
             if st.button("Start Pre-Assessment", type="primary") and assessment_topic:
                 with st.spinner("Generating assessment..."):
-                    results = retrieve_relevant_chunks(assessment_topic, embeddings, vectorizer, chunks, top_k=7)
-                    context = "\n\n".join([chunk for chunk, score in results])
-                    questions = generate_practice_questions(context, assessment_topic, num_questions)
+                    # The timer starts with the first question; later ones appear as they are generated
+                    generation = start_quiz_generation(course_index, assessment_topic, num_questions, 7)
                     
-                    if questions:
-                        st.session_state.quiz_questions = questions
+                    if generation:
                         st.session_state.assessment_mode = True
                         st.session_state.assessment_start_time = datetime.now()
                         st.session_state.assessment_answers = {}
+                        st.session_state.assessment_answer_times = {}
                         st.session_state.assessment_submitted = False
+                        st.session_state.assessment_id = generate_random_id(12)
                         st.session_state.current_assessment_topic = assessment_topic
                         st.rerun()
                     else:
                         st.error("Could not generate questions. Please try a different topic or check your course materials.")
 
 else:
+    if st.session_state.index_lease is not None:
+        st.session_state.index_lease.release()
+        st.session_state.index_lease = None
+    
     st.info("👆 Please upload your course materials to get started with Lyra!")
     
     # Show features when no files uploaded
@@ -487,4 +852,6 @@ else:
 
 # Footer
 st.markdown("---")
-st.markdown("*Lyra - Empowering students to learn faster and more effectively* 🚀")
\ No newline at end of file
+st.markdown("*Lyra - Empowering students to learn faster and more effectively* 🚀")
+
+export_prometheus()
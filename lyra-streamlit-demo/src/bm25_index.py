@@ -0,0 +1,100 @@
+from collections import Counter
+from sklearn.feature_extraction.text import CountVectorizer
+import numpy as np
+
+from vector_store import VECTORIZER_PARAMS
+
+class BM25Index:
+    """
+    Inverted index over the full chunk vocabulary, scored with BM25.
+    
+    Each term's posting list holds the ids of the chunks containing it (ascending)
+    and the precomputed BM25 contribution of the term to each of those chunks.
+    Queries only read the posting lists of their own terms, so query cost grows
+    with those lists rather than with the number of chunks.
+    """
+    
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        # Same tokenization as the TF-IDF store, without the vocabulary cap
+        params = {name: value for name, value in VECTORIZER_PARAMS.items() if name != 'max_features'}
+        self.vectorizer = CountVectorizer(**params)
+        counts = self.vectorizer.fit_transform(chunks).tocsr().astype(np.float64)
+        self._analyzer = self.vectorizer.build_analyzer()
+        self.num_chunks = counts.shape[0]
+        
+        doc_len = np.asarray(counts.sum(axis=1)).ravel()
+        avg_len = doc_len.mean() if self.num_chunks else 0.0
+        length_norm = k1 * (1 - b + b * doc_len / max(avg_len, 1e-9))
+        df = np.bincount(counts.indices, minlength=counts.shape[1])
+        idf = np.log(1 + (self.num_chunks - df + 0.5) / (df + 0.5))
+        
+        rows = np.repeat(np.arange(self.num_chunks), np.diff(counts.indptr))
+        tf = counts.data
+        counts.data = idf[counts.indices] * tf * (k1 + 1) / (tf + length_norm[rows])
+        
+        postings = counts.tocsc()
+        postings.sort_indices()
+        self._indptr = postings.indptr
+        self._doc_ids = postings.indices
+        self._impacts = postings.data.astype(np.float32)
+        self._max_impact = np.zeros(postings.shape[1], dtype=np.float32)
+        nonempty = np.diff(self._indptr) > 0
+        if nonempty.any():
+            self._max_impact[nonempty] = np.maximum.reduceat(self._impacts, self._indptr[:-1][nonempty])
+    
+    @property
+    def nbytes(self):
+        return self._indptr.nbytes + self._doc_ids.nbytes + self._impacts.nbytes + self._max_impact.nbytes
+    
+    def search(self, query, top_k=3):
+        """
+        Return the top_k chunks for `query` using MaxScore-style pruning.
+        Returns: (indices, scores) arrays, best match first; shorter than top_k
+        when fewer chunks contain any query term.
+        """
+        vocabulary = self.vectorizer.vocabulary_
+        query_tf = Counter(vocabulary[term] for term in self._analyzer(query) if term in vocabulary)
+        if not query_tf or top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        
+        # Highest-impact terms first; remaining[i] bounds what terms i.. can still add
+        terms = sorted(query_tf, key=lambda t: self._max_impact[t] * query_tf[t], reverse=True)
+        bounds = np.array([self._max_impact[t] * query_tf[t] for t in terms], dtype=np.float64)
+        remaining = np.concatenate([np.cumsum(bounds[::-1])[::-1], [0.0]])
+        
+        cand_ids = np.empty(0, dtype=self._doc_ids.dtype)
+        cand_scores = np.empty(0)
+        for i, term in enumerate(terms):
+            lo, hi = self._indptr[term], self._indptr[term + 1]
+            ids = self._doc_ids[lo:hi]
+            impacts = self._impacts[lo:hi] * query_tf[term]
+            
+            threshold = self._threshold(cand_scores, top_k)
+            if threshold is not None and threshold >= remaining[i]:
+                # No chunk unseen so far can reach the top k: only score existing candidates
+                keep = cand_scores + remaining[i] >= threshold
+                cand_ids, cand_scores = cand_ids[keep], cand_scores[keep]
+                pos = np.searchsorted(ids, cand_ids)
+                pos_clipped = np.minimum(pos, len(ids) - 1)
+                hit = (pos < len(ids)) & (ids[pos_clipped] == cand_ids)
+                cand_scores[hit] += impacts[pos_clipped[hit]]
+            else:
+                merged_ids = np.concatenate([cand_ids, ids])
+                merged_scores = np.concatenate([cand_scores, impacts])
+                cand_ids, inverse = np.unique(merged_ids, return_inverse=True)
+                cand_scores = np.bincount(inverse, weights=merged_scores)
+        
+        k = min(top_k, len(cand_ids))
+        if k < len(cand_ids):
+            top = np.argpartition(-cand_scores, k - 1)[:k]
+        else:
+            top = np.arange(len(cand_ids))
+        top = top[np.argsort(-cand_scores[top], kind='stable')]
+        return cand_ids[top].astype(np.int64), cand_scores[top]
+    
+    @staticmethod
+    def _threshold(scores, k):
+        # k-th best score so far, or None while there are fewer than k candidates
+        if len(scores) < k:
+            return None
+        return np.partition(scores, len(scores) - k)[len(scores) - k]
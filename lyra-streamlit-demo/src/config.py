@@ -0,0 +1,99 @@
+import os
+
+# Runtime settings, overridable through LYRA_* environment variables
+
+def _env_int(name, default):
+    """Read an integer setting from the environment."""
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        return default
+
+# Shared index cache
+INDEX_CACHE_MAX_MB = _env_int("LYRA_INDEX_CACHE_MAX_MB", 512)
+
+# Retrieval backend: "tfidf" (cosine over TF-IDF), "bm25" (inverted index) or
+# "lsa" (TF-IDF reduced to LSA_DIMENSIONS dense dimensions by truncated SVD)
+RETRIEVAL_BACKEND = os.environ.get("LYRA_RETRIEVAL_BACKEND", "tfidf")
+LSA_DIMENSIONS = _env_int("LYRA_LSA_DIMENSIONS", 128)
+
+# Directory for persisted indexes; empty disables persistence
+INDEX_DIR = os.environ.get("LYRA_INDEX_DIR", "")
+
+# Ingestion: worker processes for decoding/chunking (0 = one per core) and the
+# smallest upload, in KB, worth spreading across processes
+INGEST_WORKERS = _env_int("LYRA_INGEST_WORKERS", 0)
+INGEST_PARALLEL_MIN_KB = _env_int("LYRA_INGEST_PARALLEL_MIN_KB", 1024)
+
+# Uploads: largest accepted file and total size, in MB; uploads above
+# INGEST_SPOOL_MB are spooled to temporary files and memory-mapped; the UTF-8
+# error policy is "replace", "ignore" or "strict" (reject the file)
+UPLOAD_MAX_FILE_MB = _env_int("LYRA_UPLOAD_MAX_FILE_MB", 500)
+UPLOAD_MAX_TOTAL_MB = _env_int("LYRA_UPLOAD_MAX_TOTAL_MB", 1000)
+INGEST_SPOOL_MB = _env_int("LYRA_INGEST_SPOOL_MB", 16)
+INGEST_DECODE_ERRORS = os.environ.get("LYRA_INGEST_DECODE_ERRORS", "replace")
+
+# Model response cache: entry lifetime (0 disables the cache), in-memory entry
+# limit, an optional directory for the shared on-disk tier and that tier's size
+# limit in MB (oldest files are removed first)
+LLM_CACHE_TTL_SECONDS = _env_int("LYRA_LLM_CACHE_TTL_SECONDS", 86400)
+LLM_CACHE_MAX_ENTRIES = _env_int("LYRA_LLM_CACHE_MAX_ENTRIES", 1000)
+LLM_CACHE_DIR = os.environ.get("LYRA_LLM_CACHE_DIR", "")
+LLM_CACHE_DISK_MAX_MB = _env_int("LYRA_LLM_CACHE_DISK_MAX_MB", 256)
+
+# Import heavy dependencies in the background after the first page load (0 disables)
+WARMUP = _env_int("LYRA_WARMUP", 1)
+
+# Student profiles: SQLite database path and how many recent history entries
+# each session keeps in memory
+PROFILE_DB_PATH = os.environ.get("LYRA_PROFILE_DB", "lyra_profiles.sqlite3")
+PROFILE_RECENT_WINDOW = _env_int("LYRA_PROFILE_RECENT_WINDOW", 20)
+
+# Stage timing and counters (0 disables them), with optional exports: a JSON
+# lines file that every span is appended to, and a Prometheus text file for a
+# node_exporter textfile collector
+METRICS_ENABLED = _env_int("LYRA_METRICS", 0) == 1
+METRICS_JSONL_PATH = os.environ.get("LYRA_METRICS_JSONL", "")
+METRICS_PROMETHEUS_PATH = os.environ.get("LYRA_METRICS_PROMETHEUS", "")
+
+# Model provider: "gemini", or "offline" for a local stand-in with simulated
+# latency, given as "fixed:MS", "uniform:MIN_MS:MAX_MS", "lognormal:MEDIAN_MS:SIGMA"
+# or "exponential:MEAN_MS" for the first delta and for each further delta
+LLM_PROVIDER = os.environ.get("LYRA_LLM_PROVIDER", "gemini")
+LLM_OFFLINE_LATENCY = os.environ.get("LYRA_LLM_OFFLINE_LATENCY", "lognormal:800:0.5")
+LLM_OFFLINE_TOKEN_LATENCY = os.environ.get("LYRA_LLM_OFFLINE_TOKEN_LATENCY", "fixed:30")
+LLM_OFFLINE_ERROR_PERCENT = _env_int("LYRA_LLM_OFFLINE_ERROR_PERCENT", 0)
+
+# Model call gateway: process-wide rate limit (calls per minute, 0 = unlimited)
+# with its burst size, concurrent call cap (0 = unlimited), retries of
+# rate-limited or transient failures, and the overall deadline per call
+LLM_RATE_PER_MINUTE = _env_int("LYRA_LLM_RATE_PER_MINUTE", 600)
+LLM_RATE_BURST = _env_int("LYRA_LLM_RATE_BURST", 20)
+LLM_MAX_CONCURRENCY = _env_int("LYRA_LLM_MAX_CONCURRENCY", 16)
+LLM_MAX_RETRIES = _env_int("LYRA_LLM_MAX_RETRIES", 4)
+LLM_DEADLINE_SECONDS = _env_int("LYRA_LLM_DEADLINE_SECONDS", 60)
+
+# Quiz prefetching (0 disables): topics predicted per student, questions
+# generated per topic batch, and the shared pool's per-topic and topic limits
+# and question lifetime
+QUIZ_PREFETCH = _env_int("LYRA_QUIZ_PREFETCH", 1)
+QUIZ_PREFETCH_TOPICS = _env_int("LYRA_QUIZ_PREFETCH_TOPICS", 3)
+QUIZ_PREFETCH_BATCH = _env_int("LYRA_QUIZ_PREFETCH_BATCH", 5)
+QUIZ_POOL_MAX_PER_TOPIC = _env_int("LYRA_QUIZ_POOL_MAX_PER_TOPIC", 20)
+QUIZ_POOL_MAX_TOPICS = _env_int("LYRA_QUIZ_POOL_MAX_TOPICS", 200)
+QUIZ_POOL_TTL_SECONDS = _env_int("LYRA_QUIZ_POOL_TTL_SECONDS", 3600)
+
+# Knowledge-gap analysis: Q&A turns per student analyzed in one model call, and
+# the longest a turn waits for its batch to fill (1 turn analyzes each one at once)
+GAP_BATCH_TURNS = _env_int("LYRA_GAP_BATCH_TURNS", 4)
+GAP_BATCH_SECONDS = _env_int("LYRA_GAP_BATCH_SECONDS", 30)
+
+# Approximate token budget for the course material in each kind of prompt
+CONTEXT_TOKEN_BUDGETS = {
+    'answer': _env_int("LYRA_CONTEXT_TOKENS_ANSWER", 1000),
+    'quiz': _env_int("LYRA_CONTEXT_TOKENS_QUIZ", 2000),
+    'gaps': _env_int("LYRA_CONTEXT_TOKENS_GAPS", 150),
+}
@@ -0,0 +1,130 @@
+from array import array
+
+from config import CONTEXT_TOKEN_BUDGETS
+from metrics import increment, span
+
+# Rough characters per model token for English course text
+CHARS_PER_TOKEN = 4
+
+PASSAGE_SEPARATOR = "\n\n"
+
+class ChunkSources:
+    """
+    Where each chunk of an index came from: the position of its document and the
+    chunk's (start, end) character offsets in that document's text, in chunk order.
+    """
+    
+    def __init__(self, docs, starts, ends):
+        self.docs = docs
+        self.starts = starts
+        self.ends = ends
+    
+    @classmethod
+    def from_files(cls, span_lists):
+        """Build from per-file flat [start, end, start, end, ...] span arrays, in file order."""
+        docs, starts, ends = array('q'), array('q'), array('q')
+        for doc, spans in enumerate(span_lists):
+            docs.extend([doc] * (len(spans) // 2))
+            starts.extend(spans[0::2])
+            ends.extend(spans[1::2])
+        return cls(docs, starts, ends)
+    
+    @property
+    def nbytes(self):
+        return sum(len(a) * a.itemsize for a in (self.docs, self.starts, self.ends))
+    
+    def __len__(self):
+        return len(self.docs)
+    
+    def __getitem__(self, i):
+        return self.docs[i], self.starts[i], self.ends[i]
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def trim_to_tokens(text, max_tokens):
+    """Cut `text` to about `max_tokens`, at the last whitespace that fits"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars + 1)
+    return text[:cut if cut > max_chars // 2 else max_chars].rstrip()
+
+def retrieve_hits(query, index, top_k):
+    """Return the top_k (chunk_index, score) pairs for `query`, best first"""
+    from vector_store import retrieve_batch
+    
+    if index.embeddings is None or index.vectorizer is None or not index.chunks:
+        return []
+    with span("retrieve"):
+        idxs, scores = retrieve_batch([query], index.embeddings, index.vectorizer, top_k)
+        return [(int(i), float(score)) for i, score in zip(idxs[0], scores[0]) if i >= 0]
+
+def pack_context(index, hits, max_tokens):
+    """
+    Assemble prompt context from retrieval hits within `max_tokens`.
+    
+    Hits are taken best first while they fit; a hit overlapping ones already taken
+    only costs its new characters. The taken chunks are mapped back to their source
+    offsets, overlapping or adjacent ones are merged into one passage, and passages
+    are joined in document order. Without source offsets, each distinct chunk is a
+    passage, in chunk order. If even the best hit does not fit, it is trimmed.
+    """
+    if not hits:
+        return ""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks, sources = index.chunks, getattr(index, 'sources', None)
+    
+    def span_of(i):
+        return sources[i] if sources is not None else (i, 0, len(chunks[i]))
+    
+    taken = {}
+    used = 0
+    for i, _ in hits:
+        if i in taken:
+            continue
+        doc, start, end = span_of(i)
+        cost = _uncovered(start, end, [s for s in taken.values() if s[0] == doc])
+        if used + cost <= max_chars:
+            taken[i] = (doc, start, end)
+            used += cost
+        elif not taken:
+            increment("context_chunks_trimmed")
+            return trim_to_tokens(chunks[i], max_tokens)
+    
+    passages = []
+    last = None
+    for i, (doc, start, end) in sorted(taken.items(), key=lambda item: (item[1][0], item[1][1], item[0])):
+        if last is not None and last['doc'] == doc and (start <= last['end'] or i == last['index'] + 1):
+            text = chunks[i]
+            if start <= last['end']:
+                if end > last['end']:
+                    last['parts'].append(text[last['end'] - start:])
+            else:
+                last['parts'].append(" " + text)  # Consecutive chunks; only whitespace between them
+            last['end'] = max(last['end'], end)
+            last['index'] = i
+        else:
+            last = {'doc': doc, 'end': end, 'index': i, 'parts': [chunks[i]]}
+            passages.append(last)
+    
+    increment("context_chars_saved", sum(len(chunks[i]) for i in taken) - used)
+    return PASSAGE_SEPARATOR.join("".join(passage['parts']) for passage in passages)
+
+def _uncovered(start, end, spans):
+    # Characters of [start, end) not covered by the (doc, start, end) spans of one document
+    covered = 0
+    pos = start
+    for _, s, e in sorted(spans, key=lambda item: item[1]):
+        s, e = max(s, pos), min(e, end)
+        if s < e:
+            covered += e - s
+            pos = e
+    return end - start - covered
+
+def build_context(query, index, kind, top_k):
+    """
+    Retrieve the top_k chunks for `query` and pack them within the token budget for
+    `kind` ('answer', 'quiz' or 'gaps'; see LYRA_CONTEXT_TOKENS_*).
+    """
+    return pack_context(index, retrieve_hits(query, index, top_k), CONTEXT_TOKEN_BUDGETS[kind])
@@ -0,0 +1,114 @@
+import threading
+import time
+from concurrent.futures import Future
+
+from config import GAP_BATCH_SECONDS, GAP_BATCH_TURNS
+from metrics import increment
+
+class GapAnalysisQueue:
+    """
+    Collects each student's Q&A turns and analyzes them for knowledge gaps in
+    batches: one model call per `max_turns` turns, or for whatever has arrived
+    `max_wait_seconds` after the first turn of a batch, whichever comes first.
+    Every turn gets a Future for its own list of gaps.
+    """
+    
+    def __init__(self, max_turns, max_wait_seconds):
+        self.max_turns = max(1, max_turns)
+        self.max_wait_seconds = max_wait_seconds
+        self._batches = {}  # student -> {'due': monotonic time, 'items': [(interaction, future)]}
+        self._cond = threading.Condition()
+        self._flusher = None
+    
+    def submit(self, student, context, query, answer):
+        """Queue one turn for analysis and return a Future for its gaps"""
+        interaction = (context, query, answer)
+        with self._cond:
+            batch = self._batches.get(student)
+            if batch is None:
+                batch = self._batches[student] = {'due': time.monotonic() + self.max_wait_seconds, 'items': []}
+            # A rerun of the same turn shares its pending analysis
+            for queued, future in batch['items']:
+                if queued[1:] == interaction[1:]:
+                    return future
+            future = Future()
+            batch['items'].append((interaction, future))
+            if len(batch['items']) < self.max_turns and self.max_wait_seconds > 0:
+                self._start_flusher()
+                self._cond.notify()
+                return future
+            del self._batches[student]
+        self._dispatch(batch['items'])
+        return future
+    
+    def flush(self, student=None):
+        """Start analyzing the queued turns of `student` (everyone's if None) now"""
+        with self._cond:
+            students = list(self._batches) if student is None else [student]
+            batches = [self._batches.pop(s) for s in students if s in self._batches]
+        for batch in batches:
+            self._dispatch(batch['items'])
+    
+    def pending(self):
+        """Number of turns waiting for their batch to be sent"""
+        with self._cond:
+            return sum(len(batch['items']) for batch in self._batches.values())
+    
+    def _start_flusher(self):
+        # Caller holds self._cond
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_due, name="lyra-gap-queue", daemon=True)
+            self._flusher.start()
+    
+    def _flush_due(self):
+        while True:
+            with self._cond:
+                while not self._batches:
+                    self._cond.wait()
+                now = time.monotonic()
+                due = [s for s, batch in self._batches.items() if batch['due'] <= now]
+                if not due:
+                    self._cond.wait(min(batch['due'] for batch in self._batches.values()) - now)
+                    continue
+                batches = [self._batches.pop(s) for s in due]
+            for batch in batches:
+                self._dispatch(batch['items'])
+    
+    def _dispatch(self, items):
+        from lyra_ai import run_in_background
+        increment("gap_batches")
+        increment("gap_batched_turns", len(items))
+        run_in_background(self._analyze, items)
+    
+    @staticmethod
+    def _analyze(items):
+        from lyra_ai import identify_knowledge_gaps_batch
+        try:
+            results = identify_knowledge_gaps_batch([interaction for interaction, _ in items])
+        except BaseException as e:
+            for _, future in items:
+                future.set_exception(e)
+            raise
+        for (_, future), gaps in zip(items, results):
+            future.set_result(gaps)
+
+def student_key(profile):
+    return profile.get('profile_id') or id(profile)
+
+_shared_queue = None
+_shared_lock = threading.Lock()
+
+def get_gap_queue():
+    """Return the gap analysis queue shared by every session in this process."""
+    global _shared_queue
+    with _shared_lock:
+        if _shared_queue is None:
+            _shared_queue = GapAnalysisQueue(GAP_BATCH_TURNS, GAP_BATCH_SECONDS)
+        return _shared_queue
+
+def queue_gap_analysis(profile, context, query, answer):
+    """
+    Queue a Q&A turn for batched gap analysis and return a Future for its gaps.
+    Merge finished analyses with lyra_ai.collect_knowledge_gaps on the script thread.
+    """
+    return get_gap_queue().submit(student_key(profile), context, query, answer)
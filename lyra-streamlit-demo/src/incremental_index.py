@@ -0,0 +1,251 @@
+from collections import Counter
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+import numpy as np
+import scipy.sparse as sp
+
+from vector_store import VECTORIZER_PARAMS
+
+class IncrementalVectorStore:
+    """
+    TF-IDF vector store that is updated one document at a time.
+    
+    Adding a document only tokenizes that document's chunks against the current
+    vocabulary and appends their rows; removing one drops its rows. Document
+    frequencies are kept exact, but the IDF weights are only refreshed once enough
+    rows have changed, and the vocabulary is only refit when new terms would
+    displace existing ones or the corpus has grown or shrunk substantially.
+    """
+    
+    def __init__(self, idf_refresh_ratio=0.1, drift_ratio=0.05, refit_growth=2.0):
+        """
+        Args:
+            idf_refresh_ratio: Fraction of rows that must change before IDF is recomputed
+            drift_ratio: Fraction of max_features that out-of-vocabulary terms may
+                displace before the vocabulary is refit
+            refit_growth: Refit when the corpus grows or shrinks by this factor
+        """
+        self.idf_refresh_ratio = idf_refresh_ratio
+        self.drift_ratio = drift_ratio
+        self.refit_growth = refit_growth
+        self._docs = {}
+        self._vectorizer = None
+        self._analyzer = None
+        self._df = None
+        self._term_freq = None
+        self._oov_freq = Counter()
+        self._rows_at_fit = 0
+        self._rows_changed = 0
+        self._snapshot = None
+    
+    @property
+    def document_ids(self):
+        return list(self._docs)
+    
+    @property
+    def num_chunks(self):
+        return sum(len(doc['chunks']) for doc in self._docs.values())
+    
+    @property
+    def nbytes(self):
+        """
+        Approximate memory held by the store itself: per-document count and weighted
+        rows, term statistics and vocabulary. The chunk strings are shared with the
+        index from as_vector_store(), which is counted where it is cached.
+        """
+        total = 0
+        for doc in self._docs.values():
+            for matrix in (doc['counts'], doc['weighted']):
+                if matrix is not None:
+                    total += matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+            # List slot per chunk, dict slot plus key string per out-of-vocabulary term
+            total += 8 * len(doc['chunks']) + 120 * len(doc['oov'])
+        for array in (self._df, self._term_freq):
+            if array is not None:
+                total += array.nbytes
+        if self._vectorizer is not None:
+            total += 120 * len(self._vectorizer.vocabulary_)
+        return total + 120 * len(self._oov_freq)
+    
+    def __contains__(self, doc_id):
+        return doc_id in self._docs
+    
+    def add_document(self, doc_id, chunks):
+        """Index the chunks of one document under `doc_id`."""
+        if doc_id in self._docs:
+            raise ValueError(f"Document {doc_id!r} is already indexed")
+        chunks = list(chunks)
+        self._snapshot = None
+        
+        if self._vectorizer is None:
+            self._docs[doc_id] = {'chunks': chunks, 'counts': None, 'weighted': None, 'oov': Counter()}
+            self.refit()
+            return
+        
+        counts, oov = self._count_rows(chunks)
+        self._docs[doc_id] = {
+            'chunks': chunks,
+            'counts': counts,
+            'weighted': self._weigh(counts),
+            'oov': oov,
+        }
+        self._df += np.diff(counts.tocsc().indptr)
+        self._term_freq += np.asarray(counts.sum(axis=0)).ravel()
+        self._oov_freq.update(oov)
+        self._rows_changed += counts.shape[0]
+        
+        if self._needs_refit():
+            self.refit()
+    
+    def add_documents(self, docs):
+        """
+        Index several (doc_id, chunks) pairs.
+        An empty store is fit once over all of them instead of document by document.
+        """
+        docs = list(docs)
+        if self._vectorizer is not None or not docs:
+            for doc_id, chunks in docs:
+                self.add_document(doc_id, chunks)
+            return
+        for doc_id, chunks in docs:
+            if doc_id in self._docs:
+                raise ValueError(f"Document {doc_id!r} is already indexed")
+            self._docs[doc_id] = {'chunks': list(chunks), 'counts': None, 'weighted': None, 'oov': Counter()}
+        self.refit()
+    
+    def remove_document(self, doc_id):
+        """Drop every chunk of `doc_id` from the index."""
+        doc = self._docs.pop(doc_id)
+        self._snapshot = None
+        if not self._docs:
+            self._reset()
+            return
+        if self._vectorizer is None:
+            return
+        
+        counts = doc['counts']
+        self._df -= np.diff(counts.tocsc().indptr)
+        self._term_freq -= np.asarray(counts.sum(axis=0)).ravel()
+        self._oov_freq.subtract(doc['oov'])
+        self._oov_freq = +self._oov_freq
+        self._rows_changed += counts.shape[0]
+        
+        if self._needs_refit():
+            self.refit()
+    
+    def refit(self):
+        """Rebuild the vocabulary and all weights from the current documents."""
+        self._snapshot = None
+        chunks = [chunk for doc in self._docs.values() for chunk in doc['chunks']]
+        if not chunks:
+            self._reset()
+            return
+        
+        count_vectorizer = CountVectorizer(**VECTORIZER_PARAMS)
+        counts = count_vectorizer.fit_transform(chunks).tocsr()
+        self._analyzer = count_vectorizer.build_analyzer()
+        self._vectorizer = TfidfVectorizer(**VECTORIZER_PARAMS)
+        self._vectorizer.vocabulary_ = count_vectorizer.vocabulary_
+        self._df = np.diff(counts.tocsc().indptr).astype(np.int64)
+        self._term_freq = np.asarray(counts.sum(axis=0)).ravel().astype(np.int64)
+        self._oov_freq = Counter()
+        self._rows_at_fit = counts.shape[0]
+        self._set_idf()
+        
+        start = 0
+        for doc in self._docs.values():
+            end = start + len(doc['chunks'])
+            doc['counts'] = counts[start:end]
+            doc['oov'] = Counter()
+            start = end
+        self._reweigh()
+    
+    def refresh_idf(self):
+        """Recompute IDF from the current document frequencies and reweigh all rows."""
+        if self._vectorizer is None:
+            return
+        self._snapshot = None
+        self._set_idf()
+        self._reweigh()
+    
+    def as_vector_store(self):
+        """
+        Return the current index in the create_vector_store format.
+        Returns: (embeddings_matrix, vectorizer, chunks)
+        """
+        if self._vectorizer is None:
+            return None, None, []
+        if self._rows_changed > self.idf_refresh_ratio * self.num_chunks:
+            self.refresh_idf()
+        if self._snapshot is None:
+            docs = self._docs.values()
+            embeddings = sp.vstack([doc['weighted'] for doc in docs], format='csr')
+            chunks = [chunk for doc in docs for chunk in doc['chunks']]
+            self._snapshot = (embeddings, self._vectorizer, chunks)
+        return self._snapshot
+    
+    def _reset(self):
+        self._vectorizer = None
+        self._analyzer = None
+        self._df = None
+        self._term_freq = None
+        self._oov_freq = Counter()
+        self._rows_at_fit = 0
+        self._rows_changed = 0
+    
+    def _needs_refit(self):
+        rows = self.num_chunks
+        if rows > self._rows_at_fit * self.refit_growth or rows * self.refit_growth < self._rows_at_fit:
+            return True
+        # Out-of-vocabulary terms now frequent enough to enter the vocabulary
+        vocabulary = self._vectorizer.vocabulary_
+        max_features = VECTORIZER_PARAMS['max_features']
+        if len(vocabulary) < max_features:
+            cutoff = 0
+        else:
+            cutoff = int(self._term_freq.min())
+        displacing = sum(1 for freq in self._oov_freq.values() if freq > cutoff)
+        return displacing > self.drift_ratio * max_features
+    
+    def _set_idf(self):
+        # Vectorizers handed out in snapshots are never mutated
+        vectorizer = TfidfVectorizer(**VECTORIZER_PARAMS)
+        vectorizer.vocabulary_ = self._vectorizer.vocabulary_
+        n = self.num_chunks
+        # Smoothed IDF, as computed by TfidfVectorizer
+        vectorizer.idf_ = np.log((1 + n) / (1 + self._df)) + 1
+        self._vectorizer = vectorizer
+        self._rows_changed = 0
+    
+    def _weigh(self, counts):
+        weighted = counts.astype(np.float64) @ sp.diags(self._vectorizer.idf_)
+        return normalize(weighted.tocsr(), norm='l2', copy=False)
+    
+    def _reweigh(self):
+        for doc in self._docs.values():
+            doc['weighted'] = self._weigh(doc['counts'])
+    
+    def _count_rows(self, chunks):
+        """Tokenize chunks against the fitted vocabulary; returns (counts, oov_counter)."""
+        vocabulary = self._vectorizer.vocabulary_
+        indptr = [0]
+        indices = []
+        data = []
+        oov = Counter()
+        for chunk in chunks:
+            row = Counter()
+            for term in self._analyzer(chunk):
+                col = vocabulary.get(term)
+                if col is None:
+                    oov[term] += 1
+                else:
+                    row[col] += 1
+            for col in sorted(row):
+                indices.append(col)
+                data.append(row[col])
+            indptr.append(len(indices))
+        counts = sp.csr_matrix(
+            (np.asarray(data, dtype=np.int64), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+            shape=(len(chunks), len(vocabulary))
+        )
+        return counts, oov
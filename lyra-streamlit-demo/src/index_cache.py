@@ -0,0 +1,204 @@
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict, namedtuple
+
+from config import INDEX_CACHE_MAX_MB
+from metrics import increment
+
+# Bump when chunking or vectorizer settings change so stale entries are not reused
+INDEX_CACHE_VERSION = "2"
+
+# sources: optional context_packer.ChunkSources mapping chunks to document offsets
+CorpusIndex = namedtuple("CorpusIndex", ["embeddings", "vectorizer", "chunks", "sources"], defaults=[None])
+
+def content_digest(data):
+    """Return the SHA-256 hex digest of one uploaded file's bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+def corpus_key(file_digests, variant=""):
+    """
+    Build a cache key for a corpus from its per-file content digests.
+    File order matters because it determines chunk order; `variant` separates
+    indexes of the same files built with different settings.
+    """
+    h = hashlib.sha256(f"{INDEX_CACHE_VERSION}:{variant}".encode("utf-8"))
+    for digest in file_digests:
+        h.update(b"\0")
+        h.update(digest.encode("ascii"))
+    return h.hexdigest()
+
+def estimate_index_bytes(index):
+    """Approximate resident size of a CorpusIndex in bytes."""
+    total = 0
+    embeddings = index.embeddings
+    if hasattr(embeddings, "nbytes"):
+        total += embeddings.nbytes
+    elif embeddings is not None:
+        for name in ("data", "indices", "indptr"):
+            array = getattr(embeddings, name, None)
+            if array is not None:
+                total += array.nbytes
+    # Projection matrix of the LSA backend
+    total += getattr(index.vectorizer, "nbytes", 0)
+    if index.sources is not None:
+        total += index.sources.nbytes
+    vocabulary = getattr(index.vectorizer, "vocabulary_", None)
+    if vocabulary:
+        # Dict slot plus a short key string per term
+        total += len(vocabulary) * 120
+    mapped_bytes = getattr(index.chunks, "nbytes", None)
+    if mapped_bytes is not None:
+        total += mapped_bytes
+    else:
+        # str payload plus per-object and list-slot overhead
+        total += sum(len(chunk) + 57 for chunk in index.chunks)
+    return total
+
+class _Entry:
+    __slots__ = ("value", "nbytes", "refs")
+
+    def __init__(self, value, nbytes):
+        self.value = value
+        self.nbytes = nbytes
+        self.refs = 0
+
+class IndexLease:
+    """
+    A session's reference to a cached index.
+    The reference is released explicitly or when the lease is garbage collected,
+    e.g. when the Streamlit session that owns it goes away.
+    """
+
+    def __init__(self, cache, key, value):
+        self.key = key
+        self.value = value
+        self._finalizer = weakref.finalize(self, cache.release, key)
+
+    def release(self):
+        self._finalizer()
+
+class IndexCache:
+    """
+    Process-wide, reference-counted LRU cache of corpus indexes.
+    Entries still referenced by a session are never evicted; unreferenced
+    entries are evicted least-recently-used first once the memory budget is exceeded.
+    Index data that sessions hold outside the cache can be charged to the same budget.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._charges = {}  # id(owner) -> bytes held outside the cache
+        # Reentrant: lease and charge finalizers can run during garbage collection
+        # triggered while this thread already holds the lock
+        self._lock = threading.RLock()
+
+    def lease(self, key, build):
+        """
+        Return an IndexLease for `key`, calling `build()` on a miss.
+        Concurrent misses for the same key share a single build.
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.refs += 1
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    increment("index_cache_hits")
+                    return IndexLease(self, key, entry.value)
+                pending = self._pending.get(key)
+                owner = pending is None
+                if owner:
+                    pending = self._pending[key] = threading.Event()
+            if owner:
+                break
+            pending.wait()
+
+        try:
+            value = build()
+        except Exception:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+            raise
+
+        with self._lock:
+            entry = _Entry(value, estimate_index_bytes(value))
+            entry.refs = 1
+            self._entries[key] = entry
+            self.total_bytes += entry.nbytes
+            self.misses += 1
+            increment("index_cache_misses")
+            del self._pending[key]
+            self._evict()
+        pending.set()
+        return IndexLease(self, key, value)
+
+    def release(self, key):
+        """Drop one reference to `key`, evicting if over budget."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.refs = max(0, entry.refs - 1)
+            self._evict()
+
+    def charge(self, owner, nbytes):
+        """
+        Count `nbytes` held by `owner` outside the cache (e.g. a session's incremental
+        store) against the budget, replacing its previous charge, and evict unreferenced
+        entries to make room. The charge is dropped when `owner` is garbage collected.
+        """
+        key = id(owner)
+        with self._lock:
+            if key not in self._charges:
+                weakref.finalize(owner, self._discharge, key)
+            self.total_bytes += nbytes - self._charges.get(key, 0)
+            self._charges[key] = nbytes
+            self._evict()
+
+    def _discharge(self, key):
+        with self._lock:
+            self.total_bytes -= self._charges.pop(key, 0)
+
+    def stats(self):
+        """Return a snapshot of cache counters."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'referenced': sum(1 for e in self._entries.values() if e.refs),
+                'total_bytes': self.total_bytes,
+                'charged_bytes': sum(self._charges.values()),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def _evict(self):
+        # Caller holds self._lock
+        if self.total_bytes <= self.max_bytes:
+            return
+        for key in list(self._entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            entry = self._entries[key]
+            if entry.refs == 0:
+                del self._entries[key]
+                self.total_bytes -= entry.nbytes
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+def get_index_cache():
+    """Return the cache shared by every session in this process."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = IndexCache(INDEX_CACHE_MAX_MB * 1024 * 1024)
+        return _shared_cache
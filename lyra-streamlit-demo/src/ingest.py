@@ -0,0 +1,237 @@
+import codecs
+import mmap
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+
+from config import (
+    INGEST_DECODE_ERRORS,
+    INGEST_PARALLEL_MIN_KB,
+    INGEST_SPOOL_MB,
+    INGEST_WORKERS,
+    UPLOAD_MAX_FILE_MB,
+    UPLOAD_MAX_TOTAL_MB
+)
+from metrics import increment, span
+from utils import iter_stream_chunks
+
+# Bytes decoded per step; the decoded text is chunked a window at a time
+DECODE_BLOCK_BYTES = 1 << 20
+
+_process_pool = None
+_thread_pool = None
+_pool_lock = threading.Lock()
+
+def _get_process_pool():
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is None:
+            # spawn, not fork: the Streamlit server is multi-threaded
+            _process_pool = ProcessPoolExecutor(
+                max_workers=INGEST_WORKERS or None,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _process_pool
+
+def _get_thread_pool():
+    global _thread_pool
+    with _pool_lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(thread_name_prefix="lyra-ingest")
+        return _thread_pool
+
+class IngestError(ValueError):
+    """An upload that cannot be ingested: too large, or not decodable under the error policy."""
+
+class Upload:
+    """
+    One uploaded file's bytes, held in memory or spooled to a temporary file.
+    Spooled uploads are memory-mapped when read, and are passed to worker
+    processes by path rather than by value.
+    """
+    
+    def __init__(self, name, data=None, path=None):
+        self.name = name
+        self.data = data
+        self.path = path
+    
+    @classmethod
+    def spool(cls, name, source, threshold_bytes=INGEST_SPOOL_MB * 1024 * 1024):
+        """
+        Wrap `source`, bytes or a seekable binary file such as a Streamlit UploadedFile.
+        A file larger than threshold_bytes is copied to a temporary file a block at a
+        time, so its contents are never read into memory at once.
+        """
+        if isinstance(source, (bytes, bytearray)):
+            return cls(name, data=source)
+        size = source.seek(0, os.SEEK_END)
+        source.seek(0)
+        if size <= threshold_bytes:
+            return cls(name, data=source.read())
+        with tempfile.NamedTemporaryFile(prefix="lyra-upload-", suffix=".txt", delete=False) as f:
+            try:
+                shutil.copyfileobj(source, f, DECODE_BLOCK_BYTES)
+            except BaseException:
+                f.close()
+                os.unlink(f.name)
+                raise
+        increment("uploads_spooled")
+        return cls(name, path=f.name)
+    
+    @contextmanager
+    def buffer(self):
+        """Yield the upload's bytes as a buffer: the data itself, or a read-only map of the file"""
+        if self.path is None:
+            yield self.data
+            return
+        with open(self.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield b""
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+    
+    def discard(self):
+        """Delete the spooled copy, if any"""
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+@contextmanager
+def spooled_uploads(files):
+    """
+    Yield an Upload for each (name, source) pair, where source is bytes or a binary
+    file, deleting any spooled copies afterwards
+    """
+    uploads = []
+    try:
+        for name, source in files:
+            uploads.append(Upload.spool(name, source))
+        yield uploads
+    finally:
+        for upload in uploads:
+            upload.discard()
+
+def check_upload_limits(sizes):
+    """
+    Raise IngestError if any (name, size_in_bytes) upload exceeds LYRA_UPLOAD_MAX_FILE_MB
+    or all of them together exceed LYRA_UPLOAD_MAX_TOTAL_MB.
+    """
+    max_file = UPLOAD_MAX_FILE_MB * 1024 * 1024
+    for name, size in sizes:
+        if size > max_file:
+            raise IngestError(f"{name} is {size / 2**20:.0f} MB; files may be at most {UPLOAD_MAX_FILE_MB} MB")
+    total = sum(size for _, size in sizes)
+    if total > UPLOAD_MAX_TOTAL_MB * 1024 * 1024:
+        raise IngestError(
+            f"The uploads total {total / 2**20:.0f} MB; course materials may be at most {UPLOAD_MAX_TOTAL_MB} MB"
+        )
+
+def iter_decoded(buffer, name="upload", errors=INGEST_DECODE_ERRORS):
+    """
+    Decode UTF-8 bytes a block at a time, yielding text pieces.
+    `errors` is the codec error policy: "strict" raises IngestError at the first
+    invalid byte, "replace" substitutes U+FFFD and "ignore" drops invalid bytes.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors=errors)
+    # Bytes fed to the decoder before the current block, and the undecoded tail of
+    # them it carries into that block; error positions count from the carried tail
+    consumed = 0
+    carried = b""
+    try:
+        for pos in range(0, len(buffer), DECODE_BLOCK_BYTES):
+            block = buffer[pos:pos + DECODE_BLOCK_BYTES]
+            carried = decoder.getstate()[0]
+            yield decoder.decode(block)
+            consumed += len(block)
+        carried = decoder.getstate()[0]
+        yield decoder.decode(b"", final=True)
+    except UnicodeDecodeError as e:
+        offset = consumed - len(carried) + e.start
+        raise IngestError(f"{name} is not valid UTF-8 text (invalid byte at offset {offset})") from None
+
+def decode_and_chunk(data, chunk_size=1000, chunk_overlap=200, with_spans=False):
+    """
+    Decode one uploaded file (bytes or an Upload) and split it into chunks.
+    The text is decoded and chunked incrementally, so the whole decoded file is
+    never held at once. With with_spans=True, returns (chunks, spans) where spans
+    is a flat array('q') of each chunk's start and end offset in the decoded text.
+    """
+    upload = data if isinstance(data, Upload) else Upload("upload", data=data)
+    chunks = []
+    spans = array('q')
+    with span("ingest.decode_and_chunk"), upload.buffer() as buffer:
+        for start, end, chunk in iter_stream_chunks(iter_decoded(buffer, upload.name), chunk_size, chunk_overlap):
+            chunks.append(chunk)
+            if with_spans:
+                spans.append(start)
+                spans.append(end)
+    return (chunks, spans) if with_spans else chunks
+
+def chunk_files(payloads, progress=None, with_spans=False):
+    """
+    Decode and chunk several files, in parallel across processes when worthwhile.
+    
+    Args:
+        payloads: List of file contents as bytes or Upload objects
+        progress: Optional callback(files_done, files_total), called as files finish
+        with_spans: Return (chunks, spans) per file, as decode_and_chunk does
+    
+    Returns:
+        List of chunk lists, in the same order as `payloads`
+    """
+    with span("ingest.chunk_files"):
+        total_kb = sum(upload_size(data) for data in payloads) / 1024
+        if len(payloads) < 2 or total_kb < INGEST_PARALLEL_MIN_KB or INGEST_WORKERS == 1:
+            results = []
+            for data in payloads:
+                results.append(decode_and_chunk(data, with_spans=with_spans))
+                if progress:
+                    progress(len(results), len(payloads))
+            return results
+        
+        # Decode and chunk spans from worker processes are not collected; this span covers them
+        pool = _get_process_pool()
+        futures = {pool.submit(decode_and_chunk, data, with_spans=with_spans): i for i, data in enumerate(payloads)}
+        results = [None] * len(payloads)
+        for done, future in enumerate(as_completed(futures), 1):
+            results[futures[future]] = future.result()
+            if progress:
+                progress(done, len(payloads))
+        return results
+
+def upload_size(data):
+    if isinstance(data, Upload):
+        if data.path is not None:
+            return os.path.getsize(data.path)
+        data = data.data
+    return len(data)
+
+def run_with_progress(job, on_progress):
+    """
+    Run `job(report)` on a worker thread while relaying its progress on this thread.
+    
+    The job calls report(stage, fraction) from the worker; each report is passed to
+    on_progress(stage, fraction) on the calling thread, which is where Streamlit
+    elements must be updated. Returns the job's result or re-raises its exception.
+    """
+    events = queue.Queue()
+    future = _get_thread_pool().submit(job, lambda stage, fraction: events.put((stage, fraction)))
+    while True:
+        try:
+            stage, fraction = events.get(timeout=0.1)
+        except queue.Empty:
+            if future.done() and events.empty():
+                break
+            continue
+        on_progress(stage, fraction)
+    return future.result()
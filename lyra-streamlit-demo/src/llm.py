@@ -0,0 +1,338 @@
+import random
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from config import (
+    LLM_DEADLINE_SECONDS,
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_RETRIES,
+    LLM_RATE_BURST,
+    LLM_RATE_PER_MINUTE
+)
+from llm_cache import get_response_cache, response_key
+from llm_providers import get_provider
+from metrics import increment, span
+
+# Backoff before retry n is uniform in [0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2**n)]
+RETRY_BASE_SECONDS = 0.5
+RETRY_MAX_SECONDS = 8.0
+
+# HTTP statuses worth retrying: timeouts, rate limiting and transient server errors
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+class LLMUnavailable(RuntimeError):
+    """No response within the deadline: out of rate or concurrency capacity, or out of retries."""
+
+def is_retryable(error):
+    """Whether a failed model call may succeed if repeated"""
+    # google.api_core errors carry the HTTP status in `code`
+    code = getattr(error, 'code', None)
+    if isinstance(code, int) and code in RETRYABLE_STATUS_CODES:
+        return True
+    # Before Python 3.11 concurrent.futures.TimeoutError is not the builtin TimeoutError
+    return isinstance(error, (TimeoutError, FutureTimeoutError, ConnectionError))
+
+class TokenBucket:
+    """
+    Rate limiter allowing `rate_per_second` calls on average and bursts of `burst`.
+    Callers reserve a token up front and sleep until it is due, so waiters are
+    served in arrival order.
+    """
+    
+    def __init__(self, rate_per_second, burst):
+        self.rate = rate_per_second
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self, deadline):
+        """Take one token, waiting if needed; return False if it would not be due before `deadline`"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            if now + wait > deadline:
+                self._tokens += 1
+                return False
+        if wait > 0:
+            increment("llm_rate_limited")
+            time.sleep(wait)
+        return True
+
+class _SharedStream:
+    """Deltas of one streamed response, readable by every caller that asked for it."""
+    
+    def __init__(self):
+        self.deltas = []
+        self.done = False
+        self.error = None
+        # The caller that starts the stream is its first reader
+        self.readers = 1
+        self.cancelled = False
+        self._cond = threading.Condition()
+    
+    def join(self):
+        """Register one more reader; False if every reader has already left"""
+        with self._cond:
+            if self.cancelled:
+                return False
+            self.readers += 1
+            return True
+    
+    def put(self, delta):
+        with self._cond:
+            self.deltas.append(delta)
+            self._cond.notify_all()
+    
+    def finish(self, error=None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+    
+    def read(self, deadline):
+        """Yield every delta; the caller must have registered as a reader"""
+        pos = 0
+        try:
+            while True:
+                with self._cond:
+                    ready = self._cond.wait_for(
+                        lambda: len(self.deltas) > pos or self.done, max(0.0, deadline - time.monotonic())
+                    )
+                    if not ready:
+                        raise LLMUnavailable("Timed out waiting for a shared model response")
+                    batch = self.deltas[pos:]
+                    pos = len(self.deltas)
+                    if not batch:
+                        if self.error is not None:
+                            raise self.error
+                        return
+                yield from batch
+        finally:
+            with self._cond:
+                self.readers -= 1
+                # The producer stops early once nobody is reading
+                if self.readers == 0 and not self.done:
+                    self.cancelled = True
+
+class LLMGateway:
+    """
+    Single path for model calls from every session in the process.
+    
+    Calls wait for a rate-limit token and a concurrency slot, are retried with
+    jittered exponential backoff on retryable errors, and give up with
+    LLMUnavailable once `deadline_seconds` have passed. Concurrent identical
+    requests (same model and prompt) are coalesced into one call whose response
+    every caller receives, unless the caller asks for an independent response.
+    """
+    
+    def __init__(self, rate_per_minute, burst, max_concurrency, max_retries, deadline_seconds):
+        self.max_retries = max_retries
+        self.deadline_seconds = deadline_seconds
+        self._bucket = TokenBucket(rate_per_minute / 60, burst) if rate_per_minute > 0 else None
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency > 0 else None
+        self._in_flight = {}
+        self._lock = threading.Lock()
+    
+    def generate(self, model_name, prompt, coalesce=True):
+        """Return the full response text"""
+        deadline = time.monotonic() + self.deadline_seconds
+        if not coalesce:
+            return self._generate(model_name, prompt, deadline)
+        
+        key = ('generate', response_key(model_name, prompt))
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            increment("llm_coalesced")
+            try:
+                return future.result(timeout=max(0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                raise LLMUnavailable("Timed out waiting for a shared model response") from None
+        
+        try:
+            text = self._generate(model_name, prompt, deadline)
+            future.set_result(text)
+            return text
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+    
+    def stream(self, model_name, prompt, coalesce=True):
+        """Yield the response as text deltas; only a call that has not yielded yet is retried"""
+        deadline = time.monotonic() + self.deadline_seconds
+        if not coalesce:
+            yield from self._stream(model_name, prompt, deadline)
+            return
+        
+        key = ('stream', response_key(model_name, prompt))
+        with self._lock:
+            shared = self._in_flight.get(key)
+            # Join before releasing the lock so the stream cannot be cancelled in between;
+            # a stream every reader abandoned stops early, so it cannot be joined
+            if shared is None or not shared.join():
+                shared = self._in_flight[key] = _SharedStream()
+                threading.Thread(
+                    target=self._produce, args=(key, shared, model_name, prompt, deadline),
+                    name="lyra-llm-stream", daemon=True
+                ).start()
+            else:
+                increment("llm_coalesced")
+        yield from shared.read(deadline)
+    
+    def _produce(self, key, shared, model_name, prompt, deadline):
+        # Late joiners read the deltas produced so far, then follow along
+        deltas = self._stream(model_name, prompt, deadline)
+        try:
+            for delta in deltas:
+                shared.put(delta)
+                if shared.cancelled:
+                    # Never end a truncated response as if it were complete
+                    shared.finish(LLMUnavailable("Shared model response abandoned by every reader"))
+                    break
+            else:
+                shared.finish()
+        except BaseException as e:
+            shared.finish(e)
+        finally:
+            deltas.close()
+            with self._lock:
+                if self._in_flight.get(key) is shared:
+                    del self._in_flight[key]
+    
+    def _generate(self, model_name, prompt, deadline):
+        attempt = 0
+        while True:
+            self._acquire(deadline)
+            try:
+                return get_provider().generate(model_name, prompt, timeout=self._remaining(deadline))
+            except Exception as e:
+                error = e
+            finally:
+                self._release()
+            self._backoff(error, attempt, deadline)
+            attempt += 1
+    
+    def _stream(self, model_name, prompt, deadline):
+        attempt = 0
+        while True:
+            self._acquire(deadline)
+            try:
+                deltas = get_provider().stream(model_name, prompt, timeout=self._remaining(deadline))
+                # Errors surface when the first delta is requested; retrying is safe until one is yielded
+                first = next(deltas, None)
+            except Exception as e:
+                self._release()
+                self._backoff(e, attempt, deadline)
+                attempt += 1
+                continue
+            except BaseException:
+                self._release()
+                raise
+            try:
+                if first is not None:
+                    yield first
+                yield from deltas
+            finally:
+                deltas.close()
+                self._release()
+            return
+    
+    def _acquire(self, deadline):
+        with span("llm.wait"):
+            if self._bucket is not None and not self._bucket.acquire(deadline):
+                raise LLMUnavailable("Model rate limit reached; no capacity before the deadline")
+            if self._slots is not None and not self._slots.acquire(timeout=self._remaining(deadline)):
+                raise LLMUnavailable("Too many concurrent model calls; no slot before the deadline")
+    
+    def _release(self):
+        if self._slots is not None:
+            self._slots.release()
+    
+    def _backoff(self, error, attempt, deadline):
+        """Sleep before retrying `error`, or re-raise it if it should not be retried"""
+        if not is_retryable(error) or attempt >= self.max_retries:
+            raise error
+        delay = random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt))
+        if time.monotonic() + delay >= deadline:
+            raise LLMUnavailable(f"Model call failed and the deadline leaves no time to retry: {error}") from error
+        increment("llm_retries")
+        time.sleep(delay)
+    
+    @staticmethod
+    def _remaining(deadline):
+        return max(0.0, deadline - time.monotonic())
+
+_shared_gateway = None
+_shared_lock = threading.Lock()
+
+def get_gateway():
+    """Return the gateway shared by every session in this process."""
+    global _shared_gateway
+    with _shared_lock:
+        if _shared_gateway is None:
+            _shared_gateway = LLMGateway(
+                LLM_RATE_PER_MINUTE, LLM_RATE_BURST, LLM_MAX_CONCURRENCY, LLM_MAX_RETRIES, LLM_DEADLINE_SECONDS
+            )
+        return _shared_gateway
+
+def generate_text(model_name, prompt, use_cache=True):
+    """
+    Return the model's full response text for `prompt`.
+    Identical (model, prompt) requests are served from the response cache, or share
+    one in-flight call, unless use_cache is False, e.g. when a different answer is
+    wanted each time.
+    """
+    cache = get_response_cache()
+    if use_cache:
+        cached = cache.get(model_name, prompt)
+        if cached is not None:
+            increment("llm_cache_hits")
+            return cached
+    
+    increment("llm_requests")
+    increment("prompt_chars", len(prompt))
+    with span(f"llm.{model_name}"):
+        text = get_gateway().generate(model_name, prompt, coalesce=use_cache)
+    if use_cache:
+        cache.put(model_name, prompt, text)
+    return text
+
+def stream_text(model_name, prompt, use_cache=True):
+    """
+    Yield the model's response as text deltas.
+    A cached response is yielded as a single delta; a fresh one is cached once complete.
+    """
+    cache = get_response_cache()
+    if use_cache:
+        cached = cache.get(model_name, prompt)
+        if cached is not None:
+            increment("llm_cache_hits")
+            yield cached
+            return
+    
+    increment("llm_requests")
+    increment("prompt_chars", len(prompt))
+    parts = []
+    deltas = get_gateway().stream(model_name, prompt, coalesce=use_cache)
+    with span(f"llm.{model_name}.first_chunk"):
+        first = next(deltas, None)
+    if first is not None:
+        parts.append(first)
+        yield first
+    for text in deltas:
+        parts.append(text)
+        yield text
+    
+    if use_cache:
+        cache.put(model_name, prompt, "".join(parts))
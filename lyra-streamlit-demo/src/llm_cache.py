@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from config import LLM_CACHE_DIR, LLM_CACHE_DISK_MAX_MB, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS
+
+# Pruning frees the disk tier down to this fraction of its limit, so a full
+# directory is not rescanned on every write
+DISK_PRUNE_TO = 0.9
+
+def response_key(model_name, prompt):
+    """Content address of a request: hash of the model name and the exact prompt."""
+    h = hashlib.sha256(model_name.encode("utf-8"))
+    h.update(b"\0")
+    h.update(prompt.encode("utf-8"))
+    return h.hexdigest()
+
+class ResponseCache:
+    """
+    Model responses keyed by (model, prompt) hash, with a TTL.
+    A bounded in-memory LRU tier sits in front of an optional on-disk tier
+    that is shared by every process pointing at the same directory. Expired
+    files are deleted when read, and the oldest files are deleted once the
+    directory grows past `disk_max_bytes`.
+    """
+    
+    def __init__(self, ttl_seconds, max_entries, disk_dir=None, disk_max_bytes=0):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = disk_max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # Estimated size of the disk tier; None until the directory is first scanned
+        self._disk_bytes = None
+        self._disk_lock = threading.Lock()
+    
+    @property
+    def enabled(self):
+        return self.ttl_seconds > 0
+    
+    def get(self, model_name, prompt):
+        """Return the cached response text, or None on a miss or expiry."""
+        if not self.enabled:
+            return None
+        key = response_key(model_name, prompt)
+        now = time.time()
+        
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, text = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return text
+                del self._memory[key]
+        
+        text, created = self._read_disk(key, now)
+        if text is not None:
+            with self._lock:
+                self._remember(key, created + self.ttl_seconds, text)
+                self.hits += 1
+            return text
+        
+        with self._lock:
+            self.misses += 1
+        return None
+    
+    def put(self, model_name, prompt, text):
+        """Store a response in both tiers."""
+        if not self.enabled:
+            return
+        key = response_key(model_name, prompt)
+        now = time.time()
+        with self._lock:
+            self._remember(key, now + self.ttl_seconds, text)
+        self._write_disk(key, model_name, now, text)
+    
+    def _remember(self, key, expires_at, text):
+        # Caller holds self._lock
+        self._memory[key] = (expires_at, text)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+    
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+    
+    def _read_disk(self, key, now):
+        if not self.disk_dir:
+            return None, 0
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+            text, created = record['text'], record['created']
+        except (OSError, ValueError, KeyError):
+            return None, 0
+        if created + self.ttl_seconds <= now:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass  # Already removed, e.g. by another process
+            return None, 0
+        return text, created
+    
+    def _write_disk(self, key, model_name, created, text):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'model': model_name, 'created': created, 'text': text}, f, ensure_ascii=False)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError:
+            return  # The disk tier is best effort; the memory tier still has the entry
+        if self.disk_max_bytes > 0:
+            with self._disk_lock:
+                if self._disk_bytes is not None:
+                    self._disk_bytes += size
+                if self._disk_bytes is None or self._disk_bytes > self.disk_max_bytes:
+                    self._prune_disk()
+    
+    def _prune_disk(self):
+        """Delete the oldest files once the disk tier is over its limit."""
+        # Caller holds self._disk_lock. Other processes share the directory, so the
+        # size is re-measured here rather than trusted from this process's writes.
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        if total > self.disk_max_bytes:
+            files.sort()
+            for _, size, path in files:
+                if total <= self.disk_max_bytes * DISK_PRUNE_TO:
+                    break
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                total -= size
+        self._disk_bytes = total
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """Return the response cache shared by every session in this process."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache(
+                LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_DIR, LLM_CACHE_DISK_MAX_MB * 1024 * 1024
+            )
+        return _shared_cache
@@ -0,0 +1,220 @@
+import random
+import re
+import threading
+import time
+
+from config import LLM_OFFLINE_ERROR_PERCENT, LLM_OFFLINE_LATENCY, LLM_OFFLINE_TOKEN_LATENCY, LLM_PROVIDER
+
+class GeminiProvider:
+    """
+    Google Gemini through the google-generativeai SDK.
+    The SDK is slow to import, so it is imported and configured on first use.
+    One model client per model name is created and reused for every request.
+    """
+    
+    name = "gemini"
+    
+    def __init__(self):
+        self._genai = None
+        self._models = {}
+        self._lock = threading.Lock()
+    
+    def client(self):
+        with self._lock:
+            if self._genai is None:
+                import google.generativeai as genai
+                import streamlit as st
+                genai.configure(api_key=st.secrets["API_KEY"])
+                self._genai = genai
+            return self._genai
+    
+    def model(self, model_name):
+        genai = self.client()
+        with self._lock:
+            if model_name not in self._models:
+                self._models[model_name] = genai.GenerativeModel(model_name)
+            return self._models[model_name]
+    
+    def warm_up(self):
+        self.client()
+    
+    def generate(self, model_name, prompt, timeout=None):
+        return self.model(model_name).generate_content(prompt, request_options=_request_options(timeout)).text
+    
+    def stream(self, model_name, prompt, timeout=None):
+        response = self.model(model_name).generate_content(
+            prompt, stream=True, request_options=_request_options(timeout)
+        )
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # Chunk without text parts, e.g. the final finish-reason chunk
+            if text:
+                yield text
+
+def _request_options(timeout):
+    return {'timeout': timeout} if timeout else None
+
+class OfflineRateLimitError(RuntimeError):
+    """Simulated HTTP 429 from the offline provider"""
+    
+    code = 429
+
+class LatencyModel:
+    """
+    Random delay drawn from a distribution given as a spec string:
+    "fixed:MS", "uniform:MIN_MS:MAX_MS", "lognormal:MEDIAN_MS:SIGMA" or "exponential:MEAN_MS".
+    """
+    
+    def __init__(self, spec, rng=None):
+        self.spec = spec
+        kind, *params = spec.split(":")
+        try:
+            params = [float(p) for p in params]
+        except ValueError:
+            raise ValueError(f"Invalid latency spec: {spec}")
+        expected = {'fixed': 1, 'uniform': 2, 'lognormal': 2, 'exponential': 1}
+        if kind not in expected or len(params) != expected[kind]:
+            raise ValueError(f"Invalid latency spec: {spec}")
+        self.kind = kind
+        self.params = params
+        self.rng = rng or random.Random()
+    
+    def sample(self):
+        """Return one delay in seconds."""
+        if self.kind == 'fixed':
+            ms = self.params[0]
+        elif self.kind == 'uniform':
+            ms = self.rng.uniform(*self.params)
+        elif self.kind == 'lognormal':
+            median_ms, sigma = self.params
+            ms = median_ms * self.rng.lognormvariate(0, sigma)
+        else:
+            ms = self.rng.expovariate(1 / self.params[0]) if self.params[0] > 0 else 0
+        return max(ms, 0) / 1000
+
+class OfflineProvider:
+    """
+    Local stand-in for load tests and offline development; no network or API key.
+    Quiz prompts get well-formed QUESTION:/A)/CORRECT:/EXPLANATION: blocks, gap
+    prompts a short topic list (numbered per interaction when batched) and
+    everything else a canned answer, after a delay
+    drawn from `latency` (whole response, or first delta when streaming) and
+    `token_latency` (each further delta). A share `error_rate` of calls fails with
+    a simulated rate-limit error instead.
+    """
+    
+    name = "offline"
+    
+    def __init__(self, latency=LLM_OFFLINE_LATENCY, token_latency=LLM_OFFLINE_TOKEN_LATENCY,
+                 seed=None, error_rate=LLM_OFFLINE_ERROR_PERCENT / 100):
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.latency = LatencyModel(latency, self._rng)
+        self.token_latency = LatencyModel(token_latency, self._rng)
+        self.error_rate = error_rate
+    
+    def warm_up(self):
+        pass
+    
+    def generate(self, model_name, prompt, timeout=None):
+        _pause(self._sample(self.latency))
+        self._maybe_fail()
+        return self.respond(prompt)
+    
+    def stream(self, model_name, prompt, timeout=None):
+        text = self.respond(prompt)
+        _pause(self._sample(self.latency))
+        self._maybe_fail()
+        # Deltas of a few words, roughly the size of the SDK's streamed chunks
+        words = re.findall(r"\S+\s*", text)
+        for start in range(0, len(words), 8):
+            if start:
+                _pause(self._sample(self.token_latency))
+            yield "".join(words[start:start + 8])
+    
+    def respond(self, prompt):
+        """Return a response in the shape the calling code expects for `prompt`."""
+        if "QUESTION:" in prompt:
+            match = re.search(r"generate (\d+) multiple-choice", prompt)
+            topic = re.search(r"Topic Focus: (.*)", prompt)
+            return self._quiz(int(match.group(1)) if match else 5, topic.group(1).strip() if topic else "the material")
+        question = re.search(r"Student Question: (.*)", prompt)
+        if question:
+            return self._answer(question.group(1).strip())
+        # Only gap prompts quote the answer; answer prompts mention "knowledge gaps" too
+        if "Answer given:" in prompt:
+            questions = re.findall(r"Question: (.*)", prompt) or [""]
+            if re.search(r"^\s*Interaction \d+:", prompt, re.M):
+                # Batched analysis: each line is prefixed with its interaction number
+                return "\n".join(
+                    f"[{n}] {gap}" for n, question in enumerate(questions, 1) for gap in self._gaps(question)
+                )
+            return "\n".join(self._gaps(questions[0]))
+        return self._answer("your question")
+    
+    def _quiz(self, num_questions, topic):
+        with self._rng_lock:
+            letters = [self._rng.choice("ABCD") for _ in range(num_questions)]
+        blocks = []
+        for i, correct in enumerate(letters, 1):
+            blocks.append("\n".join([
+                f"QUESTION: Which statement about {topic} (part {i}) is correct?",
+                *(f"{letter}) Statement {letter} about {topic}, part {i}" for letter in "ABCD"),
+                f"CORRECT: {correct}",
+                f"EXPLANATION: Statement {correct} matches the course material on {topic}.",
+                "---"
+            ]))
+        return "\n".join(blocks)
+    
+    def _gaps(self, question):
+        words = [w for w in question.split() if len(w) > 3]
+        return [f"Review: {w.strip('?.,!').lower()}" for w in words[:3]] or ["Review: core concepts"]
+    
+    def _answer(self, question):
+        sentences = [
+            f"Here is an explanation of {question.rstrip('?')} based on your course material.",
+            "The key idea is introduced first, followed by the details that support it.",
+            "An example helps connect the definition to how it is used in practice.",
+            "Keep in mind how this relates to the topics you studied earlier.",
+            "Can you explain the main idea in your own words?"
+        ]
+        return " ".join(sentences)
+    
+    def _sample(self, model):
+        with self._rng_lock:
+            return model.sample()
+    
+    def _maybe_fail(self):
+        if self.error_rate > 0:
+            with self._rng_lock:
+                failed = self._rng.random() < self.error_rate
+            if failed:
+                raise OfflineRateLimitError("429 Resource has been exhausted (simulated)")
+
+def _pause(seconds):
+    # sleep(0) still yields the GIL, which dominates stubbed calls in benchmarks
+    if seconds > 0:
+        time.sleep(seconds)
+
+PROVIDERS = {'gemini': GeminiProvider, 'offline': OfflineProvider}
+
+_provider = None
+_provider_lock = threading.Lock()
+
+def get_provider():
+    """Return the process-wide provider selected by LYRA_LLM_PROVIDER."""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            if LLM_PROVIDER not in PROVIDERS:
+                raise ValueError(f"Unknown LLM provider: {LLM_PROVIDER}")
+            _provider = PROVIDERS[LLM_PROVIDER]()
+        return _provider
+
+def set_provider(provider):
+    """Replace the process-wide provider, e.g. with an OfflineProvider in tools."""
+    global _provider
+    with _provider_lock:
+        _provider = provider
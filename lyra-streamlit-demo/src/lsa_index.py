@@ -0,0 +1,64 @@
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.decomposition import TruncatedSVD
+import numpy as np
+
+from config import LSA_DIMENSIONS
+from vector_store import VECTORIZER_PARAMS
+
+class LSAVectorizer:
+    """
+    TF-IDF followed by a truncated SVD projection (latent semantic analysis).
+    transform() returns L2-normalized float32 rows, so the dot product with the
+    index rows from build_lsa_index is the cosine similarity in the reduced space.
+    """
+    
+    def __init__(self, tfidf, components):
+        self.tfidf = tfidf
+        # (dimensions, terms), or None when the space is too small to reduce
+        self.components = components
+    
+    @property
+    def vocabulary_(self):
+        return self.tfidf.vocabulary_
+    
+    @property
+    def dimensions(self):
+        return len(self.tfidf.vocabulary_) if self.components is None else self.components.shape[0]
+    
+    @property
+    def nbytes(self):
+        return 0 if self.components is None else self.components.nbytes
+    
+    def transform(self, texts):
+        return self.project(self.tfidf.transform(texts))
+    
+    def project(self, tfidf_rows):
+        if self.components is None:
+            rows = tfidf_rows.toarray()
+        else:
+            rows = tfidf_rows @ self.components.T
+        rows = np.ascontiguousarray(rows, dtype=np.float32)
+        norms = np.linalg.norm(rows, axis=1, keepdims=True)
+        # Rows without any known term stay zero and score 0 against everything
+        np.divide(rows, norms, out=rows, where=norms > 0)
+        return rows
+
+def build_lsa_index(chunks, dimensions=LSA_DIMENSIONS, random_state=0):
+    """
+    Fit TF-IDF and an SVD projection to `dimensions` on `chunks`.
+    Returns: (embeddings, vectorizer) where embeddings is one C-contiguous float32
+    array of shape (len(chunks), dimensions) with L2-normalized rows
+    """
+    tfidf = TfidfVectorizer(**VECTORIZER_PARAMS)
+    matrix = tfidf.fit_transform(chunks)
+    
+    if dimensions < min(matrix.shape):
+        svd = TruncatedSVD(n_components=dimensions, algorithm="randomized", random_state=random_state)
+        svd.fit(matrix)
+        components = np.ascontiguousarray(svd.components_, dtype=np.float32)
+    else:
+        # Reducing would not shrink the rows; keep the exact TF-IDF space, densified
+        components = None
+    
+    vectorizer = LSAVectorizer(tfidf, components)
+    return vectorizer.project(matrix), vectorizer
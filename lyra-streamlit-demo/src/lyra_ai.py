@@ -1,12 +1,21 @@
-import google.generativeai as genai
 import streamlit as st
+import re
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait
+from llm import generate_text, stream_text
+from config import CONTEXT_TOKEN_BUDGETS
+from context_packer import trim_to_tokens
+from metrics import increment, span
+from profile_store import record_event, save_profile_state
 
-# Configure Gemini API
-genai.configure(api_key=st.secrets["API_KEY"])
+# Shared by all sessions for model calls that run alongside or after the answer
+_background_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="lyra-ai")
 
-def generate_personalized_answer(context, query, student_profile):
-    """Generate answer adapted to student's learning pace and history"""
+# List markers and punctuation models put around gap topics
+GAP_MARKERS = " -*•.,;:"
+
+def build_answer_prompt(context, query, student_profile):
+    """Build the answer prompt adapted to student's learning pace and history"""
     
     learning_pace = student_profile['learning_pace']
     
@@ -33,33 +42,46 @@ Student Question: {query}
 
 Provide a clear, accurate answer. If this topic relates to any known knowledge gaps, gently reinforce those concepts. End with a brief follow-up question to check understanding (optional, only if appropriate).
 """
-    
-    response = genai.GenerativeModel("gemini-2.0-flash").generate_content(prompt)
-    return response.text
+    return prompt
+
+def generate_personalized_answer(context, query, student_profile):
+    """Generate answer adapted to student's learning pace and history"""
+    prompt = build_answer_prompt(context, query, student_profile)
+    with span("answer.generate"):
+        return generate_text("gemini-2.0-flash", prompt)
+
+def stream_personalized_answer(context, query, student_profile):
+    """Yield the personalized answer as text deltas while the model generates it"""
+    prompt = build_answer_prompt(context, query, student_profile)
+    # Covers the whole stream, including the time the UI takes to render each delta
+    with span("answer.stream"):
+        yield from stream_text("gemini-2.0-flash", prompt)
 
-def analyze_learning_patterns(query, answer_quality=None):
+def analyze_learning_patterns(query, answer_quality=None, profile=None):
     """Track student's learning patterns and identify knowledge gaps"""
-    st.session_state.student_profile['interaction_count'] += 1
+    if profile is None:
+        profile = st.session_state.student_profile
+    profile['interaction_count'] += 1
     
     # Extract topic from query (simple keyword extraction)
     topics = extract_topics(query)
     
     # Record study session
-    st.session_state.student_profile['study_history'].append({
+    record_event(profile, 'study_session', {
         'timestamp': datetime.now().isoformat(),
         'query': query,
         'topics': topics
     })
     
     # Adjust learning pace based on interaction patterns
-    if st.session_state.student_profile['interaction_count'] > 10:
-        recent_sessions = st.session_state.student_profile['study_history'][-10:]
-        avg_time_between = calculate_avg_study_frequency(recent_sessions)
-        
+    avg_time_between = profile['aggregates']['study_interval_ewma']
+    if profile['interaction_count'] > 10 and avg_time_between is not None:
         if avg_time_between < 3600:  # Less than 1 hour
-            st.session_state.student_profile['learning_pace'] = 'fast'
+            profile['learning_pace'] = 'fast'
         elif avg_time_between > 86400:  # More than 1 day
-            st.session_state.student_profile['learning_pace'] = 'slow'
+            profile['learning_pace'] = 'slow'
+    
+    save_profile_state(profile)
 
 def extract_topics(query):
     """Simple topic extraction (can be enhanced with NLP)"""
@@ -67,21 +89,13 @@ def extract_topics(query):
     stop_words = {'what', 'how', 'why', 'when', 'where', 'is', 'are', 'the', 'a', 'an'}
     return [word for word in keywords if word not in stop_words and len(word) > 3]
 
-def calculate_avg_study_frequency(sessions):
-    """Calculate average time between study sessions"""
-    if len(sessions) < 2:
-        return 0
-    times = [datetime.fromisoformat(s['timestamp']) for s in sessions]
-    diffs = [(times[i+1] - times[i]).total_seconds() for i in range(len(times)-1)]
-    return sum(diffs) / len(diffs) if diffs else 0
-
 def identify_knowledge_gaps(context, query, answer):
     """Use AI to identify potential knowledge gaps"""
     gap_prompt = f"""
     Analyze this student interaction and identify any knowledge gaps:
     
     Question: {query}
-    Context available: {context[:500]}...
+    Context available: {trim_to_tokens(context, CONTEXT_TOKEN_BUDGETS['gaps'])}...
     Answer given: {answer}
     
     List 1-3 specific topics the student might need to review. Be concise.
@@ -89,8 +103,86 @@ def identify_knowledge_gaps(context, query, answer):
     """
     
     try:
-        response = genai.GenerativeModel("gemini-2.0-flash-exp").generate_content(gap_prompt)
-        gaps = [line.strip() for line in response.text.split('\n') if line.strip()]
+        with span("gaps.identify"):
+            response_text = generate_text("gemini-2.0-flash-exp", gap_prompt)
+        gaps = [line.strip() for line in response_text.split('\n') if line.strip()]
         return gaps[:3]
-    except:
+    except Exception:
+        # Gap analysis is best effort: the answer was already shown
+        increment("gap_analysis_failures")
         return []
+
+def identify_knowledge_gaps_batch(interactions):
+    """
+    Identify knowledge gaps in several interactions, given as (context, query, answer)
+    tuples, with one model call. Returns a list of up to 3 gaps per interaction.
+    """
+    if len(interactions) == 1:
+        return [identify_knowledge_gaps(*interactions[0])]
+    
+    sections = "\n".join(
+        f"""
+    Interaction {n}:
+    Question: {query}
+    Context available: {trim_to_tokens(context, CONTEXT_TOKEN_BUDGETS['gaps'])}...
+    Answer given: {answer}
+    """
+        for n, (context, query, answer) in enumerate(interactions, 1)
+    )
+    gap_prompt = f"""
+    Analyze these student interactions and identify any knowledge gaps in each:
+    {sections}
+    For each interaction, list 1-3 specific topics the student might need to review. Be concise.
+    Format: one topic per line, starting with the interaction number in brackets, e.g. "[2] Recursion base cases".
+    """
+    
+    try:
+        with span("gaps.identify_batch"):
+            response_text = generate_text("gemini-2.0-flash-exp", gap_prompt)
+    except Exception:
+        increment("gap_analysis_failures")
+        return [[] for _ in interactions]
+    
+    gaps = [[] for _ in interactions]
+    for line in response_text.split('\n'):
+        match = re.match(r"\W*\[(\d+)\]\s*(.+)", line)
+        if match and 1 <= int(match.group(1)) <= len(interactions):
+            topics = gaps[int(match.group(1)) - 1]
+            if len(topics) < 3:
+                topics.append(match.group(2).strip())
+    return gaps
+
+def run_in_background(fn, *args, **kwargs):
+    """Run fn on the shared background pool and return its Future"""
+    return _background_pool.submit(fn, *args, **kwargs)
+
+def collect_knowledge_gaps(pending, profile, timeout=0):
+    """
+    Merge finished background gap analyses into the student profile.
+    Finished futures are removed from `pending`; unfinished ones are left for a
+    later call. Waits up to `timeout` seconds (None waits for all of them).
+    Returns the list of newly merged gaps.
+    """
+    if not pending:
+        return []
+    done, _ = wait(pending, timeout=timeout)
+    # A turn queued twice shares one Future, which may be listed twice
+    finished = [future for future in dict.fromkeys(pending) if future in done]
+    pending[:] = [future for future in pending if future not in done]
+    
+    # A gap found in several interactions, or differing from a known one only in
+    # case, punctuation or a list marker, is recorded once under its known spelling
+    known = {_gap_key(gap): gap for gap in profile['knowledge_gaps']}
+    new_gaps = {}
+    for future in finished:
+        if future.exception() is None:
+            for gap in future.result():
+                key = _gap_key(gap)
+                if key and key not in new_gaps:
+                    new_gaps[key] = known.get(key, gap.strip(GAP_MARKERS))
+    for gap in new_gaps.values():
+        record_event(profile, 'knowledge_gap', gap)
+    return list(new_gaps.values())
+
+def _gap_key(gap):
+    return " ".join(gap.strip(GAP_MARKERS).lower().split())
@@ -0,0 +1,188 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+from config import METRICS_ENABLED, METRICS_JSONL_PATH, METRICS_PROMETHEUS_PATH
+
+# Upper bounds, in seconds, of the Prometheus histogram buckets for span durations
+SPAN_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Completed spans kept for the debug panel
+RECENT_SPANS = 50
+
+class _NullSpan:
+    """Span used while metrics are disabled; entering and leaving it does nothing."""
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(self.name, time.perf_counter() - self.start, failed=exc_type is not None)
+        return False
+
+class _SpanStats:
+    __slots__ = ('count', 'total', 'max', 'last', 'failures', 'buckets')
+    
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.failures = 0
+        self.buckets = [0] * len(SPAN_BUCKETS)
+
+class MetricsRegistry:
+    """
+    Process-wide timing spans and counters.
+    Span durations are aggregated per stage name (count, total, max, last and a
+    fixed-bucket histogram); counters are plain running totals.
+    """
+    
+    def __init__(self, jsonl_path=None):
+        self.jsonl_path = jsonl_path or None
+        self._spans = {}
+        self._counters = {}
+        self._recent = deque(maxlen=RECENT_SPANS)
+        self._lock = threading.Lock()
+    
+    def observe(self, name, seconds, failed=False):
+        """Record one completed span of `seconds`."""
+        now = time.time()
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                stats = self._spans[name] = _SpanStats()
+            stats.count += 1
+            stats.total += seconds
+            stats.max = max(stats.max, seconds)
+            stats.last = seconds
+            stats.failures += failed
+            for i, bound in enumerate(SPAN_BUCKETS):
+                if seconds <= bound:
+                    stats.buckets[i] += 1
+                    break
+            self._recent.append((now, name, seconds, failed))
+        if self.jsonl_path:
+            self._append_jsonl({'time': now, 'span': name, 'seconds': seconds, 'failed': failed})
+    
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+    
+    def snapshot(self):
+        """Return {'spans': {name: {...}}, 'counters': {...}, 'recent': [...]} for display."""
+        with self._lock:
+            spans = {
+                name: {
+                    'count': stats.count,
+                    'mean_ms': stats.total / stats.count * 1000,
+                    'last_ms': stats.last * 1000,
+                    'max_ms': stats.max * 1000,
+                    'failures': stats.failures
+                }
+                for name, stats in sorted(self._spans.items())
+            }
+            recent = [
+                {'time': at, 'span': name, 'ms': seconds * 1000, 'failed': failed}
+                for at, name, seconds, failed in reversed(self._recent)
+            ]
+            return {'spans': spans, 'counters': dict(sorted(self._counters.items())), 'recent': recent}
+    
+    def to_jsonl(self):
+        """Current aggregates as JSON lines: one per span name, then one per counter."""
+        snapshot = self.snapshot()
+        lines = [json.dumps(dict(span=name, **stats)) for name, stats in snapshot['spans'].items()]
+        lines += [json.dumps({'counter': name, 'value': value}) for name, value in snapshot['counters'].items()]
+        return "\n".join(lines) + "\n"
+    
+    def to_prometheus(self):
+        """Current aggregates in the Prometheus text exposition format."""
+        lines = [
+            "# HELP lyra_stage_seconds Time spent in each processing stage.",
+            "# TYPE lyra_stage_seconds histogram"
+        ]
+        with self._lock:
+            for name, stats in sorted(self._spans.items()):
+                label = _prometheus_label(name)
+                cumulative = 0
+                for bound, count in zip(SPAN_BUCKETS, stats.buckets):
+                    cumulative += count
+                    lines.append(f'lyra_stage_seconds_bucket{{stage="{label}",le="{bound}"}} {cumulative}')
+                lines.append(f'lyra_stage_seconds_bucket{{stage="{label}",le="+Inf"}} {stats.count}')
+                lines.append(f'lyra_stage_seconds_sum{{stage="{label}"}} {stats.total}')
+                lines.append(f'lyra_stage_seconds_count{{stage="{label}"}} {stats.count}')
+            lines.append("# HELP lyra_stage_failures_total Stages that ended with an exception.")
+            lines.append("# TYPE lyra_stage_failures_total counter")
+            for name, stats in sorted(self._spans.items()):
+                lines.append(f'lyra_stage_failures_total{{stage="{_prometheus_label(name)}"}} {stats.failures}')
+            lines.append("# HELP lyra_events_total Counted events, by name.")
+            lines.append("# TYPE lyra_events_total counter")
+            for name, value in sorted(self._counters.items()):
+                lines.append(f'lyra_events_total{{name="{_prometheus_label(name)}"}} {value}')
+        return "\n".join(lines) + "\n"
+    
+    def write_prometheus(self, path):
+        """Atomically replace `path` with the Prometheus text, for a textfile collector."""
+        directory = os.path.dirname(os.path.abspath(path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(self.to_prometheus())
+            os.replace(tmp_path, path)
+        except OSError:
+            pass  # Export is best effort; the in-process metrics are unaffected
+    
+    def _append_jsonl(self, record):
+        try:
+            with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError:
+            pass
+
+def _prometheus_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+_registry = MetricsRegistry(METRICS_JSONL_PATH) if METRICS_ENABLED else None
+
+def enabled():
+    return _registry is not None
+
+def get_metrics():
+    """Return the process-wide registry, or None while metrics are disabled."""
+    return _registry
+
+def span(name):
+    """
+    Context manager timing one stage under `name`.
+    Returns a shared no-op span when metrics are disabled.
+    """
+    if _registry is None:
+        return _NULL_SPAN
+    return _Span(_registry, name)
+
+def increment(name, amount=1):
+    """Add `amount` to the counter `name`; does nothing when metrics are disabled."""
+    if _registry is not None:
+        _registry.increment(name, amount)
+
+def export_prometheus():
+    """Write the Prometheus text file if one is configured."""
+    if _registry is not None and METRICS_PROMETHEUS_PATH:
+        _registry.write_prometheus(METRICS_PROMETHEUS_PATH)
@@ -0,0 +1,228 @@
+import json
+import sqlite3
+import threading
+import time
+
+from config import PROFILE_DB_PATH, PROFILE_RECENT_WINDOW
+from progress_aggregates import new_aggregates, update_aggregates
+from utils import generate_random_id
+
+# Scores kept in session per topic; older attempts are paged in from the store
+SCORES_PER_TOPIC = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    profile_id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    profile_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    topic TEXT,
+    value REAL,
+    payload TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_by_kind ON events (profile_id, kind, id);
+CREATE INDEX IF NOT EXISTS events_by_topic ON events (profile_id, kind, topic, id);
+"""
+
+# Profile fields persisted as a snapshot; list fields are rebuilt from events
+STATE_FIELDS = ('interaction_count', 'learning_pace', 'strong_topics', 'aggregates')
+
+class ProfileStore:
+    """
+    SQLite-backed student profiles.
+    History is an append-only event log per profile; scalar fields are stored as
+    a snapshot that is overwritten on change.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+    
+    def _connect(self):
+        # One connection per thread; sqlite3 connections must not be shared
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+    
+    def create_profile(self, profile_id, state):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO profiles (profile_id, created, state) VALUES (?, ?, ?)",
+                (profile_id, time.time(), json.dumps(state))
+            )
+    
+    def load_state(self, profile_id):
+        row = self._connect().execute(
+            "SELECT state FROM profiles WHERE profile_id = ?", (profile_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def save_state(self, profile_id, state):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE profiles SET state = ? WHERE profile_id = ?",
+                (json.dumps(state), profile_id)
+            )
+    
+    def append(self, profile_id, kind, payload, topic=None, value=None, state=None):
+        """Append an event, updating the state snapshot in the same transaction if given."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO events (profile_id, kind, topic, value, payload, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (profile_id, kind, topic, value, json.dumps(payload), time.time())
+            )
+            if state is not None:
+                conn.execute(
+                    "UPDATE profiles SET state = ? WHERE profile_id = ?",
+                    (json.dumps(state), profile_id)
+                )
+    
+    def events(self, profile_id):
+        """Yield (kind, payload, topic, value) for every event of the profile, oldest first."""
+        rows = self._connect().execute(
+            "SELECT kind, payload, topic, value FROM events WHERE profile_id = ? ORDER BY id", (profile_id,)
+        )
+        for kind, payload, topic, value in rows:
+            yield kind, json.loads(payload), topic, value
+    
+    def page(self, profile_id, kind, limit, offset=0, topic=None):
+        """Return up to `limit` event payloads, newest first, skipping `offset`."""
+        query = "SELECT payload FROM events WHERE profile_id = ? AND kind = ?"
+        params = [profile_id, kind]
+        if topic is not None:
+            query += " AND topic = ?"
+            params.append(topic)
+        query += " ORDER BY id DESC LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        return [json.loads(row[0]) for row in self._connect().execute(query, params)]
+    
+    def recent(self, profile_id, kind, limit, topic=None):
+        """Return the latest `limit` event payloads, oldest first."""
+        return list(reversed(self.page(profile_id, kind, limit, topic=topic)))
+    
+    def count(self, profile_id, kind, topic=None):
+        query = "SELECT COUNT(*) FROM events WHERE profile_id = ? AND kind = ?"
+        params = [profile_id, kind]
+        if topic is not None:
+            query += " AND topic = ?"
+            params.append(topic)
+        return self._connect().execute(query, params).fetchone()[0]
+    
+    def topics(self, profile_id, kind, limit=None):
+        """Return the distinct topics of `kind` events, most recently used last."""
+        query = (
+            "SELECT topic FROM events WHERE profile_id = ? AND kind = ? AND topic IS NOT NULL "
+            "GROUP BY topic ORDER BY MAX(id) DESC"
+        )
+        params = [profile_id, kind]
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        return list(reversed([row[0] for row in self._connect().execute(query, params)]))
+    
+    def average(self, profile_id, kind):
+        """Return the mean `value` of `kind` events, or None if there are none."""
+        return self._connect().execute(
+            "SELECT AVG(value) FROM events WHERE profile_id = ? AND kind = ?", (profile_id, kind)
+        ).fetchone()[0]
+
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+def get_profile_store():
+    """Return the profile store shared by every session in this process."""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = ProfileStore(PROFILE_DB_PATH)
+        return _shared_store
+
+def append_bounded(items, item, limit=PROFILE_RECENT_WINDOW):
+    """Append to a session list, keeping only the latest `limit` items."""
+    items.append(item)
+    del items[:-limit]
+
+def new_profile():
+    """Create and persist an empty profile with a fresh ID."""
+    profile = {
+        'profile_id': generate_random_id(16),
+        'knowledge_gaps': [],
+        'strong_topics': [],
+        'interaction_count': 0,
+        'learning_pace': 'moderate',
+        'study_history': [],
+        'exam_scores': {},
+        'aggregates': new_aggregates()
+    }
+    get_profile_store().create_profile(profile['profile_id'], _state_of(profile))
+    return profile
+
+def load_profile(profile_id):
+    """Load a profile with only its recent history in memory; None if unknown."""
+    store = get_profile_store()
+    state = store.load_state(profile_id)
+    if state is None:
+        return None
+    
+    profile = {'profile_id': profile_id}
+    profile.update(state)
+    if 'aggregates' not in profile:
+        # Profile saved before aggregates existed: replay its log once
+        profile['aggregates'] = new_aggregates()
+        for kind, payload, topic, value in store.events(profile_id):
+            update_aggregates(profile['aggregates'], kind, payload, topic=topic, value=value)
+        store.save_state(profile_id, _state_of(profile))
+    profile['study_history'] = store.recent(profile_id, 'study_session', PROFILE_RECENT_WINDOW)
+    profile['knowledge_gaps'] = store.recent(profile_id, 'knowledge_gap', PROFILE_RECENT_WINDOW)
+    profile['exam_scores'] = {
+        topic: store.recent(profile_id, 'exam_score', SCORES_PER_TOPIC, topic=topic)
+        for topic in store.topics(profile_id, 'exam_score', limit=PROFILE_RECENT_WINDOW)
+    }
+    return profile
+
+def load_conversations(profile_id):
+    """Return the profile's recent conversation entries, oldest first."""
+    return get_profile_store().recent(profile_id, 'conversation', PROFILE_RECENT_WINDOW)
+
+def record_event(profile, kind, payload, topic=None, value=None):
+    """
+    Append an event to the profile's log and to its bounded in-session view,
+    and fold it into the profile's aggregates.
+    Profiles without a 'profile_id' (e.g. in offline tools) are only updated in memory.
+    """
+    aggregates = profile.setdefault('aggregates', new_aggregates())
+    update_aggregates(aggregates, kind, payload, topic=topic, value=value)
+    
+    if kind == 'study_session':
+        append_bounded(profile['study_history'], payload)
+    elif kind == 'knowledge_gap':
+        append_bounded(profile['knowledge_gaps'], payload)
+    elif kind == 'exam_score':
+        scores = profile['exam_scores'].pop(topic, [])
+        append_bounded(scores, payload, SCORES_PER_TOPIC)
+        profile['exam_scores'][topic] = scores  # Most recently used topic last
+        while len(profile['exam_scores']) > PROFILE_RECENT_WINDOW:
+            del profile['exam_scores'][next(iter(profile['exam_scores']))]
+    
+    if 'profile_id' in profile:
+        get_profile_store().append(
+            profile['profile_id'], kind, payload, topic=topic, value=value, state=_state_of(profile)
+        )
+
+def save_profile_state(profile):
+    """Persist the profile's scalar fields."""
+    if 'profile_id' in profile:
+        get_profile_store().save_state(profile['profile_id'], _state_of(profile))
+
+def _state_of(profile):
+    return {field: profile[field] for field in STATE_FIELDS}
@@ -0,0 +1,79 @@
+from datetime import datetime
+
+# Smoothing for the study interval EWMA; about the weight of a 10-session window
+STUDY_INTERVAL_ALPHA = 2 / (10 + 1)
+
+# Distinct knowledge gaps tracked; the least recently seen one is dropped first
+MAX_TRACKED_GAPS = 200
+
+def new_aggregates():
+    """Return empty progress aggregates."""
+    return {
+        'score_count': 0,
+        'score_mean': 0.0,
+        'topics': {},  # topic -> {'count', 'mean', 'latest'}, least recently scored first
+        'gaps': {},  # gap -> {'count', 'last_seen'}, least recently seen first
+        'gap_events': 0,
+        'study_interval_ewma': None,
+        'last_study_time': None
+    }
+
+def update_aggregates(aggregates, kind, payload, topic=None, value=None):
+    """Fold one profile event into the aggregates in constant time."""
+    if kind == 'exam_score':
+        _add_score(aggregates, topic, payload['score'])
+    elif kind == 'knowledge_gap':
+        _add_gap(aggregates, payload)
+    elif kind == 'study_session':
+        _add_study_session(aggregates, datetime.fromisoformat(payload['timestamp']).timestamp())
+
+def _add_score(aggregates, topic, score):
+    aggregates['score_count'] += 1
+    aggregates['score_mean'] += (score - aggregates['score_mean']) / aggregates['score_count']
+    
+    stats = aggregates['topics'].pop(topic, None) or {'count': 0, 'mean': 0.0, 'latest': None}
+    stats['count'] += 1
+    stats['mean'] += (score - stats['mean']) / stats['count']
+    stats['latest'] = score
+    aggregates['topics'][topic] = stats  # Re-inserted so the order tracks recency
+
+def _add_gap(aggregates, gap):
+    aggregates['gap_events'] += 1
+    gaps = aggregates['gaps']
+    stats = gaps.pop(gap, None) or {'count': 0, 'last_seen': 0}
+    stats['count'] += 1
+    stats['last_seen'] = aggregates['gap_events']
+    gaps[gap] = stats
+    if len(gaps) > MAX_TRACKED_GAPS:
+        del gaps[next(iter(gaps))]
+
+def _add_study_session(aggregates, timestamp):
+    last = aggregates['last_study_time']
+    aggregates['last_study_time'] = timestamp
+    if last is None:
+        return
+    interval = max(timestamp - last, 0.0)
+    ewma = aggregates['study_interval_ewma']
+    if ewma is None:
+        aggregates['study_interval_ewma'] = interval
+    else:
+        aggregates['study_interval_ewma'] = ewma + STUDY_INTERVAL_ALPHA * (interval - ewma)
+
+def recent_topic_scores(aggregates, limit):
+    """Return (topic, stats) for the `limit` most recently scored topics, newest first."""
+    topics = aggregates['topics']
+    result = []
+    for topic in reversed(topics):
+        if len(result) == limit:
+            break
+        result.append((topic, topics[topic]))
+    return result
+
+def recent_gaps(aggregates, limit):
+    """Return the `limit` most recently seen distinct knowledge gaps, newest first."""
+    result = []
+    for gap in reversed(aggregates['gaps']):
+        if len(result) == limit:
+            break
+        result.append(gap)
+    return result
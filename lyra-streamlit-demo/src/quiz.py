@@ -1,14 +1,23 @@
-import google.generativeai as genai
+import re
+import threading
 import streamlit as st
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from llm import generate_text, stream_text
+from metrics import span
+from profile_store import record_event
+from quiz_pool import question_fingerprint
 
-# Configure Gemini API
-genai.configure(api_key=st.secrets["API_KEY"])
+QUIZ_MODEL = "gemini-2.0-flash"
+OPTION_LETTERS = ['A', 'B', 'C', 'D']
+CORRECT_LETTER = re.compile(r'\[?([A-D])(?:[\]).:\s]|$)')
 
-def generate_practice_questions(context, topic, num_questions=5):
-    """Generate practice questions based on course material"""
-    
-    prompt = f"""
+# Re-requests for malformed or missing questions; these jobs never wait on each other
+_replacement_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="lyra-quiz")
+
+def build_quiz_prompt(context, topic, num_questions):
+    """Build the prompt asking for `num_questions` questions in the parseable format"""
+    return f"""
 Based on the following course material, generate {num_questions} multiple-choice questions for exam preparation.
 
 Course Material:
@@ -28,15 +37,182 @@ EXPLANATION: [brief explanation]
 
 Generate {num_questions} questions now.
 """
-    
+
+def generate_practice_questions(context, topic, num_questions=5, use_cache=True):
+    """
+    Generate practice questions based on course material.
+    Pass use_cache=False to get fresh questions instead of a cached quiz for the same prompt.
+    """
     try:
-        response = genai.GenerativeModel("gemini-2.0-flash").generate_content(prompt)
-        questions = parse_quiz_questions(response.text)
-        return questions
+        return list(stream_practice_questions(context, topic, num_questions, use_cache=use_cache))
     except Exception as e:
         st.error(f"Error generating questions: {e}")
         return []
 
+def stream_practice_questions(context, topic, num_questions=5, use_cache=True, seen=()):
+    """
+    Yield validated practice questions as soon as each one is complete.
+    Each malformed question, or one whose fingerprint is in `seen` (e.g. from a cached
+    quiz the student already took), is re-requested on its own as soon as it is
+    detected, and any shortfall is requested once the main response ends; replacements
+    are yielded last, skipping any that were seen too.
+    """
+    parser = QuizStreamParser(seen)
+    replacements = []
+    emitted = 0
+    
+    def request_replacements():
+        # One single-question request per rejected question, at most num_questions overall
+        while len(replacements) < min(len(parser.rejected), num_questions):
+            replacements.append(_replacement_pool.submit(_generate_questions, context, topic, 1))
+    
+    # Covers the main response including the time the caller spends between questions
+    with span("quiz.generate"):
+        deltas = stream_text(QUIZ_MODEL, build_quiz_prompt(context, topic, num_questions), use_cache=use_cache)
+        for delta in deltas:
+            for question in parser.feed(delta):
+                if emitted < num_questions:
+                    emitted += 1
+                    yield question
+            request_replacements()
+        for question in parser.close():
+            if emitted < num_questions:
+                emitted += 1
+                yield question
+        request_replacements()
+    
+    shortfall = num_questions - emitted - len(replacements)
+    if shortfall > 0:
+        replacements.append(_replacement_pool.submit(_generate_questions, context, topic, shortfall))
+    
+    for future in as_completed(replacements):
+        try:
+            questions = future.result()
+        except Exception:
+            continue  # Replacements are best effort; the quiz just has fewer questions
+        for question in questions:
+            if emitted < num_questions and question_fingerprint(question) not in seen:
+                emitted += 1
+                yield question
+
+def _generate_questions(context, topic, num_questions):
+    # Fresh request: a cached response would repeat the same questions
+    parser = QuizStreamParser()
+    text = generate_text(QUIZ_MODEL, build_quiz_prompt(context, topic, num_questions), use_cache=False)
+    return (parser.feed(text) + parser.close())[:num_questions]
+
+def validate_question(question):
+    """Return None if `question` is complete and well formed, else the reason it is not"""
+    if not question.get('question'):
+        return "missing question text"
+    if [option[0] for option in question.get('options', [])] != OPTION_LETTERS:
+        return "options must be A) to D), once each"
+    if question.get('correct') not in OPTION_LETTERS:
+        return "correct answer must be a letter from A to D"
+    return None
+
+class QuizStreamParser:
+    """
+    Incremental parser for quiz text that arrives in arbitrary deltas.
+    feed() and close() return the questions completed so far; a question completes
+    at its '---' line (or at the next QUESTION: line, or the end of the text).
+    Questions that fail validate_question, or whose fingerprint is in `seen`, are
+    kept in `rejected` as (question, reason).
+    """
+    
+    def __init__(self, seen=()):
+        self._buffer = ""
+        self._current = {}
+        self.rejected = []
+        self.seen = seen
+    
+    def feed(self, text):
+        """Consume a delta; return the questions it completed"""
+        lines = (self._buffer + text).split('\n')
+        self._buffer = lines.pop()
+        return self._consume(lines)
+    
+    def close(self):
+        """Consume the rest of the text; return the questions it completed"""
+        lines, self._buffer = [self._buffer], ""
+        return self._consume(lines) + self._finish()
+    
+    def _consume(self, lines):
+        completed = []
+        for line in lines:
+            line = line.strip()
+            if line.startswith('QUESTION:'):
+                completed += self._finish()
+                self._current = {'question': line.replace('QUESTION:', '').strip(), 'options': []}
+            elif not self._current:
+                continue  # Preamble before the first question
+            elif line.startswith(('A)', 'B)', 'C)', 'D)')):
+                self._current['options'].append(line)
+            elif line.startswith('CORRECT:'):
+                match = CORRECT_LETTER.match(line.replace('CORRECT:', '').strip().upper())
+                self._current['correct'] = match.group(1) if match else line.replace('CORRECT:', '').strip()
+            elif line.startswith('EXPLANATION:'):
+                self._current['explanation'] = line.replace('EXPLANATION:', '').strip()
+            elif line == '---':
+                completed += self._finish()
+        return completed
+    
+    def _finish(self):
+        question, self._current = self._current, {}
+        if not question:
+            return []
+        reason = validate_question(question)
+        if reason is None and self.seen and question_fingerprint(question) in self.seen:
+            reason = "already seen"
+        if reason:
+            self.rejected.append((question, reason))
+            return []
+        return [question]
+
+class QuizGeneration:
+    """
+    Practice questions generated on a background thread and readable while it runs.
+    `questions` starts with any `prefilled` questions (e.g. from the question pool)
+    and grows as the remaining ones arrive; `expected` is the number requested.
+    Generated questions whose fingerprints are in `seen` are replaced.
+    """
+    
+    def __init__(self, context, topic, num_questions, use_cache=True, prefilled=(), seen=()):
+        self.questions = list(prefilled)[:num_questions]
+        self.expected = num_questions
+        self.done = len(self.questions) == num_questions
+        self.error = None
+        self._cond = threading.Condition()
+        if not self.done:
+            threading.Thread(
+                target=self._run, args=(context, topic, num_questions - len(self.questions), use_cache, seen),
+                name="lyra-quiz-stream", daemon=True
+            ).start()
+    
+    def _run(self, context, topic, num_questions, use_cache, seen):
+        try:
+            for question in stream_practice_questions(context, topic, num_questions, use_cache=use_cache, seen=seen):
+                with self._cond:
+                    self.questions.append(question)
+                    self._cond.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+    
+    @property
+    def total(self):
+        """Questions this quiz will have: the number requested until generation ends"""
+        return len(self.questions) if self.done else self.expected
+    
+    def wait_for(self, count, timeout=None):
+        """Block until `count` questions exist or generation ends; return whether they exist"""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self.questions) >= count or self.done, timeout)
+            return len(self.questions) >= count
+
 def parse_quiz_questions(text):
     """Parse generated questions into structured format"""
     questions = []
@@ -82,12 +258,38 @@ def provide_exam_feedback(score, total):
     
     return feedback, level
 
-def update_progress_tracking(topic, score):
+def grade_answers(questions, selected):
+    """
+    Score a finished quiz or assessment in one pass.
+    `selected` holds the chosen option letter per question ("" if unanswered).
+    Returns the results record the results views are rendered from.
+    """
+    import numpy as np
+    
+    correct = np.array([q['correct'] for q in questions], dtype='U1')
+    is_correct = correct == np.array(selected, dtype='U1')
+    score = int(is_correct.sum())
+    total = len(questions)
+    percentage = score / total * 100 if total else 0.0
+    feedback, level = provide_exam_feedback(score, total) if total else ("", "")
+    return {
+        'questions': questions,
+        'selected': list(selected),
+        'is_correct': is_correct.tolist(),
+        'score': score,
+        'total': total,
+        'percentage': percentage,
+        'feedback': feedback,
+        'level': level,
+        'graded_at': datetime.now().isoformat()
+    }
+
+def update_progress_tracking(topic, score, profile=None):
     """Update student's progress on specific topics"""
-    if topic not in st.session_state.student_profile['exam_scores']:
-        st.session_state.student_profile['exam_scores'][topic] = []
+    if profile is None:
+        profile = st.session_state.student_profile
     
-    st.session_state.student_profile['exam_scores'][topic].append({
+    record_event(profile, 'exam_score', {
         'score': score,
         'date': datetime.now().isoformat()
-    })
+    }, topic=topic, value=score)
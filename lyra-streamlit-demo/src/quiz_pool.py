@@ -0,0 +1,209 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    QUIZ_POOL_MAX_PER_TOPIC,
+    QUIZ_POOL_MAX_TOPICS,
+    QUIZ_POOL_TTL_SECONDS,
+    QUIZ_PREFETCH,
+    QUIZ_PREFETCH_BATCH,
+    QUIZ_PREFETCH_TOPICS
+)
+from metrics import increment, span
+from progress_aggregates import recent_gaps, recent_topic_scores
+
+# Study sessions whose question keywords count towards the predicted topics; a
+# keyword must recur in PREFETCH_KEYWORD_MIN_SESSIONS of them to count
+PREFETCH_HISTORY_WINDOW = 10
+PREFETCH_KEYWORD_MIN_SESSIONS = 2
+
+# Words extract_topics keeps that say how a question is asked, not what it is about
+QUESTION_WORDS = {
+    'about', 'also', 'between', 'could', 'define', 'describe', 'difference', 'does', 'example',
+    'examples', 'explain', 'give', 'important', 'mean', 'means', 'meaning', 'more', 'should',
+    'some', 'tell', 'than', 'that', 'there', 'these', 'they', 'this', 'those', 'used', 'using',
+    'which', 'with', 'work', 'works', 'would'
+}
+
+def normalize_topic(topic):
+    return " ".join(topic.lower().strip(" ?.,!:;\"'").split())
+
+def question_fingerprint(question):
+    """Stable ID of a question, insensitive to case and spacing, for de-duplication."""
+    text = " ".join(question['question'].lower().split())
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+class QuestionPool:
+    """
+    Pre-generated practice questions per (corpus, topic), shared by all sessions.
+    Each topic keeps at most max_per_topic questions, at most max_topics topics are
+    kept (least recently used dropped first), and questions expire after ttl_seconds.
+    A question is handed out once and never to a student who has already seen it.
+    """
+    
+    def __init__(self, max_per_topic, max_topics, ttl_seconds):
+        self.max_per_topic = max_per_topic
+        self.max_topics = max_topics
+        self.ttl_seconds = ttl_seconds
+        self._topics = OrderedDict()  # (corpus_key, topic) -> deque of (expires_at, fingerprint, question)
+        self._lock = threading.Lock()
+    
+    def add(self, corpus_key, topic, questions):
+        """Add questions not already pooled for this topic; return how many were added."""
+        key = (corpus_key, normalize_topic(topic))
+        now = time.time()
+        with self._lock:
+            entries = self._fresh_entries(key, now)
+            pooled = {fingerprint for _, fingerprint, _ in entries}
+            added = 0
+            for question in questions:
+                fingerprint = question_fingerprint(question)
+                if fingerprint in pooled or len(entries) >= self.max_per_topic:
+                    continue
+                pooled.add(fingerprint)
+                entries.append((now + self.ttl_seconds, fingerprint, question))
+                added += 1
+            if not entries:
+                self._topics.pop(key, None)
+                return 0
+            self._topics[key] = entries
+            self._topics.move_to_end(key)
+            while len(self._topics) > self.max_topics:
+                self._topics.popitem(last=False)
+            return added
+    
+    def take(self, corpus_key, topic, count, seen=()):
+        """
+        Remove and return up to `count` unexpired questions for the topic, skipping
+        fingerprints in `seen`. Skipped questions stay pooled for other students.
+        """
+        key = (corpus_key, normalize_topic(topic))
+        with self._lock:
+            entries = self._fresh_entries(key, time.time())
+            taken = []
+            kept = deque()
+            while entries:
+                entry = entries.popleft()
+                if len(taken) < count and entry[1] not in seen:
+                    taken.append(entry[2])
+                else:
+                    kept.append(entry)
+            if kept:
+                self._topics[key] = kept
+            else:
+                self._topics.pop(key, None)
+            return taken
+    
+    def available(self, corpus_key, topic):
+        key = (corpus_key, normalize_topic(topic))
+        with self._lock:
+            return len(self._fresh_entries(key, time.time()))
+    
+    def _fresh_entries(self, key, now):
+        # Caller holds self._lock
+        entries = self._topics.get(key)
+        if entries is None:
+            return deque()
+        while entries and entries[0][0] <= now:
+            entries.popleft()
+        return entries
+
+class QuizPrefetcher:
+    """
+    Fills the question pool in the background for topics a student is likely to quiz on next.
+    At most one batch per (corpus, topic) is in flight at a time.
+    """
+    
+    def __init__(self, pool, batch_size, max_workers=2):
+        self.pool = pool
+        self.batch_size = batch_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="lyra-prefetch")
+        self._in_flight = set()
+        self._lock = threading.Lock()
+    
+    def prefetch(self, corpus_key, index, topics):
+        """Queue a batch for each topic whose pool holds less than one batch."""
+        for topic in topics:
+            key = (corpus_key, normalize_topic(topic))
+            if self.pool.available(corpus_key, topic) >= self.batch_size:
+                continue
+            with self._lock:
+                if key in self._in_flight:
+                    continue
+                self._in_flight.add(key)
+            self._executor.submit(self._fill, key, corpus_key, index, topic)
+    
+    def _fill(self, key, corpus_key, index, topic):
+        from context_packer import build_context
+        from quiz import stream_practice_questions
+        try:
+            with span("quiz.prefetch"):
+                context = build_context(topic, index, 'quiz', 5)
+                # Fresh questions: a cached response would repeat a quiz students already took
+                questions = list(stream_practice_questions(context, topic, self.batch_size, use_cache=False))
+            increment("quiz_questions_prefetched", self.pool.add(corpus_key, topic, questions))
+        except Exception:
+            pass  # Prefetching is best effort; the quiz falls back to generating on demand
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
+
+def predict_topics(profile, limit=QUIZ_PREFETCH_TOPICS):
+    """
+    Topics the student is likely to quiz on next: recent knowledge gaps, recently
+    quizzed topics and keywords that recur across recent Q&A questions, weighted
+    towards the latest. Keywords asked about only once, and words such as "explain"
+    or "does" that describe the question rather than its subject, are ignored.
+    """
+    scores = {}
+    
+    def vote(topic, weight):
+        topic = normalize_topic(topic)
+        if topic:
+            scores[topic] = scores.get(topic, 0) + weight
+    
+    aggregates = profile.get('aggregates')
+    if aggregates:
+        for rank, gap in enumerate(recent_gaps(aggregates, limit)):
+            vote(gap, 3 / (rank + 1))
+        for rank, (topic, _) in enumerate(recent_topic_scores(aggregates, limit)):
+            vote(topic, 2 / (rank + 1))
+    
+    keyword_sessions = {}
+    for age, session in enumerate(reversed(profile['study_history'][-PREFETCH_HISTORY_WINDOW:])):
+        for keyword in {normalize_topic(keyword) for keyword in session.get('topics', [])}:
+            if keyword.isalpha() and keyword not in QUESTION_WORDS:
+                keyword_sessions.setdefault(keyword, []).append(age)
+    for keyword, ages in keyword_sessions.items():
+        if len(ages) >= PREFETCH_KEYWORD_MIN_SESSIONS:
+            vote(keyword, sum(1 / (age + 1) for age in ages))
+    
+    return sorted(scores, key=scores.get, reverse=True)[:limit]
+
+_shared_pool = None
+_shared_prefetcher = None
+_shared_lock = threading.Lock()
+
+def get_question_pool():
+    """Return the question pool shared by every session in this process."""
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = QuestionPool(QUIZ_POOL_MAX_PER_TOPIC, QUIZ_POOL_MAX_TOPICS, QUIZ_POOL_TTL_SECONDS)
+        return _shared_pool
+
+def prefetch_quiz_topics(corpus_key, index, profile, extra_topics=()):
+    """Prefetch question batches for the student's likely next topics (no-op if LYRA_QUIZ_PREFETCH=0)."""
+    global _shared_prefetcher
+    if not QUIZ_PREFETCH or index.embeddings is None:
+        return
+    pool = get_question_pool()
+    with _shared_lock:
+        if _shared_prefetcher is None:
+            _shared_prefetcher = QuizPrefetcher(pool, QUIZ_PREFETCH_BATCH)
+        prefetcher = _shared_prefetcher
+    topics = [t for t in dict.fromkeys([normalize_topic(t) for t in extra_topics] + predict_topics(profile)) if t]
+    prefetcher.prefetch(corpus_key, index, topics)
@@ -1,9 +1,125 @@
-import numpy as np
 import json
 import random
 import string
 import re
 
+# Break points, tried in order: paragraph, then sentence, then whitespace
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+SENTENCE_BREAK = re.compile(r'[.!?]\s')
+
+# Text iter_stream_chunks collects before chunking what it has so far
+STREAM_WINDOW_CHARS = 1 << 18
+
+class _BreakScanner:
+    """
+    Walks the matches of a break pattern once, front to back.
+    Because chunk limits only ever move forward, every match is visited once.
+    """
+    
+    def __init__(self, pattern, text, offset=0):
+        self._matches = pattern.finditer(text)
+        self._offset = offset
+        self._next = next(self._matches, None)
+        self.last = None
+    
+    def advance(self, limit):
+        """Return the last break position at or before `limit`."""
+        while self._next is not None and self._next.start() + self._offset <= limit:
+            self.last = self._next.start() + self._offset
+            self._next = next(self._matches, None)
+        return self.last
+
+def iter_chunk_spans(text, chunk_size=1000, chunk_overlap=200, split_paragraphs=True):
+    """
+    Yield (start, end) offsets of overlapping chunks of `text` in a single pass.
+    
+    Each chunk is at most chunk_size characters and ends at the last paragraph
+    break that fits, else the last sentence break, else the last space, else a
+    hard cut. The next chunk starts up to chunk_overlap characters before the
+    previous end, on a word boundary. Spans exclude surrounding whitespace, so
+    text[start:end] is the chunk text.
+    """
+    return _chunk_spans(text, chunk_size, chunk_overlap, split_paragraphs, final=True)
+
+def _chunk_spans(text, chunk_size, chunk_overlap, split_paragraphs, final):
+    # With final=False, `text` is a window of a longer text: stop before any chunk
+    # whose breaks could depend on text past the window and return where to resume
+    n = len(text)
+    # Keep at least half of each chunk new so the scan always moves forward
+    overlap = max(0, min(chunk_overlap, chunk_size // 2))
+    scanners = [_BreakScanner(SENTENCE_BREAK, text, offset=1)]
+    if split_paragraphs:
+        scanners.insert(0, _BreakScanner(PARAGRAPH_BREAK, text))
+    
+    start = 0
+    while start < n and text[start].isspace():
+        start += 1
+    
+    while start < n:
+        limit = start + chunk_size
+        if not final and limit + chunk_size >= n:
+            return start
+        if limit >= n:
+            end = n
+        else:
+            min_end = start + overlap
+            end = None
+            for scanner in scanners:
+                pos = scanner.advance(limit)
+                if pos is not None and pos > min_end:
+                    end = pos
+                    break
+            if end is None:
+                pos = text.rfind(' ', min_end + 1, limit)
+                end = pos if pos != -1 else limit
+        
+        span_start, span_end = start, end
+        while span_end > span_start and text[span_end - 1].isspace():
+            span_end -= 1
+        if span_end > span_start:
+            yield span_start, span_end
+        
+        if end >= n:
+            break
+        next_start = end - overlap
+        if overlap:
+            space = text.find(' ', next_start, end)
+            if space != -1:
+                next_start = space + 1
+        start = max(next_start, start + 1)
+        while start < n and text[start].isspace():
+            start += 1
+    return n
+
+def iter_stream_chunks(pieces, chunk_size=1000, chunk_overlap=200, split_paragraphs=True):
+    """
+    Chunk text that arrives as an iterable of string pieces, e.g. from an incremental
+    decoder, holding only a window of it at a time.
+    
+    Yields (start, end, chunk) with offsets into the whole text; the chunks are the
+    ones iter_chunk_spans finds in the joined text.
+    """
+    window = max(STREAM_WINDOW_CHARS, 4 * chunk_size)
+    buffer, base = "", 0
+    for piece in pieces:
+        buffer += piece
+        if len(buffer) < window:
+            continue
+        spans = _chunk_spans(buffer, chunk_size, chunk_overlap, split_paragraphs, final=False)
+        resume = yield from _with_text(spans, buffer, base)
+        buffer, base = buffer[resume:], base + resume
+    yield from _with_text(_chunk_spans(buffer, chunk_size, chunk_overlap, split_paragraphs, final=True), buffer, base)
+
+def _with_text(spans, text, base):
+    # Re-yield (start, end) spans of `text` as whole-text offsets plus chunk text,
+    # returning the span generator's resume offset
+    while True:
+        try:
+            start, end = next(spans)
+        except StopIteration as stop:
+            return stop.value
+        yield base + start, base + end, text[start:end]
+
 def chunk_text(text, chunk_size=1000, chunk_overlap=200):
     """
     Split text into overlapping chunks without using langchain.
@@ -19,55 +135,16 @@ def chunk_text(text, chunk_size=1000, chunk_overlap=200):
     if not text:
         return []
     
-    # Split by paragraphs first (double newline)
-    paragraphs = text.split('\n\n')
-    
-    chunks = []
-    current_chunk = ""
-    
-    for paragraph in paragraphs:
-        # If adding this paragraph exceeds chunk_size, save current chunk
-        if len(current_chunk) + len(paragraph) > chunk_size and current_chunk:
-            chunks.append(current_chunk.strip())
-            # Start new chunk with overlap from previous chunk
-            overlap_start = max(0, len(current_chunk) - chunk_overlap)
-            current_chunk = current_chunk[overlap_start:] + "\n\n" + paragraph
-        else:
-            current_chunk += "\n\n" + paragraph if current_chunk else paragraph
-    
-    # Add the last chunk
-    if current_chunk:
-        chunks.append(current_chunk.strip())
-    
-    # If no paragraphs were found, split by sentences
-    if len(chunks) == 0 or (len(chunks) == 1 and len(chunks[0]) > chunk_size):
-        return chunk_by_sentences(text, chunk_size, chunk_overlap)
-    
-    return chunks
+    return [text[start:end] for start, end in iter_chunk_spans(text, chunk_size, chunk_overlap)]
 
 def chunk_by_sentences(text, chunk_size=1000, chunk_overlap=200):
     """
-    Fallback method: split text by sentences if paragraph splitting doesn't work well.
+    Split text into overlapping chunks at sentence boundaries only, ignoring paragraphs.
     """
-    # Simple sentence splitting (can be improved with nltk if needed)
-    sentences = re.split(r'(?<=[.!?])\s+', text)
-    
-    chunks = []
-    current_chunk = ""
-    
-    for sentence in sentences:
-        if len(current_chunk) + len(sentence) > chunk_size and current_chunk:
-            chunks.append(current_chunk.strip())
-            # Start new chunk with overlap
-            overlap_start = max(0, len(current_chunk) - chunk_overlap)
-            current_chunk = current_chunk[overlap_start:] + " " + sentence
-        else:
-            current_chunk += " " + sentence if current_chunk else sentence
-    
-    if current_chunk:
-        chunks.append(current_chunk.strip())
-    
-    return chunks
+    return [
+        text[start:end]
+        for start, end in iter_chunk_spans(text, chunk_size, chunk_overlap, split_paragraphs=False)
+    ]
 
 def preprocess_text(text):
     """Preprocess the input text for analysis."""
@@ -75,6 +152,8 @@ def preprocess_text(text):
 
 def calculate_similarity(vector_a, vector_b):
     """Calculate cosine similarity between two vectors."""
+    import numpy as np
+    
     norm_a = np.linalg.norm(vector_a)
     norm_b = np.linalg.norm(vector_b)
     
@@ -1,23 +1,56 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
+# numpy, scipy and scikit-learn are imported where used, keeping this module
+# cheap to import on the landing page
+import json
+import mmap
+import os
+import shutil
+import tempfile
 
-def create_vector_store(chunks):
+from metrics import increment, span
+
+# On-disk index layout; bump INDEX_FORMAT_VERSION on incompatible changes
+INDEX_FORMAT = "lyra-tfidf-index"
+INDEX_FORMAT_VERSION = 1
+
+# Upper bound on query-by-chunk scores densified at once in retrieve_batch
+RETRIEVAL_BLOCK_ELEMENTS = 4_000_000
+
+VECTORIZER_PARAMS = {
+    'max_features': 1000,
+    'strip_accents': 'unicode',
+    'stop_words': 'english',
+    'ngram_range': (1, 2),
+}
+
+def create_vector_store(chunks, backend="tfidf"):
     """
     Build a TF-IDF vectorizer and matrix for the provided text chunks.
+    With backend="bm25", the first element is a BM25Index instead of a matrix;
+    with backend="lsa", a dense float32 array of LSA vectors (see lsa_index.py).
+    retrieve_relevant_chunks accepts any of them.
     Returns: (embeddings_matrix, vectorizer, chunks)
     """
     if not chunks:
         return None, None, []
     
-    vectorizer = TfidfVectorizer(
-        max_features=1000,
-        strip_accents='unicode', 
-        stop_words='english', 
-        ngram_range=(1, 2)
-    )
-    embeddings = vectorizer.fit_transform(chunks)
-    return embeddings, vectorizer, chunks
+    if backend not in ("tfidf", "bm25", "lsa"):
+        raise ValueError(f"Unknown retrieval backend: {backend}")
+    increment("chunks_indexed", len(chunks))
+    
+    with span("index.create_vector_store"):
+        if backend == "bm25":
+            from bm25_index import BM25Index
+            index = BM25Index(chunks)
+            return index, index.vectorizer, chunks
+        if backend == "lsa":
+            from lsa_index import build_lsa_index
+            embeddings, vectorizer = build_lsa_index(chunks)
+            return embeddings, vectorizer, chunks
+        
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        vectorizer = TfidfVectorizer(**VECTORIZER_PARAMS)
+        embeddings = vectorizer.fit_transform(chunks)
+        return embeddings, vectorizer, chunks
 
 def retrieve_relevant_chunks(query, embeddings, vectorizer, chunks, top_k=3):
     """
@@ -27,15 +60,208 @@ def retrieve_relevant_chunks(query, embeddings, vectorizer, chunks, top_k=3):
     if embeddings is None or vectorizer is None or not chunks:
         return []
     
-    q_vec = vectorizer.transform([query])
-    sims = cosine_similarity(q_vec, embeddings).flatten()
+    with span("retrieve"):
+        idxs, scores = retrieve_batch([query], embeddings, vectorizer, top_k)
+        return resolve_chunks(idxs[0], scores[0], chunks)
+
+def retrieve_batch(queries, embeddings, vectorizer, top_k=3):
+    """
+    Score many queries with one matrix product and keep the top_k per query.
+    Embedding rows must be L2-normalized (as TfidfVectorizer and LSAVectorizer
+    produce), so the dot product is the cosine similarity.
+    Returns: (indices, scores) arrays of shape (len(queries), k), best match first;
+    rows from an inverted-index backend are padded with index -1
+    """
+    import numpy as np
+    
+    if embeddings is None or vectorizer is None or not len(queries):
+        return np.empty((0, 0), dtype=np.int64), np.empty((0, 0))
     
-    if np.all(np.isnan(sims)):
-        return []
+    if hasattr(embeddings, 'search'):
+        return _search_each(queries, embeddings, top_k)
+    
+    num_chunks = embeddings.shape[0]
+    k = min(top_k, num_chunks)
+    q_vecs = vectorizer.transform(queries)
+    idxs = np.empty((len(queries), k), dtype=np.int64)
+    scores = np.empty((len(queries), k))
+    
+    # Densify the score matrix a block of queries at a time to bound memory
+    block = max(1, RETRIEVAL_BLOCK_ELEMENTS // max(num_chunks, 1))
+    for lo in range(0, len(queries), block):
+        hi = min(lo + block, len(queries))
+        sims = q_vecs[lo:hi] @ embeddings.T
+        if not isinstance(sims, np.ndarray):
+            sims = sims.toarray()
+        if k < num_chunks:
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(num_chunks), sims.shape)
+        top_scores = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        idxs[lo:hi] = np.take_along_axis(top, order, axis=1)
+        scores[lo:hi] = np.take_along_axis(top_scores, order, axis=1)
+    
+    return idxs, scores
+
+def _search_each(queries, index, top_k):
+    # Inverted indexes answer one query at a time; pad short rows with -1
+    import numpy as np
+    idxs = np.full((len(queries), max(top_k, 0)), -1, dtype=np.int64)
+    scores = np.zeros((len(queries), max(top_k, 0)))
+    for row, query in enumerate(queries):
+        hit_idxs, hit_scores = index.search(query, top_k)
+        idxs[row, :len(hit_idxs)] = hit_idxs
+        scores[row, :len(hit_scores)] = hit_scores
+    return idxs, scores
+
+def resolve_chunks(idxs, scores, chunks):
+    """
+    Turn one row of retrieve_batch output into a list of (chunk_text, score) tuples.
+    Padding entries (index -1) are skipped.
+    """
+    return [(chunks[int(i)], float(score)) for i, score in zip(idxs, scores) if i >= 0]
+
+class MappedChunks:
+    """
+    Read-only, list-like view of chunk texts stored in a memory-mapped file.
+    Chunks are decoded on access, so loading an index does not copy the texts.
+    """
+    
+    def __init__(self, path, offsets):
+        self._offsets = offsets
+        self._file = open(path, 'rb')
+        if offsets[-1] > 0:
+            self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._buf = b""
     
-    idxs = np.argsort(sims)[::-1][:top_k]
-    results = []
-    for i in idxs:
-        results.append((chunks[int(i)], float(sims[int(i)])))
+    @property
+    def nbytes(self):
+        return int(self._offsets[-1]) + self._offsets.nbytes
     
-    return results
\ No newline at end of file
+    def __len__(self):
+        return len(self._offsets) - 1
+    
+    def __getitem__(self, i):
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("chunk index out of range")
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return self._buf[start:end].decode('utf-8')
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+def save_index(path, embeddings, vectorizer, chunks, sources=None):
+    """
+    Write a fitted vector store, and optionally its ChunkSources, to the directory `path`.
+    The directory is written next to its destination and renamed into place,
+    so readers never see a partially written index.
+    """
+    import numpy as np
+    import scipy.sparse as sp
+    
+    embeddings = sp.csr_matrix(embeddings)
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".index-", dir=parent)
+    
+    try:
+        np.save(os.path.join(tmp_dir, "data.npy"), embeddings.data)
+        np.save(os.path.join(tmp_dir, "indices.npy"), embeddings.indices)
+        np.save(os.path.join(tmp_dir, "indptr.npy"), embeddings.indptr)
+        np.save(os.path.join(tmp_dir, "idf.npy"), vectorizer.idf_)
+        
+        terms = [None] * len(vectorizer.vocabulary_)
+        for term, col in vectorizer.vocabulary_.items():
+            terms[col] = term
+        with open(os.path.join(tmp_dir, "vocabulary.json"), 'w', encoding='utf-8') as f:
+            json.dump(terms, f, ensure_ascii=False)
+        
+        offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+        with open(os.path.join(tmp_dir, "chunks.bin"), 'wb') as f:
+            for i, chunk in enumerate(chunks):
+                encoded = chunk.encode('utf-8')
+                f.write(encoded)
+                offsets[i + 1] = offsets[i] + len(encoded)
+        np.save(os.path.join(tmp_dir, "chunk_offsets.npy"), offsets)
+        if sources is not None:
+            np.save(
+                os.path.join(tmp_dir, "chunk_sources.npy"),
+                np.array([sources.docs, sources.starts, sources.ends], dtype=np.int64)
+            )
+        
+        params = {name: vectorizer.get_params()[name] for name in VECTORIZER_PARAMS}
+        params['ngram_range'] = list(params['ngram_range'])
+        manifest = {
+            'format': INDEX_FORMAT,
+            'version': INDEX_FORMAT_VERSION,
+            'shape': list(embeddings.shape),
+            'num_chunks': len(chunks),
+            'vectorizer': params,
+        }
+        with open(os.path.join(tmp_dir, "manifest.json"), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_dir, path)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+def load_index(path):
+    """
+    Load an index written by save_index, memory-mapping the large arrays.
+    Returns: (embeddings_matrix, vectorizer, chunks)
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    import numpy as np
+    import scipy.sparse as sp
+    
+    with open(os.path.join(path, "manifest.json"), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != INDEX_FORMAT:
+        raise ValueError(f"{path} is not a Lyra index")
+    if manifest.get('version') != INDEX_FORMAT_VERSION:
+        raise ValueError(f"Unsupported index version {manifest.get('version')} in {path}")
+    
+    def load_array(name):
+        return np.load(os.path.join(path, name), mmap_mode='r')
+    
+    embeddings = sp.csr_matrix(
+        (load_array("data.npy"), load_array("indices.npy"), load_array("indptr.npy")),
+        shape=tuple(manifest['shape']),
+        copy=False
+    )
+    
+    params = dict(manifest['vectorizer'])
+    params['ngram_range'] = tuple(params['ngram_range'])
+    vectorizer = TfidfVectorizer(**params)
+    with open(os.path.join(path, "vocabulary.json"), 'r', encoding='utf-8') as f:
+        terms = json.load(f)
+    vectorizer.vocabulary_ = {term: col for col, term in enumerate(terms)}
+    vectorizer.idf_ = np.load(os.path.join(path, "idf.npy"))
+    
+    chunks = MappedChunks(os.path.join(path, "chunks.bin"), load_array("chunk_offsets.npy"))
+    if len(chunks) != manifest['num_chunks']:
+        raise ValueError(f"Index at {path} is corrupt: chunk count mismatch")
+    
+    return embeddings, vectorizer, chunks
+
+def load_chunk_sources(path):
+    """Return the ChunkSources saved with the index at `path`, or None if it has none"""
+    from array import array
+    import numpy as np
+    from context_packer import ChunkSources
+    
+    sources_path = os.path.join(path, "chunk_sources.npy")
+    if not os.path.exists(sources_path):
+        return None
+    docs, starts, ends = np.load(sources_path)
+    return ChunkSources(array('q', docs.tobytes()), array('q', starts.tobytes()), array('q', ends.tobytes()))
+
@@ -0,0 +1,31 @@
+import threading
+
+from config import WARMUP
+
+_started = False
+_started_lock = threading.Lock()
+
+def _warm_up():
+    try:
+        import numpy  # noqa: F401
+        import scipy.sparse  # noqa: F401
+        import sklearn.feature_extraction.text  # noqa: F401
+        import sklearn.preprocessing  # noqa: F401
+        from llm_providers import get_provider
+        get_provider().warm_up()
+    except Exception:
+        pass  # Best effort; the first real use imports whatever is missing
+
+def start_background_warmup():
+    """
+    Import the heavy dependencies on a daemon thread, once per process, so the
+    first upload or question doesn't wait for them. Disabled by LYRA_WARMUP=0.
+    """
+    global _started
+    if not WARMUP:
+        return
+    with _started_lock:
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=_warm_up, name="lyra-warmup", daemon=True).start()
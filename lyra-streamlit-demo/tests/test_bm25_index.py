@@ -0,0 +1,86 @@
+import random
+from collections import Counter
+
+import numpy as np
+
+from bm25_index import BM25Index
+from vector_store import create_vector_store, retrieve_batch
+
+def make_chunks(num_chunks, seed=0):
+    rng = random.Random(seed)
+    words = sorted({"".join(rng.choice("bcdfgklmnprst") + rng.choice("aeiou") for _ in range(3)) for _ in range(300)})
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    return [" ".join(rng.choices(words, weights, k=rng.randint(5, 80))) for _ in range(num_chunks)], words
+
+def term_counts(index, chunks):
+    return index.vectorizer.transform(chunks).toarray().astype(np.float64)
+
+def brute_force_scores(index, counts, query, k1=1.5, b=0.75):
+    """BM25 score of every chunk for `query`, straight from the formula"""
+    analyzer = index.vectorizer.build_analyzer()
+    vocabulary = index.vectorizer.vocabulary_
+    doc_len = counts.sum(axis=1)
+    avg_len = doc_len.mean()
+    n = len(counts)
+    scores = np.zeros(n)
+    for term, query_tf in Counter(analyzer(query)).items():
+        if term not in vocabulary:
+            continue
+        tf = counts[:, vocabulary[term]]
+        df = np.count_nonzero(tf)
+        idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+        scores += query_tf * idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_len / avg_len))
+    return scores
+
+def assert_top_k(index, counts, query, top_k):
+    expected = brute_force_scores(index, counts, query)
+    ids, scores = index.search(query, top_k)
+    matching = np.count_nonzero(expected)
+    assert len(ids) == min(top_k, matching)
+    # Same scores as the best brute-force ones, best first; ids may differ only among ties
+    best = np.sort(expected)[::-1][:len(ids)]
+    np.testing.assert_allclose(scores, best, rtol=1e-5)
+    np.testing.assert_allclose(expected[ids], scores, rtol=1e-5)
+    assert len(set(ids.tolist())) == len(ids)
+
+def test_search_matches_brute_force_scoring():
+    chunks, words = make_chunks(400)
+    index = BM25Index(chunks)
+    counts = term_counts(index, chunks)
+    rng = random.Random(1)
+    for _ in range(100):
+        # Mostly common words, so pruning has long posting lists to skip
+        query = " ".join(rng.choices(words[:40], k=rng.randint(1, 3)) + rng.sample(words, rng.randint(0, 4)))
+        for top_k in (1, 3, 10, 50):
+            assert_top_k(index, counts, query, top_k)
+
+def test_repeated_query_terms_count_once_per_occurrence():
+    chunks, words = make_chunks(200, seed=2)
+    index = BM25Index(chunks)
+    counts = term_counts(index, chunks)
+    for word in words[:10]:
+        assert_top_k(index, counts, f"{word} {word} {words[50]}", 5)
+
+def test_top_k_larger_than_the_matching_chunks():
+    chunks, words = make_chunks(300, seed=3)
+    index = BM25Index(chunks)
+    rare = min(words, key=lambda word: sum(word in chunk.split() for chunk in chunks) or len(chunks))
+    assert_top_k(index, term_counts(index, chunks), rare, 100)
+
+def test_unknown_terms_and_empty_queries_match_nothing():
+    chunks, _ = make_chunks(50, seed=4)
+    index = BM25Index(chunks)
+    for query in ["", "zzzzqqq", "the and of"]:
+        ids, scores = index.search(query, 5)
+        assert len(ids) == len(scores) == 0
+    assert len(index.search(chunks[0], 0)[0]) == 0
+
+def test_retrieve_batch_pads_short_rows():
+    chunks, words = make_chunks(100, seed=5)
+    store = create_vector_store(chunks, backend="bm25")
+    queries = [words[0], "zzzzqqq"]
+    idxs, scores = retrieve_batch(queries, store[0], store[1], top_k=4)
+    assert idxs.shape == scores.shape == (2, 4)
+    expected = np.sort(brute_force_scores(store[0], term_counts(store[0], chunks), words[0]))[::-1][:4]
+    np.testing.assert_allclose(scores[0], expected, rtol=1e-5)
+    assert (idxs[1] == -1).all()
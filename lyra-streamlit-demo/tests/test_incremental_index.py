@@ -0,0 +1,147 @@
+import random
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from incremental_index import IncrementalVectorStore
+from vector_store import VECTORIZER_PARAMS, create_vector_store, retrieve_relevant_chunks
+
+def make_words(rng, count):
+    letters = "bcdfghjklmnpqrstvwxz"
+    words = set()
+    while len(words) < count:
+        words.add("".join(rng.choice(letters) + rng.choice("aeiou") for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+def make_documents(num_docs, chunks_per_doc, seed=0, vocabulary_size=400):
+    """{doc_id: chunks} of Zipf-distributed words, so term frequencies differ"""
+    rng = random.Random(seed)
+    words = make_words(rng, vocabulary_size)
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    return {
+        f"doc{d}": [" ".join(rng.choices(words, weights, k=rng.randint(20, 60))) for _ in range(chunks_per_doc)]
+        for d in range(num_docs)
+    }
+
+def all_chunks(docs, doc_ids):
+    return [chunk for doc_id in doc_ids for chunk in docs[doc_id]]
+
+def full_rebuild(chunks, vocabulary=None):
+    """TF-IDF of `chunks` from scratch, optionally over a fixed vocabulary"""
+    if vocabulary is None:
+        vectorizer = TfidfVectorizer(**VECTORIZER_PARAMS)
+    else:
+        params = {name: value for name, value in VECTORIZER_PARAMS.items() if name != 'max_features'}
+        vectorizer = TfidfVectorizer(vocabulary=vocabulary, **params)
+    return vectorizer.fit_transform(chunks), vectorizer
+
+def assert_matches(store, docs, doc_ids, vocabulary=None):
+    embeddings, vectorizer, chunks = store.as_vector_store()
+    assert chunks == all_chunks(docs, doc_ids)
+    expected, expected_vectorizer = full_rebuild(chunks, vocabulary)
+    assert vectorizer.vocabulary_ == expected_vectorizer.vocabulary_
+    np.testing.assert_allclose(vectorizer.idf_, expected_vectorizer.idf_, rtol=1e-12)
+    assert embeddings.shape == expected.shape
+    np.testing.assert_allclose(embeddings.toarray(), expected.toarray(), rtol=1e-9, atol=1e-12)
+
+def never_refitting_store():
+    # Keeps the first vocabulary and refreshes IDF on every read, so each result
+    # can be compared with a rebuild over that vocabulary
+    return IncrementalVectorStore(idf_refresh_ratio=0.0, drift_ratio=1e9, refit_growth=1e9)
+
+def test_initial_fit_matches_a_full_rebuild():
+    docs = make_documents(4, 10)
+    store = IncrementalVectorStore()
+    store.add_documents(docs.items())
+    assert_matches(store, docs, list(docs))
+
+def test_documents_added_one_at_a_time_match_a_full_rebuild():
+    docs = make_documents(4, 10)
+    store = IncrementalVectorStore()
+    for doc_id, chunks in docs.items():
+        store.add_document(doc_id, chunks)
+    store.refit()
+    assert_matches(store, docs, list(docs))
+
+def test_incremental_additions_match_a_rebuild_over_the_same_vocabulary():
+    docs = make_documents(6, 8, seed=1)
+    store = never_refitting_store()
+    store.add_document("doc0", docs["doc0"])
+    vocabulary = dict(store.as_vector_store()[1].vocabulary_)
+    for count in range(2, len(docs) + 1):
+        store.add_document(f"doc{count - 1}", docs[f"doc{count - 1}"])
+        assert_matches(store, docs, [f"doc{d}" for d in range(count)], vocabulary)
+
+def test_removals_match_a_rebuild_over_the_same_vocabulary():
+    docs = make_documents(5, 8, seed=2)
+    store = never_refitting_store()
+    store.add_documents(docs.items())
+    vocabulary = dict(store.as_vector_store()[1].vocabulary_)
+    remaining = list(docs)
+    for doc_id in ["doc3", "doc0", "doc4"]:
+        store.remove_document(doc_id)
+        remaining.remove(doc_id)
+        assert doc_id not in store
+        assert_matches(store, docs, remaining, vocabulary)
+
+def test_refit_after_changes_matches_a_full_rebuild():
+    docs = make_documents(6, 8, seed=3)
+    store = never_refitting_store()
+    store.add_documents((doc_id, docs[doc_id]) for doc_id in ["doc0", "doc1", "doc2"])
+    store.add_document("doc3", docs["doc3"])
+    store.remove_document("doc1")
+    store.add_document("doc4", docs["doc4"])
+    store.refit()
+    assert_matches(store, docs, ["doc0", "doc2", "doc3", "doc4"])
+
+def test_growth_triggers_a_refit_to_the_full_vocabulary():
+    docs = make_documents(3, 10, seed=4)
+    # Documents with words the first one never uses
+    docs.update(make_documents(3, 10, seed=5, vocabulary_size=600))
+    store = IncrementalVectorStore(refit_growth=2.0)
+    store.add_document("doc0", docs["doc0"])
+    store.add_document("doc1", docs["doc1"])
+    store.add_document("doc2", docs["doc2"])
+    # Three times the rows it was fit on: refit, so the vocabulary is rebuilt too
+    assert_matches(store, docs, ["doc0", "doc1", "doc2"])
+
+def test_stale_idf_is_refreshed_once_enough_rows_change():
+    docs = make_documents(11, 4, seed=6)
+    store = IncrementalVectorStore(idf_refresh_ratio=0.5, drift_ratio=1e9, refit_growth=1e9)
+    store.add_documents((f"doc{d}", docs[f"doc{d}"]) for d in range(10))
+    vocabulary = dict(store.as_vector_store()[1].vocabulary_)
+    before = store.as_vector_store()[1].idf_.copy()
+    
+    # 4 of 44 rows changed: under the ratio, the IDF is left as it was
+    store.add_document("doc10", docs["doc10"])
+    np.testing.assert_array_equal(store.as_vector_store()[1].idf_, before)
+    
+    # An explicit refresh brings it in line with a rebuild
+    store.refresh_idf()
+    assert_matches(store, docs, [f"doc{d}" for d in range(11)], vocabulary)
+
+def test_retrieval_matches_a_store_built_in_one_pass():
+    docs = make_documents(5, 12, seed=7)
+    store = IncrementalVectorStore()
+    for doc_id in ["doc0", "doc1", "doc2", "doc3", "doc4"]:
+        store.add_document(doc_id, docs[doc_id])
+    store.remove_document("doc2")
+    store.refit()
+    expected = create_vector_store(all_chunks(docs, ["doc0", "doc1", "doc3", "doc4"]))
+    
+    rng = random.Random(8)
+    words = sorted({word for chunk in expected[2] for word in chunk.split()})
+    for _ in range(25):
+        query = " ".join(rng.sample(words, 3))
+        got = retrieve_relevant_chunks(query, *store.as_vector_store(), top_k=5)
+        want = retrieve_relevant_chunks(query, *expected, top_k=5)
+        np.testing.assert_allclose([score for _, score in got], [score for _, score in want], rtol=1e-9, atol=1e-12)
+
+def test_emptied_store_has_no_index():
+    docs = make_documents(2, 3, seed=9)
+    store = IncrementalVectorStore()
+    store.add_documents(docs.items())
+    store.remove_document("doc0")
+    store.remove_document("doc1")
+    assert store.as_vector_store() == (None, None, [])
+    assert store.num_chunks == 0
@@ -0,0 +1,166 @@
+import gc
+import random
+import threading
+
+import numpy as np
+import pytest
+
+from index_cache import CorpusIndex, IndexCache, estimate_index_bytes
+
+def make_index(num_bytes):
+    # estimate_index_bytes counts only the embeddings of this index
+    return CorpusIndex(np.zeros(num_bytes // 8), None, [])
+
+class Owner:
+    """Stand-in for a session's incremental store"""
+
+def test_lease_builds_once_and_shares_the_value():
+    cache = IndexCache(max_bytes=1 << 20)
+    builds = []
+    
+    def build():
+        builds.append(1)
+        return make_index(800)
+    
+    first = cache.lease("a", build)
+    second = cache.lease("a", build)
+    assert len(builds) == 1
+    assert second.value is first.value
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries'], stats['referenced']) == (1, 1, 1, 1)
+    assert stats['total_bytes'] == estimate_index_bytes(first.value) == 800
+
+def test_concurrent_misses_share_one_build():
+    cache = IndexCache(max_bytes=1 << 20)
+    started = threading.Event()
+    release = threading.Event()
+    builds = []
+    
+    def build():
+        builds.append(1)
+        started.set()
+        release.wait(5)
+        return make_index(80)
+    
+    leases = []
+    threads = [threading.Thread(target=lambda: leases.append(cache.lease("a", build))) for _ in range(8)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(builds) == 1
+    assert len({id(lease.value) for lease in leases}) == 1
+    assert cache.stats()['misses'] == 1
+
+def test_failed_build_is_not_cached():
+    cache = IndexCache(max_bytes=1 << 20)
+    
+    def broken():
+        raise RuntimeError("build failed")
+    
+    with pytest.raises(RuntimeError):
+        cache.lease("a", broken)
+    lease = cache.lease("a", lambda: make_index(80))
+    assert lease.value.embeddings.nbytes == 80
+    assert cache.stats()['entries'] == 1
+
+def test_referenced_entries_are_never_evicted():
+    cache = IndexCache(max_bytes=1000)
+    held = cache.lease("a", lambda: make_index(800))
+    other = cache.lease("b", lambda: make_index(800))
+    # Both are referenced, so the cache runs over budget rather than drop one
+    assert cache.stats()['entries'] == 2
+    assert cache.stats()['total_bytes'] == 1600
+    
+    other.release()
+    assert cache.stats()['entries'] == 1
+    assert cache.stats()['total_bytes'] == 800
+    assert cache.lease("a", lambda: pytest.fail("evicted a referenced entry")).value is held.value
+
+def test_unreferenced_entries_are_evicted_least_recently_used_first():
+    cache = IndexCache(max_bytes=2400)
+    for key in "abc":
+        cache.lease(key, lambda: make_index(800)).release()
+    # Touch "a" so "b" is the least recently used
+    cache.lease("a", lambda: pytest.fail("rebuilt a cached entry")).release()
+    cache.lease("d", lambda: make_index(800)).release()
+    
+    rebuilt = []
+    for key in "acd":
+        cache.lease(key, lambda: rebuilt.append(key) or make_index(800)).release()
+    assert rebuilt == []
+    cache.lease("b", lambda: rebuilt.append("b") or make_index(800)).release()
+    assert rebuilt == ["b"]
+
+def test_garbage_collected_lease_releases_its_reference():
+    cache = IndexCache(max_bytes=1000)
+    lease = cache.lease("a", lambda: make_index(800))
+    assert cache.stats()['referenced'] == 1
+    del lease
+    gc.collect()
+    assert cache.stats()['referenced'] == 0
+
+def test_charge_counts_against_the_budget_and_replaces_the_previous_charge():
+    cache = IndexCache(max_bytes=2000)
+    cache.lease("a", lambda: make_index(800)).release()
+    cache.lease("b", lambda: make_index(800)).release()
+    owner = Owner()
+    
+    cache.charge(owner, 300)
+    stats = cache.stats()
+    assert (stats['charged_bytes'], stats['total_bytes'], stats['entries']) == (300, 1900, 2)
+    
+    # A larger charge from the same owner replaces the first and evicts the oldest entry
+    cache.charge(owner, 600)
+    stats = cache.stats()
+    assert (stats['charged_bytes'], stats['total_bytes'], stats['entries']) == (600, 1400, 1)
+    cache.lease("b", lambda: pytest.fail("evicted the newer entry")).release()
+
+def test_charge_is_dropped_when_the_owner_is_collected():
+    cache = IndexCache(max_bytes=2000)
+    owner = Owner()
+    cache.charge(owner, 500)
+    other = Owner()
+    cache.charge(other, 200)
+    
+    del owner
+    gc.collect()
+    stats = cache.stats()
+    assert (stats['charged_bytes'], stats['total_bytes']) == (200, 200)
+
+def test_random_operations_keep_the_accounting_exact():
+    rng = random.Random(7)
+    cache = IndexCache(max_bytes=5000)
+    sizes = {key: 8 * rng.randint(10, 200) for key in "abcdefghij"}
+    leases = []
+    owners = [Owner() for _ in range(3)]
+    charges = {}
+    
+    for _ in range(2000):
+        action = rng.random()
+        if action < 0.45:
+            key = rng.choice(list(sizes))
+            leases.append(cache.lease(key, lambda: make_index(sizes[key])))
+        elif action < 0.85 and leases:
+            leases.pop(rng.randrange(len(leases))).release()
+        else:
+            owner = rng.choice(owners)
+            charges[id(owner)] = 8 * rng.randint(0, 100)
+            cache.charge(owner, charges[id(owner)])
+        
+        # Brute force: the totals are the sizes of the cached entries plus the live charges
+        entries = dict(cache._entries)
+        held = {lease.key for lease in leases}
+        assert held <= set(entries)
+        for key, entry in entries.items():
+            assert entry.nbytes == sizes[key]
+            assert entry.refs == sum(1 for lease in leases if lease.key == key)
+        stats = cache.stats()
+        assert stats['charged_bytes'] == sum(charges.values())
+        assert stats['total_bytes'] == sum(entry.nbytes for entry in entries.values()) + sum(charges.values())
+        # Over budget only while nothing unreferenced is left to evict
+        if stats['total_bytes'] > cache.max_bytes:
+            assert all(entry.refs for entry in entries.values())
@@ -0,0 +1,100 @@
+import random
+
+from quiz import QuizStreamParser, parse_quiz_questions
+from quiz_pool import question_fingerprint
+
+def make_question_text(i, correct="B"):
+    return "\n".join([
+        f"QUESTION: What does step {i} of the algorithm do?",
+        *(f"{letter}) Option {letter.lower()} of step {i}" for letter in "ABCD"),
+        f"CORRECT: {correct}",
+        f"EXPLANATION: Step {i} is covered in section {i + 1}.",
+        "---"
+    ])
+
+WELL_FORMED = "Here are your questions:\n\n" + "\n".join(make_question_text(i, "ABCD"[i % 4]) for i in range(4)) + "\n"
+
+def parse_in_pieces(text, cuts, seen=()):
+    """Feed `text` split at the `cuts` offsets; return (questions, parser)"""
+    parser = QuizStreamParser(seen)
+    questions = []
+    bounds = [0, *sorted(cuts), len(text)]
+    for start, end in zip(bounds, bounds[1:]):
+        questions += parser.feed(text[start:end])
+    return questions + parser.close(), parser
+
+def test_whole_text_matches_the_batch_parser():
+    questions, parser = parse_in_pieces(WELL_FORMED, [])
+    assert questions == parse_quiz_questions(WELL_FORMED)
+    assert len(questions) == 4
+    assert parser.rejected == []
+
+def test_every_single_split_point_gives_the_same_questions():
+    expected = parse_quiz_questions(WELL_FORMED)
+    for cut in range(len(WELL_FORMED) + 1):
+        assert parse_in_pieces(WELL_FORMED, [cut])[0] == expected, f"split at {cut}"
+
+def test_random_deltas_and_character_by_character():
+    expected = parse_quiz_questions(WELL_FORMED)
+    rng = random.Random(3)
+    for _ in range(200):
+        cuts = rng.sample(range(1, len(WELL_FORMED)), rng.randint(1, 40))
+        assert parse_in_pieces(WELL_FORMED, cuts)[0] == expected
+    assert parse_in_pieces(WELL_FORMED, range(1, len(WELL_FORMED)))[0] == expected
+
+def test_a_question_completes_at_its_separator_line():
+    parser = QuizStreamParser()
+    first = make_question_text(0)
+    assert parser.feed(first[:-3]) == []
+    assert parser.feed("--") == []
+    # The '---' line is only known to be complete once its newline arrives
+    assert parser.feed("-") == []
+    assert [q['question'] for q in parser.feed("\nQUESTION: next")] == ["What does step 0 of the algorithm do?"]
+
+def test_windows_line_endings_and_bracketed_letters():
+    text = make_question_text(0, "[C]").replace("\n", "\r\n")
+    questions, parser = parse_in_pieces(text, [7, 50, 51])
+    assert [q['correct'] for q in questions] == ["C"]
+    assert questions[0]['options'][3] == "D) Option d of step 0"
+    assert parser.rejected == []
+
+def test_malformed_questions_are_rejected_with_a_reason():
+    missing_option = make_question_text(1).replace("C) Option c of step 1\n", "")
+    bad_letter = make_question_text(2, "E")
+    no_answer = make_question_text(3).replace("CORRECT: B\n", "")
+    no_text = make_question_text(4).replace("QUESTION: What does step 4 of the algorithm do?", "QUESTION:")
+    text = "\n".join([make_question_text(0), missing_option, bad_letter, no_answer, no_text, make_question_text(5)])
+    for cuts in ([], [len(text) // 3, len(text) // 2]):
+        questions, parser = parse_in_pieces(text, cuts)
+        assert [q['question'] for q in questions] == [
+            "What does step 0 of the algorithm do?", "What does step 5 of the algorithm do?"
+        ]
+        assert [reason for _, reason in parser.rejected] == [
+            "options must be A) to D), once each",
+            "correct answer must be a letter from A to D",
+            "correct answer must be a letter from A to D",
+            "missing question text",
+        ]
+
+def test_missing_separator_and_truncated_tail():
+    # No '---' between the questions, and the stream stops partway through the last one
+    text = make_question_text(0).replace("\n---", "") + "\n" + make_question_text(1)[:60]
+    questions, parser = parse_in_pieces(text, [25])
+    assert [q['question'] for q in questions] == ["What does step 0 of the algorithm do?"]
+    assert [reason for _, reason in parser.rejected] == ["options must be A) to D), once each"]
+
+def test_last_question_without_separator_completes_on_close():
+    text = make_question_text(0).replace("\n---", "")
+    parser = QuizStreamParser()
+    assert parser.feed(text) == []
+    assert len(parser.close()) == 1
+
+def test_seen_questions_are_rejected():
+    seen = {question_fingerprint({'question': "what does  STEP 2 of the algorithm do?"})}
+    questions, parser = parse_in_pieces(WELL_FORMED, [100], seen=seen)
+    assert [q['question'] for q in questions] == [
+        f"What does step {i} of the algorithm do?" for i in (0, 1, 3)
+    ]
+    assert [(q['question'], reason) for q, reason in parser.rejected] == [
+        ("What does step 2 of the algorithm do?", "already seen")
+    ]